@@ -0,0 +1,1039 @@
+'''
+Benchmarks for the compiler pipeline.
+
+cmd: python Benchmark.py <benchmark> [--funcs N] [--repeat R]
+     python Benchmark.py --help          (list every benchmark)
+
+Each benchmark builds a synthetic C-like program with make_program(),
+checks that the compared variants agree, and prints one line per variant.
+'''
+import argparse
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import contextlib
+import io
+import json
+import os
+import pickle
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from Lexer import Lexer, Token, TokenArray, TokenType, LEXER_ENGINES
+from notation_removal import notation_removal
+import ParserTree
+import Parser as parser_module
+from Parser import Parser, EXPR_ENGINES, PARSE_MODES
+from ParallelParser import ParallelParser
+from FlatAST import FlatAST, NODE_KINDS
+from ProgramCache import ProgramCache
+from TreeWalker import TreeWalker
+
+FUNC_TEMPLATE = '''\
+int g{n};
+int {name}{n}(int a, int b)
+{{
+	int i;
+	int j;
+	i=0;
+	if(a>(b+1))
+	{{
+		j=a+(b*3+1);
+	}}
+	else
+	{{
+		j={call};
+	}}
+	while(i<=100)
+	{{
+		i=j*2-g{n};
+	}}
+	return i;
+}}
+'''
+
+
+def make_program(n_funcs, name='f'):
+    '''
+    return the source of a program with `n_funcs` functions,
+    function f<k> calls f<k-1> so that every call is defined before use
+    '''
+    parts = []
+    for n in range(n_funcs):
+        call = f'{name}{n - 1}(a,b)' if n else 'a'
+        parts.append(FUNC_TEMPLATE.format(n=n, name=name, call=call))
+    return '\n'.join(parts)
+
+
+def best_of(repeat, func, *args):
+    '''return (best wall time in seconds, result of the last call)'''
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def lex_all(text, engine, positions='eager'):
+    lexer = Lexer(text, engine=engine, positions=positions)
+    token_list = []
+    token = lexer.get_next_token()
+    while token.type != TokenType.EOF:
+        token_list.append(token)
+        token = lexer.get_next_token()
+    return token_list
+
+
+def bench_lexer(args):
+    '''tokens/second of every Lexer engine'''
+    text = make_program(args.funcs)
+    print(f'source: {len(text)} chars')
+    reference = None
+    for engine in LEXER_ENGINES:
+        elapsed, token_list = best_of(args.repeat, lex_all, text, engine)
+        dump = [str(token) for token in token_list]
+        if reference is None:
+            reference = dump
+        elif dump != reference:
+            raise AssertionError(f'engine {engine!r} produced a different token stream')
+        print(f'{engine:>8}: {len(token_list)} tokens in {elapsed:.3f}s '
+              f'-> {len(token_list) / elapsed:,.0f} tokens/s')
+
+
+def traced(func, *args):
+    '''return (wall time in seconds, peak traced memory in bytes, result)'''
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak, result
+
+
+def write_program(n_funcs):
+    '''write make_program(n_funcs) into a temporary file and return its path'''
+    fd, path = tempfile.mkstemp(suffix='.txt')
+    with os.fdopen(fd, 'w') as f:
+        f.write(make_program(n_funcs))
+    return path
+
+
+def bench_stream(args):
+    '''peak memory of reading + lexing a file, whole string vs Lexer.from_file'''
+    path = write_program(args.funcs)
+
+    def whole():
+        lexer = Lexer(open(path, 'r').read(), engine='regex')
+        return len(lexer.get_all_tokens()[1])
+
+    def streamed():
+        return sum(1 for token in Lexer.from_file(path, engine='regex').iter_tokens())
+
+    try:
+        print(f'source: {os.path.getsize(path)} bytes')
+        for name, func in (('whole', whole), ('from_file', streamed)):
+            elapsed, peak, count = traced(func)
+            print(f'{name:>10}: {count} tokens in {elapsed:.3f}s, peak {peak / 1e6:.2f} MB')
+    finally:
+        os.remove(path)
+
+
+class DictToken:
+    '''layout of Token before it had __slots__, the baseline of bench_tokens'''
+    def __init__(self, type, value, lineno=None, column=None):
+        self.type = type
+        self.value = value
+        self.lineno = lineno
+        self.column = column
+
+
+def retained(build):
+    '''return (bytes still allocated after build() returns, its result)'''
+    tracemalloc.start()
+    result = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size, result
+
+
+def bench_tokens(args):
+    '''bytes per token kept alive by get_all_tokens, per storage layout'''
+    text = make_program(args.funcs)
+
+    def dict_tokens():
+        lexer = Lexer(text, engine='regex')
+        return [DictToken(t.type, t.value, t.lineno, t.column) for t in lexer.iter_tokens()]
+
+    def slotted_tokens():
+        return Lexer(text, engine='regex').get_all_tokens()[1]
+
+    def token_array():
+        return Lexer(text, engine='regex').get_all_tokens(compact=True)[1]
+
+    reference = None
+    for name, build in (('__dict__', dict_tokens), ('__slots__', slotted_tokens), ('TokenArray', token_array)):
+        size, token_list = retained(build)
+        dump = [(t.type, t.value, t.lineno, t.column) for t in token_list]
+        if reference is None:
+            reference = dump
+        elif dump != reference:
+            raise AssertionError(f'{name} does not round-trip the token stream')
+        print(f'{name:>10}: {len(token_list)} tokens, {size / 1e6:.2f} MB '
+              f'-> {size / len(token_list):.1f} bytes/token')
+
+
+def make_commented_program(n_funcs):
+    '''make_program() with line comments, and one '/*' per function that is never closed'''
+    text = make_program(n_funcs)
+    text = text.replace('\tint j;\n', '\tint j; // loop bound\n')
+    return text.replace('\ti=0;\n', '\ti=0; /* never closed\n')
+
+
+def bench_comments(args):
+    '''notation_removal() + Lexer vs comments skipped inside the Lexer, on unclosed comments'''
+    def removed_then_lexed(text):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return len(lex_all(notation_removal(text), 'regex'))
+
+    for n_funcs in (args.funcs // 4, args.funcs // 2, args.funcs):
+        text = make_commented_program(n_funcs)
+        print(f'source: {len(text)} chars, {n_funcs} unclosed comments')
+        variants = [('notation_removal', removed_then_lexed)] + [
+            (f'fused {engine}', lambda text, engine=engine: len(lex_all(text, engine)))
+            for engine in LEXER_ENGINES
+        ]
+        for name, func in variants:
+            elapsed, count = best_of(args.repeat, func, text)
+            print(f'{name:>18}: {count} tokens in {elapsed:.3f}s')
+
+
+def bench_positions(args):
+    '''regex engine with eager line/column bookkeeping vs lazy LineIndex lookups'''
+    text = make_program(args.funcs)
+    print(f'source: {len(text)} chars, {text.count(chr(10)) + 1} lines')
+    reference = None
+    for positions in ('eager', 'lazy'):
+        elapsed, token_list = best_of(args.repeat, lex_all, text, 'regex', positions)
+        start = time.perf_counter()
+        dump = [str(token) for token in token_list]
+        resolved = time.perf_counter() - start
+        if reference is None:
+            reference = dump
+        elif dump != reference:
+            raise AssertionError(f'positions={positions!r} produced different tokens')
+        print(f'{positions:>6}: lexed {len(token_list)} tokens in {elapsed:.3f}s, '
+              f'str() of every token {resolved:.3f}s')
+
+
+def bench_cache(args):
+    '''Lexer + Parser on many small sources: no cache, cold ProgramCache, warm ProgramCache'''
+    sources = [make_program(10, name=f'm{n}f') for n in range(max(1, args.funcs // 10))]
+
+    def uncached():
+        return [Parser(Lexer(text, engine='regex')).parseProcCall() for text in sources]
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        def cached():
+            cache = ProgramCache(cache_dir)
+            trees = [cache.parse(text).tree for text in sources]
+            return cache.stats()
+
+        print(f'{len(sources)} sources of 10 functions')
+        elapsed, trees = best_of(1, uncached)
+        print(f'{"no cache":>10}: {elapsed:.3f}s')
+        for name in ('cold', 'warm'):
+            elapsed, stats = best_of(1, cached)
+            print(f'{name:>10}: {elapsed:.3f}s {stats}')
+
+
+def make_expression(rand, n_ops):
+    '''a random expression over a, b, c, literals and calls, with n_ops binary operators'''
+    operators = ['+', '-', '*', '/', '<', '==']
+    parts = [rand.choice(['a', 'b', 'c', '7', '(a-1)'])]
+    for _ in range(n_ops):
+        parts.append(rand.choice(operators))
+        parts.append(rand.choice(['a', 'b', 'c', '7', '42', '(b*c+1)', 'f0(a,b)']))
+    return ''.join(parts)
+
+
+def make_expression_program(n_funcs, n_ops=40, n_stmts=5):
+    rand = random.Random(n_funcs)
+    parts = ['int f0(int a, int b)\n{\n\treturn a;\n}\n']
+    for n in range(1, n_funcs):
+        body = ''.join(f'\tc={make_expression(rand, n_ops)};\n' for _ in range(n_stmts))
+        parts.append(f'int e{n}(int a, int b)\n{{\n\tint c;\n{body}\treturn c;\n}}\n')
+    return ''.join(parts)
+
+
+def bench_expr(args):
+    '''Parser on expression-heavy input: recursive descent vs Pratt expressions'''
+    cases = [
+        ('mixed', make_expression_program(args.funcs // 10)),
+        ('chain', 'int f(int a)\n{\n\treturn ' + '+'.join(['a'] * args.funcs * 10) + ';\n}\n'),
+    ]
+    for name, text in cases:
+        # pre-lexed, so that only the parser is measured
+        recorded = lex_all(text, 'regex')
+        print(f'{name}: {len(recorded)} tokens')
+        reference = None
+        for engine in EXPR_ENGINES:
+            def parse():
+                parser = Parser(recorded, expr_engine=engine)
+                return parser.parseProcCall(), parser.getErrList()
+            elapsed, (tree, err_list) = best_of(args.repeat, parse)
+            if err_list:
+                raise AssertionError(f'{engine}: {err_list[0]}')
+            dump = dump_tree(tree)
+            if reference is None:
+                reference = dump
+            elif dump != reference:
+                raise AssertionError(f'engine {engine!r} built a different tree')
+            print(f'{engine:>10}: {elapsed:.3f}s -> {len(recorded) / elapsed:,.0f} tokens/s')
+
+
+def dump_tree(node):
+    '''
+    flat, non-recursive dump of an AST: class name and scalar fields of every node
+    in depth-first order, to compare trees that are too deep for ASTVisualizer
+    '''
+    dump = []
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(reversed(node))
+            continue
+        fields = []
+        children = []
+        for name, value in sorted(node.iter_fields(), key=lambda field: field[0]):
+            if isinstance(value, (list, ParserTree.AST)):
+                children.append(value)
+            elif isinstance(value, Token):
+                fields.append((name, str(value)))
+            elif not name.startswith('_'):
+                fields.append((name, value))
+        dump.append((type(node).__name__, fields))
+        stack.extend(reversed(children))
+    return dump
+
+
+def bench_buffer(args):
+    '''Parser fed by an interleaved Lexer vs pre-lexed token buffers'''
+    text = make_program(args.funcs)
+    elapsed, token_list = best_of(args.repeat, lex_all, text, 'regex')
+    print(f'{len(token_list)} tokens, bulk lexing {elapsed:.3f}s')
+    token_array = TokenArray(token_list)
+
+    def parse(make_source):
+        def run():
+            parser = Parser(make_source())
+            tree = parser.parseProcCall()
+            if parser.getErrList():
+                raise AssertionError(parser.getErrList()[0])
+            return tree
+        return run
+
+    variants = [
+        ('interleaved Lexer', lambda: Lexer(text, engine='regex')),
+        ('list', lambda: token_list),
+        ('TokenArray', lambda: token_array),
+        ('generator', lambda: iter(token_list)),
+    ]
+    for name, make_source in variants:
+        elapsed, _ = best_of(args.repeat, parse(make_source))
+        print(f'{name:>18}: {elapsed:.3f}s')
+
+
+def make_nested_program(depth, shape):
+    '''one function nesting `depth` if-blocks, while-blocks or parentheses'''
+    if shape == 'blocks':
+        opening = ''.join('if (a) {\n' if level % 2 else 'while (a) {\n' for level in range(depth))
+        body = opening + 'a = a - 1;\n' + '}\n' * depth
+    else:
+        body = 'a = ' + '(a+' * depth + '1' + ')' * depth + ';\n'
+    return f'int main(int a)\n{{\n{body}return a;\n}}\n'
+
+
+def bench_nesting(args):
+    '''Parser modes on deeply nested blocks and expressions: time and peak memory'''
+    depths = []
+    depth = 10
+    while depth <= args.depth:
+        depths.append(depth)
+        depth *= 10
+    for shape in ('blocks', 'parens'):
+        for depth in depths:
+            token_list = lex_all(make_nested_program(depth, shape), 'regex')
+            for mode in PARSE_MODES:
+                def parse():
+                    parser = Parser(token_list, mode=mode)
+                    parser.parseProcCall()
+                    if parser.getErrList():
+                        raise AssertionError(parser.getErrList()[0])
+                try:
+                    elapsed, peak, _ = traced(parse)
+                except RecursionError:
+                    tracemalloc.stop()
+                    print(f'{shape:>6} depth {depth:>7} {mode:>9}: RecursionError')
+                    continue
+                print(f'{shape:>6} depth {depth:>7} {mode:>9}: {elapsed:.3f}s, peak {peak / 2**20:.1f} MiB')
+
+
+def bench_parallel(args):
+    '''ParallelParser with 1, 2, 4 and 8 worker processes vs one sequential Parser'''
+    token_list = lex_all(make_program(args.funcs), 'regex')
+    token_array = TokenArray(token_list)
+    print(f'{args.funcs} functions, {len(token_list)} tokens, {os.cpu_count()} cpus')
+
+    def parse_sequential():
+        return Parser(token_list).parseProcCall()
+    elapsed, _ = best_of(args.repeat, parse_sequential)
+    print(f'sequential: {elapsed:.3f}s')
+
+    for workers in (1, 2, 4, 8):
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # start the workers, pool startup is not part of the parse
+            list(executor.map(abs, range(workers)))
+            def parse_parallel():
+                parser = ParallelParser(token_array, workers=workers, executor=executor)
+                tree = parser.parseProcCall()
+                if parser.fallback is not None:
+                    raise AssertionError(f'fell back to sequential parsing: {parser.fallback}')
+                return tree
+            elapsed, _ = best_of(args.repeat, parse_parallel)
+        print(f'{workers:>2} workers: {elapsed:.3f}s')
+
+
+def iter_nodes(tree):
+    '''every node of an object tree, without recursion'''
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(node)
+        elif isinstance(node, ParserTree.AST):
+            yield node
+            stack.extend(value for name, value in node.iter_fields())
+
+
+def count_nodes(tree):
+    return sum(1 for node in iter_nodes(tree))
+
+
+def unslotted_node_classes():
+    '''copies of the ParserTree node classes with a per-instance __dict__, the layout before __slots__'''
+    base = type('AST', (), {})
+    return {
+        cls.__name__: type(cls.__name__, (base,), {'__init__': vars(cls).get('__init__', object.__init__)})
+        for cls in ParserTree.AST.__subclasses__()
+    }
+
+
+def measure_ast_memory(n_funcs, layout):
+    '''
+    run in a fresh interpreter by bench_memory: parse make_program(n_funcs) with the
+    'slots' or 'dict' node layout, print peak RSS and the bytes held by the tree as JSON
+    '''
+    if layout == 'dict':
+        for name, cls in unslotted_node_classes().items():
+            setattr(parser_module, name, cls)
+    token_list = lex_all(make_program(n_funcs), 'regex')
+    tree = Parser(token_list).parseProcCall()
+    # ru_maxrss is in KiB on Linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    del tree
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    tree = Parser(token_list).parseProcCall()
+    tree_bytes = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    print(json.dumps({'peak_rss': peak_rss, 'tree_bytes': tree_bytes}))
+
+
+def bench_memory(args):
+    '''AST memory of slotted vs dict-based nodes: bytes per node and peak RSS'''
+    nodes_per_func = count_nodes(Parser(lex_all(make_program(11), 'regex')).parseProcCall()) / 11
+    n_funcs = max(1, round(args.nodes / nodes_per_func))
+    n_nodes = count_nodes(Parser(lex_all(make_program(n_funcs), 'regex')).parseProcCall())
+    print(f'{n_funcs} functions, {n_nodes} nodes')
+    for layout in ('dict', 'slots'):
+        # one interpreter per layout, peak RSS never goes down within a process
+        output = subprocess.run(
+            [sys.executable, '-c', f'import Benchmark; Benchmark.measure_ast_memory({n_funcs}, {layout!r})'],
+            check=True, capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout
+        result = json.loads(output)
+        print(
+            f'{layout:>6}: {result["tree_bytes"] / n_nodes:6.1f} bytes/node, '
+            f'peak RSS {result["peak_rss"] / 2**20:.1f} MiB'
+        )
+
+
+def bench_flat(args):
+    '''FlatAST vs object tree: bytes per node, conversion, pickling and a bulk pass'''
+    tree = Parser(lex_all(make_program(args.funcs), 'regex')).parseProcCall()
+    n_nodes = count_nodes(tree)
+    print(f'{args.funcs} functions, {n_nodes} nodes')
+
+    tracemalloc.start()
+    flat = FlatAST.from_tree(tree)
+    flat_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    # the columns only, tokens are copied into flat.token_array
+    column_bytes = sum(
+        column.itemsize * len(column)
+        for column in (flat.kinds, flat.tokens, flat.first_child, flat.next_sibling, flat.types, flat.nums)
+    )
+    print(f'FlatAST: {flat_bytes / n_nodes:.1f} bytes/node with its TokenArray, columns {column_bytes / n_nodes:.1f}')
+
+    elapsed, _ = best_of(args.repeat, FlatAST.from_tree, tree)
+    print(f'from_tree: {elapsed:.3f}s')
+    elapsed, _ = best_of(args.repeat, flat.to_tree)
+    print(f'  to_tree: {elapsed:.3f}s')
+
+    for name, value in (('objects', tree), ('FlatAST', flat)):
+        elapsed, data = best_of(args.repeat, pickle.dumps, value, pickle.HIGHEST_PROTOCOL)
+        load_elapsed, _ = best_of(args.repeat, pickle.loads, data)
+        print(f'{name:>8} pickle: {len(data) / n_nodes:.1f} bytes/node, dumps {elapsed:.3f}s, loads {load_elapsed:.3f}s')
+
+    # bulk pass: histogram of node kinds
+    def kinds_of_objects():
+        return Counter(type(node).__name__ for node in iter_nodes(tree))
+    def kinds_of_flat():
+        return Counter({NODE_KINDS[kind].__name__: count for kind, count in Counter(flat.kinds).items()})
+    reference = None
+    for name, func in (('objects', kinds_of_objects), ('FlatAST', kinds_of_flat)):
+        elapsed, kinds = best_of(args.repeat, func)
+        if reference is None:
+            reference = kinds
+        elif kinds != reference:
+            raise AssertionError(f'{name}: different node kinds')
+        print(f'{name:>8} kind histogram: {elapsed:.4f}s')
+
+
+RUNTIME_MAIN = '''\
+int h(int a, int b)
+{{
+	int c;
+	c=a*b+(a-b)/2;
+	return c+1;
+}}
+void main(void)
+{{
+	int a;
+	int b;
+	a=1;
+	b=2;
+{calls}}}
+'''
+
+
+def legacy_dispatch(visitor_class):
+    '''
+    a subclass of `visitor_class` that looks its handlers up with getattr on every
+    visit: the NodeVisitor.visit of before the dispatch table, or for a TreeWalker
+    the enter/after_child/leave hooks of every node walked
+    '''
+    if issubclass(visitor_class, TreeWalker):
+        def resolve(cls, node_class):
+            name = node_class.__name__
+            return (
+                getattr(cls, 'enter_' + name, None),
+                getattr(cls, 'after_child_' + name, None),
+                getattr(cls, 'leave_' + name, None),
+            )
+        return type(visitor_class.__name__, (visitor_class,), {'_resolve': classmethod(resolve)})
+
+    def visit(self, node):
+        method_name = 'visit_' + type(node).__name__
+        visitor = getattr(self, method_name, self.generic_visit)
+        return visitor(node)
+    return type(visitor_class.__name__, (visitor_class,), {'visit': visit})
+
+
+def bench_visitors(args):
+    '''
+    visits/second of the four AST passes, per-visit getattr vs dispatch table;
+    the TreeWalker passes count a visit per node walked, their dispatch is the hook table
+    '''
+    import IntermediateCodeGenerator
+    from ParserVisualizer import ASTVisualizer
+    from RunTimeAnalyzer import RuntimeAnalyzer
+    from SemanticAnalyzer import SemanticAnalyzer
+
+    text = make_program(args.funcs) + RUNTIME_MAIN.format(calls='\ta=h(a,b)-a;\n' * args.funcs)
+    tree = Parser(lex_all(text, 'regex')).parseProcCall()
+    # RuntimeAnalyzer needs the proc_symbol annotations
+    SemanticAnalyzer().visit(tree)
+
+    def run_ir(visitor):
+        visitor.visit(tree)
+
+    visitors = [
+        ('SemanticAnalyzer', SemanticAnalyzer, lambda cls: cls(), lambda visitor: visitor.visit(tree)),
+        ('IRGenerator', IntermediateCodeGenerator.IRGenerator, lambda cls: cls(None), run_ir),
+        ('RuntimeAnalyzer', RuntimeAnalyzer, lambda cls: cls(), lambda visitor: visitor.visit(tree)),
+        ('ASTVisualizer', ASTVisualizer, lambda cls: cls(None), lambda visitor: visitor.gendot(tree)),
+    ]
+    for name, visitor_class, make, run in visitors:
+        legacy = legacy_dispatch(visitor_class)
+        # count the visits once
+        visits = 0
+        if issubclass(visitor_class, TreeWalker):
+            # the hooks of the legacy subclass are resolved once per node
+            def counting_resolve(cls, node_class):
+                nonlocal visits
+                visits += 1
+                return legacy._resolve.__func__(cls, node_class)
+            counting = type(name, (legacy,), {'_resolve': classmethod(counting_resolve)})
+        else:
+            def counting_visit(self, node):
+                nonlocal visits
+                visits += 1
+                return visitor_class.visit(self, node)
+            counting = type(name, (visitor_class,), {'visit': counting_visit})
+        run(make(counting))
+
+        rates = []
+        for variant in (legacy, visitor_class):
+            elapsed, _ = best_of(args.repeat, lambda: run(make(variant)))
+            rates.append(visits / elapsed)
+        print(f'{name:>16}: {visits} visits, {rates[0]:,.0f} -> {rates[1]:,.0f} visits/s ({rates[1] / rates[0]:.2f}x)')
+
+
+def bench_walker(args):
+    '''TreeWalker passes, iterative walk() vs walk_recursive(), on wide and on deep trees'''
+    from ParserVisualizer import ASTVisualizer
+    from SemanticAnalyzer import SemanticAnalyzer
+
+    cases = [('wide', Parser(lex_all(make_program(args.funcs), 'regex')).parseProcCall())]
+    depth = 10
+    while depth <= args.depth:
+        for shape in ('blocks', 'parens'):
+            token_list = lex_all(make_nested_program(depth, shape), 'regex')
+            cases.append((f'{shape} {depth}', Parser(token_list, mode='stack').parseProcCall()))
+        depth *= 10
+
+    passes = [
+        ('SemanticAnalyzer', lambda: SemanticAnalyzer()),
+        ('ASTVisualizer', lambda: ASTVisualizer(None)),
+    ]
+    for case, tree in cases:
+        for name, make in passes:
+            line = f'{case:>13} {name:>16}:'
+            for driver in ('walk_recursive', 'walk'):
+                try:
+                    elapsed, _ = best_of(args.repeat, lambda: getattr(make(), driver)(tree))
+                except RecursionError:
+                    line += f' {driver} RecursionError'
+                    continue
+                line += f' {driver} {elapsed:.3f}s'
+            print(line)
+
+
+def bench_symbols(args):
+    '''SemanticAnalyzer with chained scopes vs the display symbol table, and lookups by nesting depth'''
+    from SemanticAnalyzer import SemanticAnalyzer, SYMBOL_TABLES, VarSymbol
+
+    text = make_program(args.funcs) + RUNTIME_MAIN.format(calls='\ta=h(a,b)-a;\n' * args.funcs)
+    tree = Parser(lex_all(text, 'regex')).parseProcCall()
+    for table in SYMBOL_TABLES:
+        elapsed, _ = best_of(args.repeat, lambda: SemanticAnalyzer(symbol_table=table).visit(tree))
+        print(f'{table:>8}: SemanticAnalyzer {elapsed:.3f}s')
+
+    # the language nests two scopes at most, deeper chains only show the asymptotics
+    names = [f'v{n}' for n in range(100)]
+    for depth in (2, 8, 32):
+        line = f'depth {depth:>2}:'
+        for table, scope_class in SYMBOL_TABLES.items():
+            scope = None
+            for level in range(1, depth + 1):
+                scope = scope_class(f's{level}', level, scope)
+                if level == 1:
+                    for name in names:
+                        scope.insert(VarSymbol(name, 'INT'))
+
+            def lookups():
+                lookup = scope.lookup
+                for _ in range(args.funcs):
+                    for name in names:
+                        lookup(name)
+            elapsed, _ = best_of(args.repeat, lookups)
+            line += f' {table} {args.funcs * len(names) / elapsed:,.0f} lookups/s'
+        print(line)
+
+
+VARIABLE_LOOP_PROGRAM = '''\
+int g;
+int step(int a, int b, int c)
+{{
+	int i;
+	int j;
+	int k;
+	i=a+b-c;
+	j=i-a+b;
+	k=j-i+c;
+	while(k>i)
+	{{
+		i=i+j-k;
+		j=j-i+a;
+		k=k-j+b;
+	}}
+	return i-j+k;
+}}
+void main(void)
+{{
+	int a;
+	int b;
+	int c;
+	a=1;
+	b=2;
+	c=3;
+{loop}}}
+'''
+
+
+def bench_slots(args):
+    '''variable-heavy loop program: runtime frames by name vs by slot index'''
+    from SemanticAnalyzer import SemanticAnalyzer
+    from RunTimeAnalyzer import RuntimeAnalyzer
+
+    body = '\twhile(a<b)\n\t{\n\t\ta=step(a,b,c)-a;\n\t\tb=b+c-a;\n\t\tc=a+b-c;\n\t}\n'
+    text = VARIABLE_LOOP_PROGRAM.format(loop=body * args.funcs)
+    token_list = lex_all(text, 'regex')
+
+    for slots in (False, True):
+        tree = Parser(token_list).parseProcCall()
+        elapsed, _ = best_of(args.repeat, lambda: SemanticAnalyzer(resolve_slots=slots).visit(tree))
+        line = f'{"slots" if slots else "names":>6}: semantic {elapsed:.3f}s'
+        elapsed, _ = best_of(args.repeat, lambda: RuntimeAnalyzer(slots=slots).visit(tree))
+        print(f'{line} runtime {elapsed:.3f}s')
+
+
+def bench_calls(args):
+    '''IRGenerator with function_tbl scanned per call vs indexed, and the cost of building a CallGraph'''
+    import IntermediateCodeGenerator
+    from CallGraph import CallGraph
+
+    class ScanningTable(IntermediateCodeGenerator.FunctionTable):
+        # the first entry of a name found by scanning the list, as before the index
+        def lookup(self, name):
+            for entry in self:
+                if entry.name == name:
+                    return entry
+            return None
+
+    text = make_program(args.funcs) + RUNTIME_MAIN.format(calls='\ta=h(a,b)-a;\n' * args.funcs)
+    tree = Parser(lex_all(text, 'regex')).parseProcCall()
+    for name, table_class in (('scanned', ScanningTable), ('indexed', IntermediateCodeGenerator.FunctionTable)):
+        def generate():
+            generator = IntermediateCodeGenerator.IRGenerator(None)
+            generator.function_tbl = table_class()
+            generator.genCodeSeq(tree)
+        elapsed, _ = best_of(args.repeat, generate)
+        print(f'{name:>8}: IRGenerator {elapsed:.3f}s')
+
+    elapsed, graph = best_of(args.repeat, CallGraph, tree)
+    print(f'CallGraph: {elapsed:.3f}s, {len(graph.functions)} functions, {len(graph.components)} components, '
+          f'{len(graph.recursive)} recursive, {len(graph.unreachable())} unreachable from main')
+
+
+def bench_irbatch(args):
+    '''IR of many programs: generate_ir() one after another vs generate_batch() with 1, 2, 4 and 8 threads'''
+    from IntermediateCodeGenerator import generate_ir, generate_batch
+
+    # programs of 10 functions, each named apart so that no two outputs are alike
+    sources = [make_program(10, name=f'p{n}_') for n in range(max(args.funcs // 10, 1))]
+
+    def listings(generators):
+        return [generator.listing() for generator in generators]
+
+    elapsed, serial = best_of(args.repeat, lambda: listings(generate_ir(source) for source in sources))
+    print(f'{len(sources)} programs')
+    print(f'{"serial":>10}: {elapsed:.3f}s')
+    for workers in (1, 2, 4, 8):
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            elapsed, concurrent = best_of(
+                args.repeat, lambda: listings(generate_batch(sources, executor=executor))
+            )
+        if concurrent != serial:
+            raise AssertionError(f'{workers} threads: IR differs from the serial IR')
+        print(f'{workers:>2} threads: {elapsed:.3f}s, same IR as serial')
+
+
+LOOP_TEMPLATE = '''\
+	if(a>(b+{n}))
+	{{
+		j=a+(b*3+1);
+	}}
+	else
+	{{
+		j=j-{n};
+	}}
+	while(i<=j)
+	{{
+		if(i>a) {{ i=i+2; }}
+		i=i+1;
+	}}
+'''
+
+
+def make_long_function(n_blocks):
+    '''one function with `n_blocks` if-statements each followed by a loop'''
+    body = ''.join(LOOP_TEMPLATE.format(n=n) for n in range(n_blocks))
+    return f'int main(int a, int b)\n{{\n\tint i;\n\tint j;\n\ti=0;\n\tj=0;\n{body}\treturn i;\n}}\n'
+
+
+def bench_cfg(args):
+    '''ControlFlowGraph construction on ever longer functions, time per instruction should stay flat'''
+    from IntermediateCodeGenerator import generate_ir
+    from ControlFlowGraph import ControlFlowGraph
+
+    for n_blocks in (50, 500, 2500):
+        generator = generate_ir(make_long_function(n_blocks))
+        if generator.exception is not None:
+            raise generator.exception
+        elapsed, cfg = best_of(args.repeat, ControlFlowGraph, generator.code)
+        if len(cfg.loops) != n_blocks:
+            raise AssertionError(f'{len(cfg.loops)} loops in a function with {n_blocks} loops')
+        n_instrs = len(generator.code)
+        print(f'{n_instrs:>7} instructions, {len(cfg.blocks):>6} blocks, {len(cfg.loops):>5} loops: '
+              f'{elapsed:.3f}s -> {elapsed / n_instrs * 1e6:.2f}us/instruction')
+
+
+def bench_ssa(args):
+    '''SSAForm construction and lowering back to three-address-code on ever longer functions'''
+    from IntermediateCodeGenerator import generate_ir
+    from ControlFlowGraph import ControlFlowGraph
+    from SSA import SSAForm
+
+    for n_blocks in (50, 500, 2500):
+        generator = generate_ir(make_long_function(n_blocks))
+        if generator.exception is not None:
+            raise generator.exception
+        cfg = ControlFlowGraph(generator.code)
+        built, ssa = best_of(args.repeat, SSAForm, cfg)
+        lowered, code = best_of(args.repeat, ssa.lower)
+        n_instrs = len(generator.code)
+        n_phis = sum(len(phis) for phis in ssa.phis)
+        if len(code) != n_instrs + n_phis + sum(len(phi.operands()) for phis in ssa.phis for phi in phis):
+            raise AssertionError('lowered code is not the SSA form plus one copy per phi and phi argument')
+        print(f'{n_instrs:>7} instructions, {n_phis:>5} phis: build {built:.3f}s '
+              f'({built / n_instrs * 1e6:.2f}us/instruction), lower {lowered:.3f}s')
+
+
+CONST_TEMPLATE = '''\
+int g{n};
+int {name}{n}(int a, int b)
+{{
+	int i;
+	int k;
+	int s;
+	i=0;
+	k=4*8;
+	s=k+2;
+	while(i<=100)
+	{{
+		if(k>16)
+		{{
+			i=i+s/(k-30);
+		}}
+		else
+		{{
+			i=i+a*(b+1);
+		}}
+		g{n}=i*(3+4);
+	}}
+	return i+k*2;
+}}
+'''
+
+
+def make_constant_program(n_funcs, name='f'):
+    '''`n_funcs` functions computing mostly on constants, and a main calling each of them'''
+    parts = [CONST_TEMPLATE.format(n=n, name=name) for n in range(n_funcs)]
+    calls = ''.join(f'\ta={name}{n}(a,b);\n' for n in range(n_funcs))
+    parts.append(f'void main(void)\n{{\n\tint a;\n\tint b;\n\ta=1;\n\tb=2;\n{calls}}}\n')
+    return '\n'.join(parts)
+
+
+def bench_constants(args):
+    '''IR size and IRInterpreter run time without and with ConstantFolder'''
+    from IntermediateCodeGenerator import generate_ir
+    from ConstantPropagation import ConstantFolder
+    from IRInterpreter import IRInterpreter, frame_layouts
+    from SSA import global_variables
+
+    text = make_constant_program(max(args.funcs // 10, 1))
+    tree = Parser(Lexer(text, 'regex')).parseProcCall()
+    layouts = frame_layouts(tree)
+    code = generate_ir(text).code
+
+    folder = ConstantFolder(global_variables(tree))
+    elapsed, optimized = best_of(args.repeat, lambda: ConstantFolder(folder.pinned).optimize(code))
+    optimized = folder.optimize(code)
+    print(f'optimize: {elapsed:.3f}s, {folder.folded} folded, {folder.propagated} propagated, '
+          f'{folder.jumps} jumps folded, {folder.eliminated} instructions eliminated')
+
+    def run(instructions):
+        interpreter = IRInterpreter(instructions, layouts)
+        interpreter.run('main')
+        return interpreter
+
+    reference = None
+    for label, instructions in (('original', code), ('folded', optimized)):
+        elapsed, interpreter = best_of(args.repeat, run, instructions)
+        if reference is None:
+            reference = interpreter.globals
+        elif interpreter.globals != reference:
+            raise AssertionError('the folded IR computes different globals')
+        print(f'{label:>8}: {len(instructions)} instructions, {interpreter.steps} run in {elapsed:.3f}s')
+
+
+def bench_incremental(args):
+    '''SemanticAnalyzer after a one-line edit: full re-analysis vs IncrementalAnalyzer'''
+    from SemanticAnalyzer import SemanticAnalyzer
+    from IncrementalAnalyzer import IncrementalAnalyzer
+
+    text = make_program(args.funcs)
+    # one more local in the middle function, every function after it moves down a line
+    middle = args.funcs // 2
+    header = f'int f{middle}(int a, int b)\n{{\n'
+    edited = text.replace(header, header + '\tint k;\n')
+
+    def full():
+        tree = Parser(Lexer(edited, 'regex')).parseProcCall()
+        start = time.perf_counter()
+        SemanticAnalyzer().visit(tree)
+        return time.perf_counter() - start
+
+    full_elapsed, analyze_elapsed = best_of(args.repeat, full)
+    print(f'{"full":>12}: {full_elapsed:.3f}s (analyze {analyze_elapsed:.3f}s)')
+
+    best = None
+    for _ in range(args.repeat):
+        analyzer = IncrementalAnalyzer()
+        analyzer.analyze(text)
+        start = time.perf_counter()
+        analyzer.analyze(edited)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best[0]:
+            best = (elapsed, dict(analyzer.timings))
+    elapsed, timings = best
+    print(f'{"incremental":>12}: {elapsed:.3f}s (' + ' '.join(f'{key} {value:.3f}s' for key, value in timings.items()) + ')')
+    print(f'{analyzer.skipped} functions skipped, {analyzer.analyzed} analyzed, '
+          f'speedup {full_elapsed / elapsed:.1f}x overall, {analyze_elapsed / timings["analyze"]:.1f}x analysis')
+
+
+def bench_semantic(args):
+    '''ParallelSemanticAnalyzer in this process and with 1, 2, 4 and 8 worker processes vs SemanticAnalyzer'''
+    from SemanticAnalyzer import SemanticAnalyzer
+    from ParallelSemanticAnalyzer import ParallelSemanticAnalyzer
+
+    text = make_program(args.funcs)
+    # every run annotates a copy of the same tree
+    data = pickle.dumps(Parser(lex_all(text, 'regex')).parseProcCall())
+    print(f'{args.funcs} functions, {os.cpu_count()} cpus')
+
+    def analyze(analyzer):
+        tree = pickle.loads(data)
+        start = time.perf_counter()
+        analyzer.visit(tree)
+        return time.perf_counter() - start
+
+    def best(make_analyzer):
+        return min(analyze(make_analyzer()) for _ in range(args.repeat))
+
+    print(f'{"sequential":>11}: {best(SemanticAnalyzer):.3f}s')
+    print(f'{"two-phase":>11}: {best(lambda: ParallelSemanticAnalyzer(workers=0)):.3f}s')
+    for workers in (1, 2, 4, 8):
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # start the workers, pool startup is not part of the analysis
+            list(executor.map(abs, range(workers)))
+            elapsed = best(lambda: ParallelSemanticAnalyzer(workers=workers, executor=executor))
+        print(f'{workers:>3} workers: {elapsed:.3f}s')
+
+
+def bench_pipeline(args):
+    '''semantic + dot + ir: parse per pass vs Pipeline with separate walks vs one fused walk'''
+    import IntermediateCodeGenerator
+    from ParserVisualizer import ASTVisualizer
+    from SemanticAnalyzer import SemanticAnalyzer
+    from Pipeline import Pipeline, FUSABLE
+
+    text = make_program(args.funcs)
+
+    def reparsed():
+        # what test.py does: every pass parses the program again
+        SemanticAnalyzer().visit(Parser(Lexer(text, 'regex')).parseProcCall())
+        ASTVisualizer(Parser(Lexer(text, 'regex'))).gendot()
+        IntermediateCodeGenerator.IRGenerator(Parser(Lexer(text, 'regex'))).genCodeSeq()
+
+    def piped(**options):
+        def run():
+            return Pipeline(FUSABLE, **options).run(text)
+        return run
+
+    elapsed, _ = best_of(args.repeat, reparsed)
+    print(f'{"parse per pass":>18}: {elapsed:.3f}s')
+    for name, options in (
+        ('separate walks', {'fused': False}),
+        ('fused walk', {}),
+        ('fused, profiled', {'profile': True}),
+    ):
+        elapsed, result = best_of(args.repeat, piped(**options))
+        timings = ' '.join(f'{key} {value:.3f}s' for key, value in result.timings.items())
+        print(f'{name:>18}: {elapsed:.3f}s ({timings})')
+
+
+BENCHMARKS = {
+    'buffer': bench_buffer,
+    'cache': bench_cache,
+    'calls': bench_calls,
+    'cfg': bench_cfg,
+    'comments': bench_comments,
+    'constants': bench_constants,
+    'expr': bench_expr,
+    'flat': bench_flat,
+    'incremental': bench_incremental,
+    'irbatch': bench_irbatch,
+    'lexer': bench_lexer,
+    'memory': bench_memory,
+    'nesting': bench_nesting,
+    'parallel': bench_parallel,
+    'pipeline': bench_pipeline,
+    'positions': bench_positions,
+    'semantic': bench_semantic,
+    'slots': bench_slots,
+    'ssa': bench_ssa,
+    'stream': bench_stream,
+    'symbols': bench_symbols,
+    'tokens': bench_tokens,
+    'visitors': bench_visitors,
+    'walker': bench_walker,
+}
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(description='Run a compiler benchmark.')
+    argparser.add_argument(
+        'benchmark',
+        choices=sorted(BENCHMARKS),
+        help=' | '.join(f'{name}: {func.__doc__}' for name, func in sorted(BENCHMARKS.items()))
+    )
+    argparser.add_argument('--funcs', type=int, default=2000, help='functions in the synthetic program')
+    argparser.add_argument('--nodes', type=int, default=1000000, help='AST nodes of the memory benchmark')
+    argparser.add_argument('--depth', type=int, default=10000, help='deepest nesting of the nesting benchmark')
+    argparser.add_argument('--repeat', type=int, default=3, help='runs per variant, best time is reported')
+    args = argparser.parse_args()
+    BENCHMARKS[args.benchmark](args)
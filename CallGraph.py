@@ -0,0 +1,135 @@
+from ParserTree import Function
+from TreeWalker import child_nodes
+
+### 扩展功能: 函数索引与调用图
+
+def strongly_connected(vertices, successors):
+    '''
+    Tarjan's algorithm with an explicit stack: the strongly connected components of
+    the graph, every component a list of vertices, in reverse topological order
+    (a component comes after every component it has an edge to)
+    '''
+    index = {}
+    low = {}
+    on_stack = set()
+    stack = []
+    components = []
+    for root in vertices:
+        if root in index:
+            continue
+        index[root] = low[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        # frames: (vertex, iterator over its successors)
+        work = [(root, iter(successors(root)))]
+        while work:
+            vertex, edges = work[-1]
+            for successor in edges:
+                if successor not in index:
+                    index[successor] = low[successor] = len(index)
+                    stack.append(successor)
+                    on_stack.add(successor)
+                    work.append((successor, iter(successors(successor))))
+                    break
+                if successor in on_stack:
+                    low[vertex] = min(low[vertex], index[successor])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[vertex])
+                if low[vertex] == index[vertex]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == vertex:
+                            break
+                    components.append(component)
+    return components
+
+
+class CallGraph:
+    '''
+    Function index and call graph of a Program, built once in a single walk:
+
+        definitions:    the Function nodes, in source order
+        functions:      name -> Function, a name defined twice maps to the later one,
+                        like the global scope after SemanticAnalyzer
+        calls:          name -> the ProcedureCall nodes in its body (bodies, if defined
+                        twice), in source order
+        callees:        name -> the distinct names it calls, in order of the first call
+        callers:        name -> the distinct functions calling it, in source order
+        undefined:      names called but never defined, in order of the first call
+        components:     the strongly connected components of the defined functions,
+                        callees before their callers (see strongly_connected)
+        recursive:      names of the functions that can call themselves
+
+    A call is resolved with functions.get(call.name), wherever the callee is defined.
+
+    graph = CallGraph(tree)
+    SemanticAnalyzer(call_graph=graph).visit(tree)
+    graph.unreachable(('main',))
+    '''
+    def __init__(self, tree):
+        self.definitions = [child for child in tree.children if isinstance(child, Function)]
+        self.functions = {}
+        self.calls = {}
+        for function in self.definitions:
+            self.functions[function.name] = function
+            self.calls.setdefault(function.name, []).extend(self.find_calls(function))
+
+        self.callees = {}
+        self.callers = {name: [] for name in self.calls}
+        self.undefined = []
+        for name, calls in self.calls.items():
+            callees = self.callees[name] = list(dict.fromkeys(call.name for call in calls))
+            for callee in callees:
+                callers = self.callers.get(callee)
+                if callers is None:
+                    if callee not in self.undefined:
+                        self.undefined.append(callee)
+                else:
+                    callers.append(name)
+
+        self.components = strongly_connected(
+            self.calls, lambda name: [callee for callee in self.callees[name] if callee in self.calls]
+        )
+        self.recursive = set()
+        for component in self.components:
+            if len(component) > 1 or component[0] in self.callees[component[0]]:
+                self.recursive.update(component)
+
+    @staticmethod
+    def find_calls(function):
+        '''the ProcedureCall nodes under `function`, in source order'''
+        calls = []
+        stack = [function.block]
+        while stack:
+            node = stack.pop()
+            if type(node).__name__ == 'ProcedureCall':
+                calls.append(node)
+            stack.extend(reversed(child_nodes(node)))
+        return calls
+
+    def bottom_up(self):
+        '''the defined function names, callees before callers where there is no cycle'''
+        return [name for component in self.components for name in component]
+
+    def reachable(self, roots):
+        '''the names of the defined functions that `roots` can call, roots included'''
+        seen = set()
+        stack = [root for root in roots if root in self.calls]
+        while stack:
+            name = stack.pop()
+            if name in seen:
+                continue
+            seen.add(name)
+            stack.extend(callee for callee in self.callees[name] if callee in self.calls)
+        return seen
+
+    def unreachable(self, roots=('main',)):
+        '''the defined function names that `roots` never call, in source order'''
+        seen = self.reachable(roots)
+        return [name for name in self.calls if name not in seen]
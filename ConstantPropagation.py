@@ -0,0 +1,273 @@
+from IR import Opcode, OperandKind, Instruction, JUMP_OPCODES, OPERATIONS, constant, evaluate
+from ControlFlowGraph import ControlFlowGraph, split_functions
+from SSA import SSAForm, Phi
+
+### 扩展功能: 常量折叠与常量传播
+
+# lattice of a value: UNDEFINED (no definition seen yet) > a constant > VARYING
+UNDEFINED = 'undefined'
+VARYING = 'varying'
+
+
+def is_constant(value):
+    return value is not UNDEFINED and value is not VARYING
+
+
+class ConstantPropagation:
+    '''
+    Sparse conditional constant propagation (Wegman and Zadeck) over an SSAForm.
+
+    Every SSA name starts UNDEFINED and is lowered to a constant or to VARYING;
+    blocks become executable from the entry along the edges their jumps can take, a
+    JZ/JNZ on a constant only along one. An instruction is visited again only when
+    a name it reads is lowered, so the pass is linear in the SSA form. Params,
+    globals, return registers and every other name without a definition in the
+    function are VARYING, so is a division by zero, which is left to fail at run time.
+
+        names:          the SSA names defined in the function
+        values:         SSA name -> its constant, or VARYING
+        executable:     indices of the blocks that can run
+
+    rewrite() applies the result to the function's own instructions.
+    '''
+    def __init__(self, ssa):
+        self.ssa = ssa
+        # pinned names and return registers are in ssa.definitions too
+        self.names = {
+            name for name, (index, definition) in ssa.definitions.items()
+            if isinstance(definition, Phi) or ssa.renamed(definition.result)
+        }
+        self.values = {}
+        self.executable = set()
+        self._edges = set()
+        self.propagate()
+
+    def value(self, operand):
+        '''the lattice value of a read of `operand`'''
+        if operand is None:
+            # the left operand of a unary minus
+            return 0
+        if operand.kind is OperandKind.CONSTANT:
+            return operand.value
+        if operand.value in self.names:
+            return self.values.get(operand.value, UNDEFINED)
+        return VARYING
+
+    def propagate(self):
+        ssa = self.ssa
+        blocks = ssa.cfg.blocks
+        flow_work = [(None, 0)]
+        ssa_work = []
+        while flow_work or ssa_work:
+            while flow_work:
+                edge = flow_work.pop()
+                if edge in self._edges:
+                    continue
+                self._edges.add(edge)
+                index = edge[1]
+                for phi in ssa.phis[index]:
+                    self.visit_phi(index, phi, ssa_work)
+                if index in self.executable:
+                    continue
+                self.executable.add(index)
+                for instr in ssa.blocks[index]:
+                    self.visit(index, instr, ssa_work, flow_work)
+                if ssa.blocks[index][-1].opcode not in JUMP_OPCODES:
+                    flow_work.extend((index, successor) for successor in blocks[index].successors)
+            if ssa_work:
+                name = ssa_work.pop()
+                for index, user in ssa.uses.get(name, ()):
+                    if index not in self.executable:
+                        continue
+                    if isinstance(user, Phi):
+                        self.visit_phi(index, user, ssa_work)
+                    else:
+                        self.visit(index, user, ssa_work, flow_work)
+
+    def lower(self, name, value, ssa_work):
+        old = self.values.get(name, UNDEFINED)
+        if old is VARYING or (type(old) is type(value) and old == value):
+            return
+        # values only go down the lattice
+        self.values[name] = value if old is UNDEFINED else VARYING
+        ssa_work.append(name)
+
+    def visit_phi(self, index, phi, ssa_work):
+        merged = UNDEFINED
+        for predecessor, arg in zip(self.ssa.cfg.blocks[index].predecessors, phi.args):
+            if arg is None or (predecessor, index) not in self._edges:
+                continue
+            value = self.value(arg)
+            if value is UNDEFINED:
+                continue
+            if merged is UNDEFINED:
+                merged = value
+            elif value is VARYING or type(merged) is not type(value) or merged != value:
+                merged = VARYING
+                break
+        if merged is not UNDEFINED:
+            self.lower(phi.result.value, merged, ssa_work)
+
+    def visit(self, index, instr, ssa_work, flow_work):
+        opcode = instr.opcode
+        if opcode in JUMP_OPCODES:
+            successors = self.ssa.cfg.blocks[index].successors
+            taken = self.branch(instr)
+            if taken is VARYING:
+                flow_work.extend((index, successor) for successor in successors)
+            elif taken is not UNDEFINED:
+                # a jump's label comes first, then the next block
+                flow_work.append((index, successors[0] if taken else successors[-1]))
+            return
+        result = instr.defines()
+        if result is not None and result.value in self.names:
+            value = self.compute(instr)
+            if value is not UNDEFINED:
+                self.lower(result.value, value, ssa_work)
+
+    def compute(self, instr):
+        '''the lattice value an ASSIGN or a binary operation writes'''
+        if instr.opcode is Opcode.ASSIGN:
+            return self.value(instr.right)
+        left = self.value(instr.left)
+        right = self.value(instr.right)
+        if left is VARYING or right is VARYING:
+            return VARYING
+        if left is UNDEFINED or right is UNDEFINED:
+            return UNDEFINED
+        try:
+            return evaluate(instr.opcode, left, right)
+        except ZeroDivisionError:
+            return VARYING
+
+    def branch(self, instr):
+        '''whether a jump goes to its label: True, False, VARYING, or UNDEFINED while its condition is'''
+        if instr.opcode is Opcode.J:
+            return True
+        condition = self.value(instr.left)
+        if not is_constant(condition):
+            return condition
+        return (condition == 0) == (instr.opcode is Opcode.JZ)
+
+    def rewrite(self):
+        '''
+        the function's own instructions, new copies with the constants applied:
+        a read of a constant becomes the constant, an operation on constants the
+        assignment of its value, a JZ/JNZ on a constant a J or nothing; the
+        assignments no longer read are dropped, as are the blocks that cannot run
+        and the jumps to the next instruction. Nothing is renamed and no copy is
+        added, the code never grows.
+
+        return (instructions, (folded, propagated, jumps)), the numbers of the
+        operations folded, the reads replaced and the jumps folded
+        '''
+        ssa = self.ssa
+        live = self.live()
+        folded = propagated = jumps = 0
+        instructions = []
+        for index, block in enumerate(ssa.cfg.blocks):
+            if index not in self.executable:
+                continue
+            for instr, renamed in zip(block.instructions, ssa.blocks[index]):
+                opcode = instr.opcode
+                if opcode is Opcode.JZ or opcode is Opcode.JNZ:
+                    taken = self.branch(renamed)
+                    if taken is True or taken is False:
+                        jumps += 1
+                        if taken:
+                            instructions.append(Instruction(Opcode.J, result=instr.result))
+                        continue
+                value = self.compute(renamed) if opcode in OPERATIONS else VARYING
+                if is_constant(value):
+                    folded += 1
+                if id(renamed) not in live:
+                    continue
+                if is_constant(value):
+                    instructions.append(Instruction(Opcode.ASSIGN, right=constant(value), result=instr.result))
+                    continue
+                left, right = instr.left, instr.right
+                if opcode is not Opcode.CALL:
+                    if left is not None and is_constant(self.value(renamed.left)) and left.kind is not OperandKind.CONSTANT:
+                        left = constant(self.value(renamed.left))
+                        propagated += 1
+                    if right is not None and is_constant(self.value(renamed.right)) and right.kind is not OperandKind.CONSTANT:
+                        right = constant(self.value(renamed.right))
+                        propagated += 1
+                instructions.append(Instruction(opcode, left, right, instr.result))
+        # a J to the label right after it, left by a folded jump or a dropped block
+        instructions = [
+            instr for instr, after in zip(instructions, instructions[1:] + [None])
+            if not (instr.opcode is Opcode.J and after is not None
+                    and after.opcode is Opcode.LABEL and after.result == instr.result)
+        ]
+        return instructions, (folded, propagated, jumps)
+
+    def live(self):
+        '''
+        ids of the SSA instructions and Phis still needed once the constants are
+        applied: the ones without an SSA result, a division that can still fail, and
+        the definitions they read, unless the read is of a constant. Every argument
+        of a live Phi is needed, the original code merges through the name.
+        '''
+        ssa = self.ssa
+        live = set()
+        work = []
+
+        def need(definition):
+            if id(definition) not in live:
+                live.add(id(definition))
+                work.append(definition)
+
+        for index in self.executable:
+            for instr in ssa.blocks[index]:
+                result = instr.defines()
+                if (result is None or result.value not in self.names
+                        or (instr.opcode is Opcode.DIV and not is_constant(self.compute(instr)))):
+                    need(instr)
+        while work:
+            user = work.pop()
+            if isinstance(user, Phi):
+                reads = user.operands()
+            elif user.opcode is Opcode.CALL:
+                continue
+            else:
+                reads = [operand for operand in user.operands() if not is_constant(self.value(operand))]
+            for operand in reads:
+                if operand.value in self.names:
+                    need(ssa.definitions[operand.value][1])
+        return live
+
+
+class ConstantFolder:
+    '''
+    Constant folding and propagation of the IR of a program, function by function,
+    through ConstantPropagation. `pinned` are the names a call can change, i.e. the
+    global variables, see SSAForm.
+
+        folded:         operations on constants computed here, dropped or replaced by their value
+        propagated:     reads of a constant replaced by the constant
+        jumps:          JZ/JNZ on a constant replaced by a J or dropped
+        eliminated:     instructions less than before
+
+    folder = ConstantFolder(pinned=global_variables(tree))
+    code = folder.optimize(generator.code)
+    print(folder.eliminated)
+    '''
+    def __init__(self, pinned=()):
+        self.pinned = pinned
+        self.folded = self.propagated = self.jumps = self.eliminated = 0
+
+    def optimize(self, code):
+        '''the optimized copy of `code`, new Instructions indexed from 0'''
+        optimized = []
+        for instructions in split_functions(code):
+            propagation = ConstantPropagation(SSAForm(ControlFlowGraph(instructions), self.pinned))
+            rewritten, (folded, propagated, jumps) = propagation.rewrite()
+            self.folded += folded
+            self.propagated += propagated
+            self.jumps += jumps
+            for instr in rewritten:
+                instr.index = len(optimized)
+                optimized.append(instr)
+        self.eliminated += len(code) - len(optimized)
+        return optimized
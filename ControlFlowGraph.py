@@ -0,0 +1,269 @@
+import textwrap
+
+from IR import Opcode, JUMP_OPCODES, UNNUMBERED_OPCODES, numbered, format_instruction
+
+### 扩展功能: 基本块与控制流图
+
+class BasicBlock:
+    '''
+    a maximal run of instructions entered only at the first and left only after the last
+        index:          position in ControlFlowGraph.blocks
+        label:          name of its LABEL or FUNCTION instruction, None if it has none
+        instructions:   the IR.Instructions, in order
+        successors:     indices of the blocks control can go to next
+        predecessors:   indices of the blocks control can come from
+    '''
+    __slots__ = ('index', 'label', 'instructions', 'successors', 'predecessors')
+
+    def __init__(self, index, instructions):
+        self.index = index
+        first = instructions[0]
+        self.label = first.result.value if first.opcode in (Opcode.LABEL, Opcode.FUNCTION) else None
+        self.instructions = instructions
+        self.successors = []
+        self.predecessors = []
+
+    def __repr__(self):
+        return f'<BasicBlock {self.index} {self.label} ({len(self.instructions)} instructions)>'
+
+
+class NaturalLoop:
+    '''
+    the natural loop of a header, merged over all its back edges
+        header:         index of the block every iteration enters by
+        back_edges:     indices of the blocks jumping back to the header
+        body:           indices of the blocks in the loop, header included
+    '''
+    __slots__ = ('header', 'back_edges', 'body')
+
+    def __init__(self, header):
+        self.header = header
+        self.back_edges = []
+        self.body = {header}
+
+    def __repr__(self):
+        return f'<NaturalLoop header {self.header}, {len(self.body)} blocks>'
+
+
+class ControlFlowGraph:
+    '''
+    Basic blocks of one function's IR, their edges, dominators and natural loops.
+
+    A block starts at the FUNCTION instruction, at every LABEL and after every jump.
+    A J goes to its label's block, a JZ/JNZ to its label's block or on to the next
+    block, any other block falls through to the next one; the last block leaves the
+    function, a jump to a label outside of it raises ValueError (code that stopped
+    half-way, see generate_ir). Dominators are computed with the iterative algorithm of Cooper, Harvey
+    and Kennedy over the reverse postorder, blocks unreachable from the entry have no
+    immediate dominator. Everything is linear in the instructions but the dominator
+    iteration, which needs a few passes for reducible graphs like those of IRGenerator.
+
+    cfg = ControlFlowGraph(instructions)
+    cfg.dominates(cfg.loops[0].header, block_index)
+    print(cfg.gendot())
+    '''
+    def __init__(self, instructions, first_lineno=100):
+        '''
+        instructions:   the IR.Instructions of one function, FUNCTION first
+        first_lineno:   line number of its first three-address-code in the listing, for gendot()
+        '''
+        self.first_lineno = first_lineno
+        self.name = instructions[0].result.value if instructions[0].opcode is Opcode.FUNCTION else None
+        self.blocks = self.split(instructions)
+        self.link()
+        self.order = self.reverse_postorder()
+        self.idom = self.dominators()
+        self.number_dominator_tree()
+        self.loops = self.natural_loops()
+
+    @staticmethod
+    def split(instructions):
+        '''the basic blocks of `instructions`, see ControlFlowGraph'''
+        blocks = []
+        start = 0
+        for position, instr in enumerate(instructions):
+            opcode = instr.opcode
+            if opcode is Opcode.LABEL and position > start:
+                blocks.append(BasicBlock(len(blocks), instructions[start:position]))
+                start = position
+            elif opcode in JUMP_OPCODES:
+                blocks.append(BasicBlock(len(blocks), instructions[start:position + 1]))
+                start = position + 1
+        if start < len(instructions):
+            blocks.append(BasicBlock(len(blocks), instructions[start:]))
+        return blocks
+
+    def link(self):
+        blocks = self.blocks
+        labels = {block.label: block.index for block in blocks if block.label is not None}
+        for block in blocks:
+            last = block.instructions[-1]
+            if last.opcode in JUMP_OPCODES:
+                target = labels.get(last.result.value)
+                if target is None:
+                    raise ValueError(f'{last.opcode.value} to {last.result} outside of the function')
+                block.successors.append(target)
+            if last.opcode is not Opcode.J and block.index + 1 < len(blocks):
+                if block.index + 1 not in block.successors:
+                    block.successors.append(block.index + 1)
+            for successor in block.successors:
+                blocks[successor].predecessors.append(block.index)
+
+    def reverse_postorder(self):
+        '''indices of the blocks reachable from the entry, in reverse postorder'''
+        blocks = self.blocks
+        postorder = []
+        visited = {0}
+        stack = [(0, iter(blocks[0].successors))]
+        while stack:
+            index, successors = stack[-1]
+            for successor in successors:
+                if successor not in visited:
+                    visited.add(successor)
+                    stack.append((successor, iter(blocks[successor].successors)))
+                    break
+            else:
+                stack.pop()
+                postorder.append(index)
+        postorder.reverse()
+        return postorder
+
+    def dominators(self):
+        '''immediate dominator of every block index, the entry's is itself, None if unreachable'''
+        blocks = self.blocks
+        order = self.order
+        # position in the reverse postorder, the entry is 0
+        rank = [None] * len(blocks)
+        for position, index in enumerate(order):
+            rank[index] = position
+        idom = [None] * len(blocks)
+        idom[0] = 0
+
+        def intersect(finger1, finger2):
+            while finger1 != finger2:
+                while rank[finger1] > rank[finger2]:
+                    finger1 = idom[finger1]
+                while rank[finger2] > rank[finger1]:
+                    finger2 = idom[finger2]
+            return finger1
+
+        changed = True
+        while changed:
+            changed = False
+            for index in order[1:]:
+                new_idom = None
+                for predecessor in blocks[index].predecessors:
+                    if idom[predecessor] is None:
+                        continue
+                    new_idom = predecessor if new_idom is None else intersect(predecessor, new_idom)
+                if idom[index] != new_idom:
+                    idom[index] = new_idom
+                    changed = True
+        return idom
+
+    def number_dominator_tree(self):
+        # pre- and postorder numbers of a walk of the dominator tree,
+        # a dominates b iff a's interval contains b's
+        children = [[] for _ in self.blocks]
+        for index in self.order[1:]:
+            children[self.idom[index]].append(index)
+        self._pre = [None] * len(self.blocks)
+        self._post = [None] * len(self.blocks)
+        counter = 0
+        stack = [(0, iter(children[0]))]
+        self._pre[0] = counter
+        while stack:
+            index, kids = stack[-1]
+            kid = next(kids, None)
+            counter += 1
+            if kid is None:
+                stack.pop()
+                self._post[index] = counter
+            else:
+                self._pre[kid] = counter
+                stack.append((kid, iter(children[kid])))
+        self.dominator_children = children
+
+    def dominates(self, a, b):
+        '''whether block `a` dominates block `b`, every block dominates itself'''
+        if self._pre[a] is None or self._pre[b] is None:
+            return False
+        return self._pre[a] <= self._pre[b] and self._post[b] <= self._post[a]
+
+    def dominators_of(self, index):
+        '''indices of the blocks dominating block `index`, from itself up to the entry'''
+        if self.idom[index] is None:
+            return []
+        chain = [index]
+        while index != 0:
+            index = self.idom[index]
+            chain.append(index)
+        return chain
+
+    def natural_loops(self):
+        '''the NaturalLoops, by header in reverse postorder, an outer loop before its inner loops'''
+        blocks = self.blocks
+        loops = {}
+        for index in self.order:
+            for successor in blocks[index].successors:
+                if not self.dominates(successor, index):
+                    continue
+                # a back edge index -> successor
+                loop = loops.get(successor)
+                if loop is None:
+                    loop = loops[successor] = NaturalLoop(successor)
+                loop.back_edges.append(index)
+                stack = [index]
+                while stack:
+                    member = stack.pop()
+                    if member not in loop.body:
+                        loop.body.add(member)
+                        stack.extend(blocks[member].predecessors)
+        return [loops[index] for index in self.order if index in loops]
+
+    def gendot(self):
+        '''DOT graph of the blocks in the style of ASTVisualizer, back edges dashed'''
+        instructions = [instr for block in self.blocks for instr in block.instructions]
+        lines = {id(instr): lineno for lineno, instr in numbered(instructions, self.first_lineno)}
+        dot = [textwrap.dedent("""\
+        digraph cfg {
+          node [shape=box, fontsize=12, fontname="Courier", height=.1];
+          ranksep=.3;
+          edge [arrowsize=.5]
+
+        """)]
+        for block in self.blocks:
+            label = ''.join(
+                format_instruction(instr, lines[id(instr)]) + '\\l' for instr in block.instructions
+            )
+            dot.append('  node{} [label="{}"]\n'.format(block.index, label))
+        for block in self.blocks:
+            for successor in block.successors:
+                style = ' [style=dashed]' if self.dominates(successor, block.index) else ''
+                dot.append('  node{} -> node{}{}\n'.format(block.index, successor, style))
+        dot.append('}')
+        return ''.join(dot)
+
+
+def split_functions(code):
+    '''the instructions of IRGenerator.code per function, a list per FUNCTION instruction, in order'''
+    functions = []
+    for instr in code:
+        if instr.opcode is Opcode.FUNCTION:
+            functions.append([])
+        if functions:
+            functions[-1].append(instr)
+    return functions
+
+
+def build_cfgs(code, first_lineno=100):
+    '''
+    a ControlFlowGraph per function of IRGenerator.code, name -> ControlFlowGraph,
+    numbered like format_code(); a name defined twice maps to the later function
+    '''
+    cfgs = {}
+    lineno = first_lineno
+    for instructions in split_functions(code):
+        cfgs[instructions[0].result.value] = ControlFlowGraph(instructions, lineno)
+        lineno += sum(instr.opcode not in UNNUMBERED_OPCODES for instr in instructions)
+    return cfgs
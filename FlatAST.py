@@ -0,0 +1,309 @@
+from array import array
+
+from Lexer import Token, TokenType, TokenArray
+import ParserTree
+
+### 扩展功能: 扁平化(数组存储)的抽象语法树
+
+# node class -> (fields holding one node, field holding a list of nodes or None),
+# children are stored in this order: the single fields first, then the list
+NODE_LAYOUT = {
+    ParserTree.Program:         ((), 'children'),
+    ParserTree.Function:        (('type', 'block'), 'formal_params'),
+    ParserTree.Block:           (('declarations', 'compound_statement'), None),
+    ParserTree.Declaration:     ((), 'children'),
+    ParserTree.Compound:        ((), 'children'),
+    ParserTree.Param:           (('var', 'type'), None),
+    ParserTree.VarDecl:         (('var', 'type'), None),
+    ParserTree.Assign:          (('left', 'right'), None),
+    ParserTree.BinOp:           (('left', 'right'), None),
+    ParserTree.Return:          (('expr',), None),
+    ParserTree.While:           (('expr', 'block'), None),
+    ParserTree.If:              (('expr', 'if_block', 'else_block'), None),
+    ParserTree.ProcedureCall:   ((), 'actual_params'),
+    ParserTree.Var:             ((), None),
+    ParserTree.Num:             ((), None),
+    ParserTree.Type:            ((), None),
+    ParserTree.NoOp:            ((), None),
+}
+
+# kind code -> node class
+NODE_KINDS = list(NODE_LAYOUT)
+_KIND_CODES = {cls: code for code, cls in enumerate(NODE_KINDS)}
+
+NO_NODE = -1
+
+
+class FlatAST:
+    '''
+    An AST stored as parallel array.array columns, a node is an integer index:
+        kinds:          'B' kind code, see NODE_KINDS
+        tokens:         'i' index into `token_array`, the node's token, -1 for none
+        first_child:    'i' index of the first child node, -1 for none
+        next_sibling:   'i' index of the next child of the same parent, -1 for none
+        types:          'i' the `type` annotation, index into `type_table`, -1 for None
+        nums:           'i' ASTVisualizer's `_num` annotation, -1 if not set
+    `proc_symbols` maps the index of a ProcedureCall or Function to its `proc_symbol`,
+    `var_slots` the index of a resolved Var to its `slot`.
+
+    Nodes are stored in pre-order, the root is node 0. A Function keeps its name as
+    a token without position. view(index) wraps a node in a view class named like
+    the ParserTree class, so NodeVisitor subclasses walk a FlatAST unchanged:
+
+    flat = FlatAST.from_tree(parser.parseProcCall())
+    SemanticAnalyzer().visit(flat.root())
+    content = ASTVisualizer(None).gendot(flat.root())
+    tree = flat.to_tree()
+    '''
+    def __init__(self):
+        self.kinds = array('B')
+        self.tokens = array('i')
+        self.first_child = array('i')
+        self.next_sibling = array('i')
+        self.types = array('i')
+        self.nums = array('i')
+        self.token_array = TokenArray()
+        self.type_table = []
+        self.proc_symbols = {}
+        self.var_slots = {}
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def root(self):
+        return self.view(0)
+
+    def view(self, index):
+        return VIEW_CLASSES[self.kinds[index]](self, index)
+
+    def children(self, index):
+        '''indices of the children of node `index`, in order'''
+        child = self.first_child[index]
+        next_sibling = self.next_sibling
+        while child != NO_NODE:
+            yield child
+            child = next_sibling[child]
+
+    def child(self, index, position):
+        child = self.first_child[index]
+        for _ in range(position):
+            child = self.next_sibling[child]
+        return child
+
+    def type_code(self, value):
+        if value is None:
+            return -1
+        try:
+            return self.type_table.index(value)
+        except ValueError:
+            self.type_table.append(value)
+            return len(self.type_table) - 1
+
+    def append(self, kind, token_index, type_code=-1):
+        self.kinds.append(kind)
+        self.tokens.append(token_index)
+        self.first_child.append(NO_NODE)
+        self.next_sibling.append(NO_NODE)
+        self.types.append(type_code)
+        self.nums.append(-1)
+        return len(self.kinds) - 1
+
+    @classmethod
+    def from_tree(cls, tree):
+        '''encode an object tree, its annotations included'''
+        flat = cls()
+        token_index = {}
+        # last child appended so far, per parent
+        last_child = {}
+        stack = [(tree, NO_NODE)]
+        while stack:
+            node, parent = stack.pop()
+            node_class = type(node)
+            if node_class not in _KIND_CODES:
+                raise TypeError(f'{node_class.__name__} has no flat encoding')
+
+            token = getattr(node, 'token', None)
+            if node_class is ParserTree.Function:
+                index = len(flat.token_array)
+                flat.token_array.append(Token(TokenType.ID, node.name))
+            elif token is None:
+                index = -1
+            else:
+                # BinOp, Assign, ... share one token between `token` and `op`
+                index = token_index.get(token)
+                if index is None:
+                    index = token_index[token] = len(flat.token_array)
+                    flat.token_array.append(token)
+
+            fields, list_field = NODE_LAYOUT[node_class]
+            type_code = -1
+            if 'type' not in fields:
+                type_code = flat.type_code(getattr(node, 'type', None))
+            position = flat.append(_KIND_CODES[node_class], index, type_code)
+            num = getattr(node, '_num', None)
+            if num is not None:
+                flat.nums[position] = num
+            proc_symbol = getattr(node, 'proc_symbol', None)
+            if proc_symbol is not None:
+                flat.proc_symbols[position] = proc_symbol
+            slot = getattr(node, 'slot', None)
+            if slot is not None:
+                flat.var_slots[position] = slot
+
+            if parent != NO_NODE:
+                previous = last_child.get(parent)
+                if previous is None:
+                    flat.first_child[parent] = position
+                else:
+                    flat.next_sibling[previous] = position
+                last_child[parent] = position
+
+            children = [getattr(node, field) for field in fields]
+            if list_field is not None:
+                children.extend(getattr(node, list_field))
+            for child in reversed(children):
+                stack.append((child, position))
+        return flat
+
+    def to_tree(self):
+        '''decode into ParserTree objects, annotations included'''
+        nodes = [None] * len(self)
+        # children are appended after their parent, so build bottom-up
+        for index in range(len(self) - 1, -1, -1):
+            node_class = NODE_KINDS[self.kinds[index]]
+            node = node_class.__new__(node_class)
+            fields, list_field = NODE_LAYOUT[node_class]
+            children = [nodes[child] for child in self.children(index)]
+            for field, child in zip(fields, children):
+                setattr(node, field, child)
+            if list_field is not None:
+                setattr(node, list_field, children[len(fields):])
+
+            token_index = self.tokens[index]
+            if token_index != -1:
+                token = self.token_array[token_index]
+                if node_class is ParserTree.Function:
+                    node.name = token.value
+                else:
+                    node.token = token
+                    if node_class in (ParserTree.BinOp, ParserTree.Assign, ParserTree.Return,
+                                      ParserTree.While, ParserTree.If):
+                        node.op = token
+                    elif node_class is ParserTree.ProcedureCall:
+                        node.name = token.value
+                        node.value = None
+                    else:
+                        node.value = token.value
+            if 'type' in node_class.__slots__ and 'type' not in fields:
+                type_code = self.types[index]
+                node.type = None if type_code == -1 else self.type_table[type_code]
+            if node_class in (ParserTree.ProcedureCall, ParserTree.Function):
+                node.proc_symbol = self.proc_symbols.get(index)
+            if node_class is ParserTree.Var:
+                node.slot = self.var_slots.get(index)
+            if self.nums[index] != -1:
+                node._num = self.nums[index]
+            nodes[index] = node
+        return nodes[0]
+
+
+class NodeView:
+    '''a node of a FlatAST, attribute access reads and writes its columns'''
+    __slots__ = ('flat', 'index')
+
+    def __init__(self, flat, index):
+        self.flat = flat
+        self.index = index
+
+    def __eq__(self, other):
+        return isinstance(other, NodeView) and other.flat is self.flat and other.index == self.index
+
+    def __hash__(self):
+        return hash((id(self.flat), self.index))
+
+    @property
+    def token(self):
+        token_index = self.flat.tokens[self.index]
+        if token_index == -1:
+            raise AttributeError('token')
+        return self.flat.token_array[token_index]
+
+    op = token
+
+    @property
+    def value(self):
+        return self.token.value
+
+    @property
+    def _num(self):
+        num = self.flat.nums[self.index]
+        if num == -1:
+            raise AttributeError('_num')
+        return num
+
+    @_num.setter
+    def _num(self, num):
+        self.flat.nums[self.index] = num
+
+    def __repr__(self):
+        return f'<{type(self).__name__} view of node {self.index}>'
+
+
+def _type_annotation():
+    def get(self):
+        type_code = self.flat.types[self.index]
+        return None if type_code == -1 else self.flat.type_table[type_code]
+
+    def set(self, value):
+        self.flat.types[self.index] = self.flat.type_code(value)
+
+    return property(get, set)
+
+
+def _child_field(position):
+    return property(lambda self: self.flat.view(self.flat.child(self.index, position)))
+
+
+def _list_field(skip):
+    def get(self):
+        children = self.flat.children(self.index)
+        for _ in range(skip):
+            next(children)
+        return [self.flat.view(child) for child in children]
+    return property(get)
+
+
+def _annotation(column):
+    '''an annotation kept in the FlatAST dict `column`, None if not set'''
+    def get(self):
+        return getattr(self.flat, column).get(self.index)
+
+    def set(self, value):
+        getattr(self.flat, column)[self.index] = value
+
+    return property(get, set)
+
+
+def _view_class(node_class):
+    fields, list_field = NODE_LAYOUT[node_class]
+    namespace = {'__slots__': ()}
+    for position, field in enumerate(fields):
+        namespace[field] = _child_field(position)
+    if list_field is not None:
+        namespace[list_field] = _list_field(len(fields))
+    if 'type' in node_class.__slots__ and 'type' not in fields:
+        namespace['type'] = _type_annotation()
+    if node_class is ParserTree.Function:
+        namespace['name'] = NodeView.value
+        namespace['proc_symbol'] = _annotation('proc_symbols')
+    if node_class is ParserTree.ProcedureCall:
+        namespace['name'] = NodeView.value
+        namespace['value'] = None
+        namespace['proc_symbol'] = _annotation('proc_symbols')
+    if node_class is ParserTree.Var:
+        namespace['slot'] = _annotation('var_slots')
+    return type(node_class.__name__, (NodeView,), namespace)
+
+
+# kind code -> view class, named like the ParserTree class for NodeVisitor.visit
+VIEW_CLASSES = [_view_class(node_class) for node_class in NODE_KINDS]
@@ -0,0 +1,198 @@
+from enum import Enum
+
+### 扩展功能: 结构化的中间代码
+
+class Opcode(Enum):
+    # value: the op column of the three-address-code listing
+    ASSIGN      = '='
+    ADD         = '+'
+    SUB         = '-'
+    MUL         = '*'
+    DIV         = '/'
+    LT          = '<'
+    LTE         = '<='
+    GT          = '>'
+    GTE         = '>='
+    EQ          = '=='
+    NE          = '!='
+    JZ          = 'jz'
+    JNZ         = 'jnz'
+    J           = 'j'
+    # listed as text lines, not as three-address-code
+    FUNCTION    = 'function'
+    LABEL       = 'label'
+    PARAM       = 'param'
+    CALL        = 'call'
+
+
+# BinOp operators, op.value -> Opcode
+BINARY_OPCODES = {opcode.value: opcode for opcode in (
+    Opcode.ADD, Opcode.SUB, Opcode.MUL, Opcode.DIV,
+    Opcode.LT, Opcode.LTE, Opcode.GT, Opcode.GTE, Opcode.EQ, Opcode.NE,
+)}
+JUMP_OPCODES = (Opcode.JZ, Opcode.JNZ, Opcode.J)
+
+
+def divide(left, right):
+    # C: integer division truncates towards zero
+    if isinstance(left, int) and isinstance(right, int):
+        quotient = abs(left) // abs(right)
+        return quotient if (left < 0) == (right < 0) else -quotient
+    return left / right
+
+
+OPERATIONS = {
+    Opcode.ADD: lambda left, right: left + right,
+    Opcode.SUB: lambda left, right: left - right,
+    Opcode.MUL: lambda left, right: left * right,
+    Opcode.DIV: divide,
+    Opcode.LT:  lambda left, right: int(left < right),
+    Opcode.LTE: lambda left, right: int(left <= right),
+    Opcode.GT:  lambda left, right: int(left > right),
+    Opcode.GTE: lambda left, right: int(left >= right),
+    Opcode.EQ:  lambda left, right: int(left == right),
+    Opcode.NE:  lambda left, right: int(left != right),
+}
+
+
+def evaluate(opcode, left, right):
+    '''the value of `left opcode right` for a binary opcode; raises ZeroDivisionError'''
+    return OPERATIONS[opcode](left, right)
+
+
+class OperandKind(Enum):
+    TEMP        = 'temp'        # int_0, main_tmp, f_tmp_0
+    VARIABLE    = 'variable'    # a declared variable or param
+    CONSTANT    = 'constant'    # an integer literal
+    LABEL       = 'label'       # jump target or function name
+
+
+class Operand:
+    '''an operand of an Instruction: its kind and its name, or its value for a CONSTANT'''
+    __slots__ = ('kind', 'value')
+
+    def __init__(self, kind, value):
+        self.kind = kind
+        self.value = value
+
+    def __eq__(self, other):
+        return isinstance(other, Operand) and other.kind is self.kind and other.value == self.value
+
+    def __hash__(self):
+        # the kind only in __eq__, Enum.__hash__ is a Python call
+        return hash(self.value)
+
+    def __str__(self):
+        return str(self.value)
+
+    def __repr__(self):
+        return f'Operand({self.kind.name}, {self.value!r})'
+
+
+def is_return_register(operand):
+    '''whether `operand` is the <function>_tmp temp a Return writes and the caller reads after its call'''
+    return operand.kind is OperandKind.TEMP and operand.value.endswith('_tmp')
+
+
+def temp(name):
+    return Operand(OperandKind.TEMP, name)
+
+def variable(name):
+    return Operand(OperandKind.VARIABLE, name)
+
+def constant(value):
+    return Operand(OperandKind.CONSTANT, value)
+
+def label(name):
+    return Operand(OperandKind.LABEL, name)
+
+
+class Instruction:
+    '''
+    one IR instruction, operands are Operand or None:
+
+        ASSIGN          result = right
+        ADD ... NE      result = left op right
+        JZ / JNZ        goto result if left is zero / not zero
+        J               goto result
+        FUNCTION        result:, the entry of the function named by result
+        LABEL           result:
+        PARAM           push left as the next actual param
+        CALL            call left, a LABEL operand naming the function
+
+    `index` is the position in its code list, set by IRGenerator.emit()
+    '''
+    __slots__ = ('opcode', 'left', 'right', 'result', 'index')
+
+    def __init__(self, opcode, left=None, right=None, result=None, index=None):
+        self.opcode = opcode
+        self.left = left
+        self.right = right
+        self.result = result
+        self.index = index
+
+    def operands(self):
+        '''the operands read by the instruction'''
+        return [operand for operand in (self.left, self.right) if operand is not None and self.opcode is not Opcode.CALL]
+
+    def defines(self):
+        '''the operand written by the instruction, None for jumps, labels, params and calls'''
+        if self.opcode in JUMP_OPCODES or self.opcode in UNNUMBERED_OPCODES:
+            return None
+        return self.result
+
+    def __repr__(self):
+        return (f'Instruction({self.opcode.name}, left={self.left!r}, right={self.right!r}, '
+                f'result={self.result!r}, index={self.index})')
+
+
+CODE_HEADER = 'Three-Address-Code List'
+
+
+def format_instruction(instr, lineno):
+    '''
+    the listing line of `instr`, three-address-code numbered with `lineno`:
+        100 : (     +,     a,      1,int_0)
+        101 : (     =,  NoOp,  int_0,    a)
+        jmp_0:
+        Param a
+        call f
+    '''
+    opcode = instr.opcode
+    if opcode is Opcode.LABEL or opcode is Opcode.FUNCTION:
+        return f'{instr.result}:'
+    if opcode is Opcode.PARAM:
+        return f'Param {instr.left}'
+    if opcode is Opcode.CALL:
+        return f'call {instr.left}'
+    if opcode is Opcode.ASSIGN:
+        return f'{lineno} : ( {opcode.value:>5},  NoOp,  {str(instr.right):>5}, {str(instr.result):>5})'
+    left = '-' if instr.left is None else str(instr.left)
+    right = '-' if instr.right is None else str(instr.right)
+    return f'{lineno} : ( {opcode.value:>5}, {left:>5},  {right:>5},{str(instr.result):>5})'
+
+
+# listed without a line number
+UNNUMBERED_OPCODES = (Opcode.FUNCTION, Opcode.LABEL, Opcode.PARAM, Opcode.CALL)
+
+
+def numbered(code, first_lineno=100):
+    '''(line number, instruction) of `code`, the line number is None for UNNUMBERED_OPCODES'''
+    lineno = first_lineno
+    for instr in code:
+        if instr.opcode in UNNUMBERED_OPCODES:
+            yield None, instr
+        else:
+            yield lineno, instr
+            lineno += 1
+
+
+def format_code(code, first_lineno=100):
+    '''
+    the three-address-code listing of `code` as lines, header first; only
+    three-address-code gets a line number, the numbering restarts on every call
+    '''
+    lines = [CODE_HEADER + '\n' + '-' * len(CODE_HEADER)]
+    for lineno, instr in numbered(code, first_lineno):
+        lines.append(format_instruction(instr, lineno))
+    return lines
@@ -0,0 +1,125 @@
+from ParserTree import Function
+from TreeWalker import child_nodes
+from IR import Opcode, OperandKind, OPERATIONS, evaluate, is_return_register
+
+### 扩展功能: 中间代码解释器
+
+def frame_layouts(tree):
+    '''name -> (formal param names, local variable names) of every Function of a Program'''
+    layouts = {}
+    for function in tree.children:
+        if not isinstance(function, Function):
+            continue
+        params = [param.var.value for param in function.formal_params if param.var is not None]
+        local_names = set()
+        stack = [function.block]
+        while stack:
+            node = stack.pop()
+            if type(node).__name__ == 'VarDecl':
+                local_names.add(node.var.value)
+            stack.extend(child_nodes(node))
+        layouts[function.name] = (params, local_names | set(params))
+    return layouts
+
+
+class IRInterpreter:
+    '''
+    Runs three-address-code the way the listing reads.
+
+    A call binds the last Params pushed to the formal params of the callee (the
+    Params of f(a, g(b)) are pushed as a, b, g's result) and runs the callee from
+    its FUNCTION instruction up to the next one; a Return only writes the
+    <function>_tmp register, as IRGenerator emits it. Params, locals and temps live
+    in the frame of the call, every other variable and the return registers are
+    global. A variable read before any write is 0, so is the missing left operand
+    of a unary minus.
+
+    The IR has no declarations, frame_layouts() takes them from the tree.
+
+    interpreter = IRInterpreter(generator.code, frame_layouts(tree))
+    interpreter.run('main')
+    print(interpreter.globals, interpreter.steps)
+    '''
+    def __init__(self, code, layouts):
+        self.code = list(code)
+        self.layouts = layouts
+        self.entries = {}
+        self.labels = {}
+        for position, instr in enumerate(self.code):
+            if instr.opcode is Opcode.FUNCTION:
+                self.entries[instr.result.value] = position
+            elif instr.opcode is Opcode.LABEL:
+                self.labels[instr.result.value] = position
+        self.globals = {}
+        # instructions run by run()
+        self.steps = 0
+
+    def run(self, entry='main', args=(), max_steps=None):
+        '''
+        call `entry` with `args`, return the value of its return register, None if it
+        has none; RuntimeError after `max_steps` instructions
+        '''
+        code = self.code
+        glob = self.globals
+        steps = 0
+        params = list(args)
+        # frames: (function name, its variables, position to return to)
+        frames = []
+        pc = self.call(entry, params, frames, None)
+
+        while frames:
+            if pc >= len(code) or code[pc].opcode is Opcode.FUNCTION:
+                pc = frames.pop()[2]
+                continue
+            instr = code[pc]
+            pc += 1
+            steps += 1
+            if max_steps is not None and steps > max_steps:
+                self.steps += steps
+                raise RuntimeError(f'more than {max_steps} steps')
+            local_vars = frames[-1][1]
+            opcode = instr.opcode
+
+            if opcode is Opcode.ASSIGN or opcode in OPERATIONS:
+                if opcode is Opcode.ASSIGN:
+                    value = self.read(instr.right, local_vars)
+                else:
+                    value = evaluate(opcode, self.read(instr.left, local_vars), self.read(instr.right, local_vars))
+                result = instr.result
+                if result.value in local_vars or (result.kind is OperandKind.TEMP and not is_return_register(result)):
+                    local_vars[result.value] = value
+                else:
+                    glob[result.value] = value
+            elif opcode is Opcode.J:
+                pc = self.labels[instr.result.value]
+            elif opcode is Opcode.JZ or opcode is Opcode.JNZ:
+                if (self.read(instr.left, local_vars) == 0) == (opcode is Opcode.JZ):
+                    pc = self.labels[instr.result.value]
+            elif opcode is Opcode.PARAM:
+                params.append(self.read(instr.left, local_vars))
+            elif opcode is Opcode.CALL:
+                pc = self.call(instr.left.value, params, frames, pc)
+
+        self.steps += steps
+        return glob.get(f'{entry}_tmp')
+
+    def call(self, name, params, frames, return_to):
+        '''pop the Params of a call of `name`, push its frame, return the position of its first instruction'''
+        formal_params, local_names = self.layouts[name]
+        local_vars = dict.fromkeys(local_names, 0)
+        if formal_params:
+            local_vars.update(zip(formal_params, params[-len(formal_params):]))
+            del params[-len(formal_params):]
+        frames.append((name, local_vars, return_to))
+        return self.entries[name] + 1
+
+    def read(self, operand, local_vars):
+        if operand is None:
+            return 0
+        if operand.kind is OperandKind.CONSTANT:
+            return operand.value
+        value = local_vars.get(operand.value)
+        if value is None:
+            value = self.globals.get(operand.value, 0)
+        return value
+
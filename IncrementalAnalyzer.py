@@ -0,0 +1,229 @@
+import re
+import time
+
+from Lexer import Lexer
+from Parser import Parser
+from ParserTree import Function
+from SemanticAnalyzer import SemanticAnalyzer, ProcedureSymbol, VarSymbol
+from TreeWalker import child_nodes
+
+### 扩展功能: 增量语义分析
+
+def signature(symbol):
+    '''what analyzing a function reads from a global symbol, None if the name is not declared'''
+    if symbol is None:
+        return None
+    if isinstance(symbol, ProcedureSymbol):
+        return ('proc', symbol.type.value, tuple(param.type for param in symbol.formal_params))
+    if isinstance(symbol, VarSymbol):
+        return ('var', symbol.type, symbol.slot)
+    return ('type', symbol.name)
+
+
+def subtree_tokens(node):
+    '''the distinct tokens of the subtree under `node`'''
+    tokens = {}
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        token = getattr(node, 'token', None)
+        if token is not None:
+            tokens[id(token)] = token
+        stack.extend(child_nodes(node))
+    return list(tokens.values())
+
+
+class FunctionResult:
+    '''
+    what analyzing one Function left behind, reused while its text and the globals it reads are unchanged
+        node:           the analyzed Function, moved into the trees of later runs
+        lineno:         line of its first token
+        proc_symbol:    its ProcedureSymbol
+        globals:        name -> signature() of every global name it looked up
+        errors:         (error_code, token) of the SemanticErrors it raised
+        calls:          its ProcedureCall nodes
+        tokens:         its distinct tokens, renumbered when the function moves
+    '''
+    def __init__(self):
+        self.node = None
+        self.lineno = None
+        self.proc_symbol = None
+        self.globals = {}
+        self.errors = []
+        self.calls = []
+        self.tokens = []
+
+
+class IncrementalSemanticAnalyzer(SemanticAnalyzer):
+    '''
+    SemanticAnalyzer that takes a Function's result from the previous run instead of
+    walking it, see IncrementalAnalyzer
+    '''
+    def __init__(self, keys, previous, **options):
+        super().__init__(**options)
+        # Function node -> fingerprint, see IncrementalAnalyzer.fingerprints()
+        self.keys = keys
+        # fingerprint -> FunctionResults of the previous run not reused yet
+        self.previous = previous
+        # fingerprint -> FunctionResults of this run
+        self.results = {}
+        # Function node of this tree -> the previous Function node that replaces it
+        self.replaced = {}
+        self.skipped = 0
+        self.analyzed = 0
+        # FunctionResult of the Function being walked
+        self._result = None
+        self._errors_before = 0
+
+    def lookup(self, name):
+        symbol = self.current_scope.lookup(name)
+        if self._result is not None and (symbol is None or symbol.scope_level != self.current_scope.scope_level):
+            self._result.globals.setdefault(name, signature(symbol))
+        return symbol
+
+    def reusable(self, node):
+        '''pop and return the previous result that `node` can take over, or None'''
+        candidates = self.previous.get(self.keys.get(node))
+        if not candidates:
+            return None
+        for index, result in enumerate(candidates):
+            own = result.proc_symbol
+            # a recursive call resolves to the function itself, not yet inserted here
+            if all(
+                signature(own if name == own.name else self.current_scope.lookup(name)) == expected
+                for name, expected in result.globals.items()
+            ):
+                return candidates.pop(index)
+        return None
+
+    def enter_Function(self, node):
+        result = self.reusable(node)
+        if result is None:
+            self.analyzed += 1
+            self._result = FunctionResult()
+            self._errors_before = len(self.err_list)
+            return super().enter_Function(node)
+
+        self.skipped += 1
+        delta = node.type.token.lineno - result.lineno
+        if delta:
+            for token in result.tokens:
+                token.lineno += delta
+            result.lineno += delta
+        self.current_scope.insert(result.proc_symbol)
+        for call in result.calls:
+            call.proc_symbol = self.current_scope.lookup(call.name)
+        for error_code, token in result.errors:
+            self.error(error_code=error_code, token=token)
+        self.replaced[node] = result.node
+        self.results.setdefault(self.keys[node], []).append(result)
+        # leave_Function sees no FunctionResult being recorded
+        self._result = None
+        return ()
+
+    def leave_Function(self, node, results):
+        result = self._result
+        if result is None:
+            return
+        super().leave_Function(node, results)
+        self._result = None
+        key = self.keys.get(node)
+        if key is None:
+            return
+        result.node = node
+        result.lineno = node.type.token.lineno
+        result.proc_symbol = node.proc_symbol
+        result.errors = [(err.error_code, err.token) for err in self.err_list[self._errors_before:]]
+        result.tokens = subtree_tokens(node)
+        self.results.setdefault(key, []).append(result)
+
+    def enter_ProcedureCall(self, node):
+        if self._result is not None:
+            self._result.calls.append(node)
+        return super().enter_ProcedureCall(node)
+
+
+class IncrementalAnalyzer:
+    '''
+    Semantic analysis of successive versions of one program that only walks the
+    functions that changed.
+
+    Every Function is fingerprinted by its source text and its first column. The
+    result of analyzing it (ProcedureSymbol, errors, annotations) is kept together
+    with the signature() of every global name it looked up. In the next run a
+    Function with the same fingerprint whose globals still have the same signatures
+    (an edited callee's return type or formal_params do change it) is not walked:
+    the analyzed Function node of the previous tree takes its place in the new tree,
+    renumbered if it moved to other lines, and its errors are reported again.
+    Global declarations are always analyzed. Errors come out in the order of a
+    full analysis, and a program with parser errors is analyzed in full.
+
+    analyzer = IncrementalAnalyzer()
+    tree = analyzer.analyze(text)
+    tree = analyzer.analyze(edited_text)
+    print(analyzer.skipped, analyzer.analyzed, analyzer.getErrList())
+    '''
+    def __init__(self, engine='regex', **analyzer_options):
+        '''analyzer_options: passed to the SemanticAnalyzer, i.e. resolve_slots, symbol_table'''
+        self.engine = engine
+        self.analyzer_options = analyzer_options
+        # fingerprint -> FunctionResults of the last run
+        self.results = {}
+        self.err_list = []
+        self.parser_errors = []
+        # Functions taken over from / walked in the last run
+        self.skipped = 0
+        self.analyzed = 0
+        # 'parse', 'fingerprint', 'analyze' of the last run, in seconds
+        self.timings = {}
+
+    def getErrList(self):
+        return self.err_list
+
+    def fingerprints(self, text, tree):
+        '''
+        Function node -> (its source text up to the next declaration, its first column);
+        empty if the tree has a child without a type token, such as the NoOp of an
+        empty program, whose text cannot be told apart: every Function is then walked
+        '''
+        if not all(isinstance(child, Function) or type(child).__name__ == 'VarDecl' for child in tree.children):
+            return {}
+        line_starts = [0]
+        line_starts.extend(match.end() for match in re.finditer('\n', text))
+        starts = []
+        for child in tree.children:
+            token = child.type.token
+            starts.append(line_starts[token.lineno - 1] + token.column - 1)
+        starts.append(len(text))
+        return {
+            child: (text[start:end], child.type.token.column)
+            for child, start, end in zip(tree.children, starts, starts[1:])
+            if isinstance(child, Function)
+        }
+
+    def analyze(self, text):
+        '''parse and analyze `text`, return the annotated tree'''
+        start = time.perf_counter()
+        lexer = Lexer(text, self.engine)
+        _, token_list = lexer.get_all_tokens()
+        parser = Parser(token_list)
+        tree = parser.parseProcCall()
+        self.parser_errors = parser.getErrList()
+        self.timings['parse'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        keys = {} if self.parser_errors else self.fingerprints(text, tree)
+        self.timings['fingerprint'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        analyzer = IncrementalSemanticAnalyzer(keys, self.results, **self.analyzer_options)
+        try:
+            analyzer.visit(tree)
+        finally:
+            tree.children = [analyzer.replaced.get(child, child) for child in tree.children]
+            self.results = analyzer.results
+            self.err_list = analyzer.getErrList()
+            self.skipped = analyzer.skipped
+            self.analyzed = analyzer.analyzed
+            self.timings['analyze'] = time.perf_counter() - start
+        return tree
@@ -1,54 +1,82 @@
-from Parser import NodeVisitor
+from concurrent.futures import ThreadPoolExecutor
 
-# cur line number
-cur_lineno = 100 - 1
+from Lexer import Lexer
+from Parser import Parser
+from TreeWalker import TreeWalker
+from IR import Opcode, Instruction, BINARY_OPCODES, temp, variable, constant, label, format_code
 
-# record all functions declared in Program
+# record a function declared in Program
 class function_tbl_entry:
     def __init__(self,name,func_type):
         self.name = name
         self.func_type = func_type
         self.return_num = 0
 
-function_tbl = []
-
-class ThreeAddressCode:
-    def __init__(self, left=None, right=None, op=None, result=None):
-        self.left = left
-        self.right = right
-        self.op = op
-        self.result = result
-    def __str__(self):
-        global cur_lineno
-        cur_lineno = cur_lineno + 1
-        if self.left is None:
-            return f'{cur_lineno} : ( {self.op:>5},  NoOp,  {self.right:>5}, {self.result:>5})'
-        return f'{cur_lineno} : ( {self.op:>5}, {self.left:>5},  {self.right:>5},{self.result:>5})'
-
-class JumpBlockCode:
-    def __init__(self, code):
-        self.code = code
-    def __str__(self):
-        return f'{self.code}'
-
-class IRGenerator(NodeVisitor):
+class FunctionTable(list):
+    '''
+    the function_tbl_entry list, with the first entry of every name indexed
+    for lookup(); only append() and clear() keep the index
+    '''
+    def __init__(self):
+        super().__init__()
+        self.index = {}
+
+    def append(self, entry):
+        super().append(entry)
+        self.index.setdefault(entry.name, entry)
+
+    def clear(self):
+        super().clear()
+        self.index.clear()
+
+    def lookup(self, name):
+        return self.index.get(name)
+
+
+class IRGenerator(TreeWalker):
     '''
     Intermediate Representation Generator
         input:  Abstract Syntax Tree
-        output: 3-address code sequence
+        output: 3-address code sequence, a list of IR.Instruction in self.code
+
+    walked without recursion (see TreeWalker): an expression's leave_X returns
+    its place (an IR.Operand), statements emit their jumps from enter_X / after_child_X / leave_X
+
+    with a call_graph (CallGraph of the same tree) a call may come before the
+    definition of its callee
+
+    all state is per instance, generators may run in several threads, see generate_batch()
+
+    irg = IRGenerator(parser)
+    irg.genCodeSeq()
+    for line in irg.listing():
+        print(line)
     '''
-    def __init__(self, parser):
+    def __init__(self, parser, call_graph=None):
         super().__init__()
         self.parser = parser
-        # a list of three-address-code
+        self.call_graph = call_graph
+        # a list of three-address-code, see listing() for the text
         self.code = []
-        prompt = 'Three-Address-Code List'
-        self.code.append(prompt + '\n' + '-' * len(prompt))
+        # record all functions declared in Program
+        self.function_tbl = FunctionTable()
         # record current function name in proccall
         self.cur_funcname = None
         # count for self.newtemp()
         self._tempcount = 0
         self._signcount = 0
+        # (false or begin label, next label) of the If / While statements being walked
+        self._labels = []
+        # what stopped genCodeSeq() in generate_ir()
+        self.exception = None
+
+    def emit(self, opcode, left=None, right=None, result=None):
+        '''append an Instruction numbered with its index in self.code'''
+        self.code.append(Instruction(opcode, left, right, result, len(self.code)))
+
+    def listing(self, first_lineno=100):
+        '''the text of self.code, see IR.format_code'''
+        return format_code(self.code, first_lineno)
 
     def newtemp(self, type):
         '''
@@ -65,206 +93,151 @@ class IRGenerator(NodeVisitor):
             tempname = "%s_%s" % (type, "tmp")
         return tempname
 
-    def visit_Var(self, node):
+    def leave_Var(self, node, results):
         # i.e. a, b, c
-        return node.value
-
-    def visit_NoOp(self, node):
-        pass
+        return variable(node.value)
 
-    def visit_Type(self, node):
-        pass
-
-    def visit_Param(self, node):
-        self.visit(node.var)
-        self.visit(node.type)
-
-    def visit_BinOp(self, node):
+    def leave_BinOp(self, node, results):
         # temporarily put node.place in return value
-        leftAddress = self.visit(node.left)
-        rightAddress = self.visit(node.right)
+        leftAddress, rightAddress = results
         # create new temp, i.e. int_1, float_2
         # set int as default type
-        resultAddress = self.newtemp('int')
+        resultAddress = temp(self.newtemp('int'))
         # gen
-        binop_instr = ThreeAddressCode(
+        self.emit(
+            BINARY_OPCODES[node.op.value], # TokenType.PLUS.value = '+'
             left = leftAddress,
             right = rightAddress,
-            op = node.op.value, # TokenType.PLUS.value = '+'
             result = resultAddress
         )
-        self.code.append(binop_instr)
         # save node.place in return value
         return resultAddress
 
-    def visit_Num(self, node):
+    def leave_Num(self, node, results):
         # i.e. 372, 519
-        return node.value
-
-    def visit_Program(self, node):
-        for child in node.children:
-            self.visit(child)
+        return constant(node.value)
 
-    def visit_Function(self, node):
+    def enter_Function(self, node):
         '''
         function declaration
         '''
-        beginAddressSign = JumpBlockCode(code = f'{node.name}:')
-        self.code.append(beginAddressSign)
+        self.emit(Opcode.FUNCTION, result = label(node.name))
 
         # record the function name in self.cure_funcname
         self.cur_funcname = node.name
         # print(f'...encounter Function: {node.name} ...')
 
-        # add function into the global tbl
-        function_tbl.append(function_tbl_entry(node.name, node.type))
+        # add function into the tbl
+        self.function_tbl.append(function_tbl_entry(node.name, node.type))
 
-        # visit
-        self.visit(node.type)
-        for param_node in node.formal_params:
-            self.visit(param_node)
-        self.visit(node.block)
-
-    def visit_Block(self, node):
-        self.visit(node.declarations)
-        self.visit(node.compound_statement)
-
-    def visit_Declaration(self, node):
-        for child in node.children:
-            self.visit(child)
-
-    def visit_Compound(self, node):
-        for child in node.children:
-            self.visit(child)
-
-    def visit_Assign(self, node):
+    def leave_Assign(self, node, results):
         # temporarily put node.place in return value
-        leftAddress = self.visit(node.left)
-        rightAddress = self.visit(node.right)
+        leftAddress, rightAddress = results
         # gen
-        binop_instr = ThreeAddressCode(
+        self.emit(
+            Opcode.ASSIGN,
             right = rightAddress,
-            op = node.token.value, # TokenType.PLUS.value = '+'
             result = leftAddress
         )
-        self.code.append(binop_instr)
         return leftAddress
 
-    def visit_Return(self, node):
+    def leave_Return(self, node, results):
         # gen newtemp for expr in return-statement
-        resultAddr = self.visit(node.expr)
+        resultAddr = results[0]
         if resultAddr is not None:
             # gen newtemp
-            resultAddress = self.newtemp(self.cur_funcname)
+            resultAddress = temp(self.newtemp(self.cur_funcname))
             # assign the return value from a shared reg(in the func declr) to real value in the Program 
-            return_instr = ThreeAddressCode(
+            self.emit(
+                Opcode.ASSIGN,
                 right = resultAddr,
-                op = '=',
                 result = resultAddress
             )
-            self.code.append(return_instr)
 
-    def visit_While(self, node):
+    def enter_While(self, node):
         # gen new temp
-        beginAddress = self.newtemp('jmp')
-        nextAddress = self.newtemp('nxt')
+        beginAddress = label(self.newtemp('jmp'))
+        nextAddress = label(self.newtemp('nxt'))
+        self._labels.append((beginAddress, nextAddress))
 
         # jmp_0: the beginning of condition
-        beginAddressSign = JumpBlockCode(code = f'{beginAddress}:')
-        self.code.append(beginAddressSign)
-
-        # E.place
-        exprAddress = self.visit(node.expr)
-
-        # JumpBlockCode(code = f'if {exprAddress} = 0 goto {nextAddress}')
-        while_instr = ThreeAddressCode(
-            op = 'jz',
-            left = exprAddress,
-            right = '-',
-            result = nextAddress
-        )
-        self.code.append(while_instr)
-
-        # visit block
-        self.visit(node.block)
+        self.emit(Opcode.LABEL, result = beginAddress)
+
+    def after_child_While(self, node, idx, child, result):
+        if idx == 0:
+            # E.place
+            exprAddress = result
+            beginAddress, nextAddress = self._labels[-1]
+
+            # if {exprAddress} = 0 goto {nextAddress}
+            self.emit(
+                Opcode.JZ,
+                left = exprAddress,
+                result = nextAddress
+            )
 
+    def leave_While(self, node, results):
         # After Visit Block
-        # JumpBlockCode(code = f'goto {beginAddress}')
-        jumpBackBlock = ThreeAddressCode(
-            op = 'j',
-            left = '-',
-            right = '-',
-            result = beginAddress
-        )
-        self.code.append(jumpBackBlock)
+        beginAddress, nextAddress = self._labels.pop()
+        # goto {beginAddress}
+        self.emit(Opcode.J, result = beginAddress)
 
         # sign for the next statement after while-loop
-        nextAddressSign = JumpBlockCode(code = f'{nextAddress}:')
-        self.code.append(nextAddressSign)
-
-    def visit_If(self, node):
-        # E.place
-        exprAddress = self.visit(node.expr)
-        # gen new temp
-        trueAddress = self.newtemp('jmp')
-        if type(node.else_block).__name__ != 'NoOp':
-            falseAddress = self.newtemp('jmp')
-        nextAddress = self.newtemp('nxt')
-
-        # i.e. if expr = 1 goto trueAddress
-        # JumpBlockCode(code = f'if {exprAddress} = 1 goto {trueAddress}')
-        if_instr = ThreeAddressCode(
-            op = 'jnz',
-            left = exprAddress,
-            right = '-',
-            result = trueAddress
-        )
-        self.code.append(if_instr)
+        self.emit(Opcode.LABEL, result = nextAddress)
 
-        # i.e. goto falseAddress
+    def enter_If(self, node):
+        children = [node.expr, node.if_block]
         if type(node.else_block).__name__ != 'NoOp':
-            # falseAddressSign = JumpBlockCode(code = f'goto {falseAddress}')
-            else_instr = ThreeAddressCode(
-                op = 'j',
-                left = '-',
-                right = '-',
-                result = falseAddress
+            children.append(node.else_block)
+        return children
+
+    def after_child_If(self, node, idx, child, result):
+        if idx == 0:
+            # E.place
+            exprAddress = result
+            # gen new temp
+            trueAddress = label(self.newtemp('jmp'))
+            falseAddress = None
+            if type(node.else_block).__name__ != 'NoOp':
+                falseAddress = label(self.newtemp('jmp'))
+            nextAddress = label(self.newtemp('nxt'))
+            self._labels.append((falseAddress, nextAddress))
+
+            # i.e. if expr = 1 goto trueAddress
+            self.emit(
+                Opcode.JNZ,
+                left = exprAddress,
+                result = trueAddress
             )
-            self.code.append(else_instr)
-
-        '''
-        ( if-block )
-        trueAddressSign: { if-block }
-        goto falseAddress
-        '''
-        trueAddressSign = JumpBlockCode(code = f'{trueAddress}:')
-        self.code.append(trueAddressSign)
-        self.visit(node.if_block)
-        # JumpBlockCode(code = f'goto {nextAddress}')
-        jumpAfterBlock = ThreeAddressCode(
-            op = 'j',
-            left = '-',
-            right = '-',
-            result = nextAddress
-        )
-        self.code.append(jumpAfterBlock)
-
-        # else-block
-        if type(node.else_block).__name__ != 'NoOp':
-            falseAddressSign = JumpBlockCode(code = f'{falseAddress}:')
-            self.code.append(falseAddressSign)
-            self.visit(node.else_block)
 
+            # i.e. goto falseAddress
+            if falseAddress is not None:
+                self.emit(Opcode.J, result = falseAddress)
+
+            '''
+            ( if-block )
+            trueAddressSign: { if-block }
+            goto falseAddress
+            '''
+            self.emit(Opcode.LABEL, result = trueAddress)
+        elif idx == 1:
+            falseAddress, nextAddress = self._labels[-1]
+            # goto {nextAddress}
+            self.emit(Opcode.J, result = nextAddress)
+
+            # else-block
+            if falseAddress is not None:
+                self.emit(Opcode.LABEL, result = falseAddress)
+
+    def leave_If(self, node, results):
         # next Address Sign
-        nextAddressSign = JumpBlockCode(code = f'{nextAddress}:')
-        self.code.append(nextAddressSign)
+        falseAddress, nextAddress = self._labels.pop()
+        self.emit(Opcode.LABEL, result = nextAddress)
 
-    def visit_VarDecl(self, node):
-        pass
-
-    def visit_ProcedureCall(self, node):
-        global function_tbl
+    def enter_VarDecl(self, node):
+        return ()
 
+    def after_child_ProcedureCall(self, node, idx, param_node, node_value):
         # gen sth like this, i.e.
         # Param a
         # Param b
@@ -272,13 +245,13 @@ class IRGenerator(NodeVisitor):
         # call demo
 
         # list actual-params
-        for param_node in node.actual_params:
-            node_value = self.visit(param_node)
-            self.code.append(f'Param {node_value}')
+        self.emit(Opcode.PARAM, left = node_value)
+
+    def leave_ProcedureCall(self, node, results):
+        function_tbl = self.function_tbl
 
         # call func
-        proccall = JumpBlockCode(code = f'call {node.name}')
-        self.code.append(proccall)
+        self.emit(Opcode.CALL, left = label(node.name))
 
         # HERE we gen an extra 3AC, ' newtemp := ret value of cur function '
         # i.e. (     =,  NoOp,  demo_tmp, demo_tmp_0)
@@ -286,26 +259,61 @@ class IRGenerator(NodeVisitor):
 
         # P.S. RULES:
         #   we assume that function isn't overloaded
-        #   we have to define func first before we can use it
-        for entry in function_tbl:
-            # first, look up current function in tbl
-            if entry.name == node.name:
-                if entry.func_type != 'VOID':
-                    # gen temp for ret value
-                    retvalue_temp = "%s_%d" % (funcname_temp, entry.return_num)
-                    entry.return_num += 1
-
-                    return_instr = ThreeAddressCode(
-                        right = funcname_temp,
-                        op = '=',
-                        result = retvalue_temp
-                    )
-                    self.code.append(return_instr)
-                break
+        #   we have to define func first before we can use it, unless there is a call graph
+        # first, look up current function in tbl
+        entry = function_tbl.lookup(node.name)
+        if entry is None and self.call_graph is not None:
+            function = self.call_graph.functions.get(node.name)
+            if function is not None:
+                # declared ahead, enter_Function adds a second entry that lookup() never returns
+                entry = function_tbl_entry(function.name, function.type)
+                function_tbl.append(entry)
+        if entry is not None:
+            if entry.func_type != 'VOID':
+                # gen temp for ret value
+                retvalue_temp = temp("%s_%d" % (funcname_temp, entry.return_num))
+                entry.return_num += 1
+
+                self.emit(
+                    Opcode.ASSIGN,
+                    right = temp(funcname_temp),
+                    result = retvalue_temp
+                )
         # since 'factor -> proccall' in parser's rule,
         # so we should save node.place in return value
         return retvalue_temp
 
-    def genCodeSeq(self):
-        astTree = self.parser.parseProcCall()
-        self.visit(astTree)
+    def genCodeSeq(self, tree=None):
+        '''
+        an already parsed `tree` (e.g. from Pipeline) is used as is,
+        otherwise the program is parsed first
+        '''
+        if tree is None:
+            tree = self.parser.parseProcCall()
+        self.walk(tree)
+
+
+def generate_ir(source, engine='regex'):
+    '''
+    lex, parse and generate the IR of one program, return its IRGenerator;
+    `exception` is what stopped genCodeSeq(), None if it ran to the end
+    '''
+    _, token_list = Lexer(source, engine).get_all_tokens()
+    generator = IRGenerator(Parser(token_list))
+    try:
+        generator.genCodeSeq()
+    except Exception as exc:
+        generator.exception = exc
+    return generator
+
+
+def generate_batch(sources, workers=None, executor=None, engine='regex'):
+    '''
+    generate_ir() of every source in a thread pool, the IRGenerators in the order of `sources`
+        workers:    size of the thread pool, ThreadPoolExecutor's default if None
+        executor:   a running executor to use instead of a new pool
+    '''
+    if executor is not None:
+        return list(executor.map(generate_ir, sources, [engine] * len(sources)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(generate_ir, sources, [engine] * len(sources)))
@@ -1,4 +1,5 @@
 import argparse
+import json
 import os
 import sys
 
@@ -6,6 +7,7 @@ from Lexer import TokenType, Lexer
 from notation_removal import notation_removal
 from Parser import Parser
 from ParserVisualizer import ASTVisualizer
+from ProgramCache import ProgramCache
 
 # cmd: python Interpreter.py testfile.txt False > ast.dot && dot -Tpng -o ast.png ast.dot
 
@@ -21,18 +23,37 @@ if __name__ == '__main__':
         'debug_mode',
         help='Enable/Disable Traceback in Exception Error'
     )
+    argparser.add_argument(
+        '--cache-dir',
+        help='Reuse tokens and AST of unchanged sources from this directory'
+    )
+    argparser.add_argument(
+        '--cache-stats',
+        action='store_true',
+        help='Print cache hit/miss counters as JSON to stderr'
+    )
     args = argparser.parse_args()
     fname = args.fname
-    text = open(fname, 'r').read()
 
     if args.debug_mode == 'False':
         sys.tracebacklimit = 0
 
-    lexer = Lexer(text)
-    parser = Parser(lexer)
-    viz = ASTVisualizer(parser)
-    content = viz.gendot()
+    if args.cache_dir:
+        cache = ProgramCache(args.cache_dir)
+        result = cache.parse(open(fname, 'r').read())
+        viz = ASTVisualizer(parser=None)
+        content = viz.gendot(result.tree)
+        err_list = result.parser_errors
+        if args.cache_stats:
+            print(json.dumps(cache.stats()), file=sys.stderr)
+    else:
+        # tokens are read from the file lazily, while the parser consumes them
+        lexer = Lexer.from_file(fname)
+        parser = Parser(lexer)
+        viz = ASTVisualizer(parser)
+        content = viz.gendot()
+        err_list = parser.getErrList()
     print(content)
 
-    for err in parser.getErrList():
+    for err in err_list:
         print(err.__str__())
@@ -1,4 +1,13 @@
+import codecs
+import io
+import mmap
+import os
+import re
+from array import array
+from bisect import bisect_right
 from enum import Enum
+from itertools import accumulate
+from sys import intern
 from Error_Detection import LexerError
 
 ### 词法分析器
@@ -54,6 +63,9 @@ class TokenType(Enum):
     EOF           = '#'
 
 class Token:
+    # no per-instance __dict__, the lexer keeps millions of tokens alive
+    __slots__ = ('type', 'value', 'lineno', 'column')
+
     def __init__(self, type, value, lineno=None, column=None):
         self.type = type
         self.value = value
@@ -78,6 +90,156 @@ class Token:
     def __repr__(self):
         return self.__str__()
 
+    def __reduce__(self):
+        # pickles in about a third of the time of the default protocol for __slots__
+        return (Token, (self.type, self.value, self.lineno, self.column))
+
+class LineIndex:
+    '''
+    Offsets of the first character of every line of the input,
+    resolves an offset to (lineno, column) by binary search.
+
+    Example:
+        lines = LineIndex('int a;\nint b;')
+        lines.position(8)  ->  (2, 2)
+    '''
+    __slots__ = ('starts', 'size')
+
+    def __init__(self, text=''):
+        self.starts = array('q', [0])
+        # number of characters indexed so far
+        self.size = 0
+        self.extend(text)
+
+    def extend(self, text):
+        '''index the next piece of the input'''
+        # line lengths come from str.split, the running sum is done by accumulate,
+        # so no Python code runs per character or per line
+        lines = text.split('\n')
+        line_starts = accumulate(map((1).__add__, map(len, lines[:-1])), initial=self.size)
+        next(line_starts)
+        self.starts.extend(line_starts)
+        self.size += len(text)
+
+    def indexed(self, chunks):
+        '''pass `chunks` through, indexing each one when it is read'''
+        for chunk in chunks:
+            self.extend(chunk)
+            yield chunk
+
+    def position(self, offset):
+        lineno = bisect_right(self.starts, offset)
+        return lineno, offset - self.starts[lineno - 1] + 1
+
+class LazyToken(Token):
+    '''
+    Token of Lexer(positions='lazy'), it only records the offset of its lexeme,
+    `lineno` and `column` are looked up in the shared LineIndex when read
+    '''
+    __slots__ = ('offset', 'lines')
+
+    def __init__(self, type, value, offset, lines):
+        self.type = type
+        self.value = value
+        self.offset = offset
+        self.lines = lines
+
+    @property
+    def lineno(self):
+        return self.lines.position(self.offset)[0]
+
+    @property
+    def column(self):
+        return self.lines.position(self.offset)[1]
+
+# kind codes of TokenArray: index into TOKEN_KINDS, None is the type of illegal-character tokens
+TOKEN_KINDS = list(TokenType) + [None]
+_KIND_CODES = {token_type: code for code, token_type in enumerate(TOKEN_KINDS)}
+
+class TokenArray:
+    '''
+    Struct-of-arrays storage of a token stream, one array.array column per field:
+        kinds:      'B' kind code, see TOKEN_KINDS
+        values:     'I' index into value_table, each distinct value is stored once
+        linenos:    'i' line number, -1 for None (EOF token)
+        columns:    'i' column number, -1 for None
+
+    Tokens are rebuilt on access, so use it where a stream is stored
+    rather than where it is scanned token by token.
+
+    Example:
+        RetValue, token_array = lexer.get_all_tokens(compact=True)
+        token_array[3]  ->  Token(TokenType.ID, 'main', position=2:18)
+    '''
+    __slots__ = ('kinds', 'values', 'linenos', 'columns', 'value_table', '_value_index')
+
+    def __init__(self, tokens=()):
+        self.kinds = array('B')
+        self.values = array('I')
+        self.linenos = array('i')
+        self.columns = array('i')
+        self.value_table = []
+        # (type(value), value) -> index into value_table, keeps 1, 1.0 and True apart
+        self._value_index = {}
+        self.extend(tokens)
+
+    def append(self, token):
+        key = (type(token.value), token.value)
+        index = self._value_index.get(key)
+        if index is None:
+            index = self._value_index[key] = len(self.value_table)
+            self.value_table.append(token.value)
+        self.kinds.append(_KIND_CODES[token.type])
+        self.values.append(index)
+        self.linenos.append(-1 if token.lineno is None else token.lineno)
+        self.columns.append(-1 if token.column is None else token.column)
+
+    def extend(self, tokens):
+        for token in tokens:
+            self.append(token)
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            # slices share the (append-only) value table
+            sliced = TokenArray.__new__(TokenArray)
+            sliced.kinds = self.kinds[index]
+            sliced.values = self.values[index]
+            sliced.linenos = self.linenos[index]
+            sliced.columns = self.columns[index]
+            sliced.value_table = self.value_table
+            sliced._value_index = self._value_index
+            return sliced
+        lineno = self.linenos[index]
+        column = self.columns[index]
+        return Token(
+            type=TOKEN_KINDS[self.kinds[index]],
+            value=self.value_table[self.values[index]],
+            lineno=None if lineno == -1 else lineno,
+            column=None if column == -1 else column,
+        )
+
+    def __iter__(self):
+        value_table = self.value_table
+        for kind, value, lineno, column in zip(self.kinds, self.values, self.linenos, self.columns):
+            yield Token(
+                TOKEN_KINDS[kind],
+                value_table[value],
+                None if lineno == -1 else lineno,
+                None if column == -1 else column,
+            )
+
+    def __getstate__(self):
+        return (self.kinds, self.values, self.linenos, self.columns, self.value_table)
+
+    def __setstate__(self, state):
+        self.kinds, self.values, self.linenos, self.columns, self.value_table = state
+        self._value_index = {
+            (type(value), value): index for index, value in enumerate(self.value_table)
+        }
+
 def _build_reserved_keywords():
     '''
     function: keep all reserved-keywords
@@ -103,31 +265,157 @@ def _build_reserved_keywords():
 
 RESERVED_KEYWORDS = _build_reserved_keywords()
 
+# operator/punctuation lexemes, e.g. {'+': <TokenType.PLUS: '+'>, '<=': <TokenType.LTE: '<='>}
+OPERATOR_TOKENS = {
+    token_type.value: token_type
+    for token_type in TokenType
+    if not token_type.value[0].isalpha()
+}
+
+# master pattern of the 'regex' engine: leading whitespace, then one group per token class
+# \s, [^\W\d_] and [^\W_] agree with str.isspace/isalpha/isalnum on ascii input,
+# anything else is handed back to the character engine (see _regex_next_token)
+_MASTER_PATTERN = re.compile(r'''
+    \s*
+    (?:
+        (?P<OP>[<>!=]=|(?!//|/\*|\*/)[-+*/<>=;,(){}\#])
+      | (?P<ID>[^\W\d_][^\W_]*)
+      | (?P<NUM>\d+(?:\.\d*)?)
+    )
+''', re.VERBOSE)
+_OP_GROUP, _ID_GROUP, _NUM_GROUP = 1, 2, 3
+
+LEXER_ENGINES = ('char', 'regex')
+LEXER_POSITIONS = ('eager', 'lazy')
+
+# default buffer size of Lexer.from_file, in bytes
+CHUNK_SIZE = 1 << 16
+
+def _read_chunks(path, chunk_size, encoding, use_mmap):
+    '''
+    function: decode the file at `path` piece by piece
+    yields non-empty str chunks; multi-byte characters and '\r\n' pairs that
+    straddle two chunks are stitched by the incremental decoders, newlines are
+    translated the same way as open(path, 'r').read() does
+    '''
+    decoder = io.IncrementalNewlineDecoder(
+        codecs.getincrementaldecoder(encoding)(), translate=True
+    )
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if use_mmap and size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                for start in range(0, size, chunk_size):
+                    chunk = decoder.decode(mm[start:start + chunk_size])
+                    if chunk:
+                        yield chunk
+        else:
+            for data in iter(lambda: f.read(chunk_size), b''):
+                chunk = decoder.decode(data)
+                if chunk:
+                    yield chunk
+    chunk = decoder.decode(b'', final=True)
+    if chunk:
+        yield chunk
+
 class Lexer:
-    def __init__(self, text):
-        # input string
+    def __init__(self, text, engine='char', chunks=None, positions='eager'):
+        '''
+        engine:
+            'char':  walk the text one character at a time (reference engine)
+            'regex': match one token at a time with _MASTER_PATTERN,
+                     yields exactly the same tokens, positions and errors
+        chunks:
+            optional iterator over the rest of the input, `text` is then only its
+            first piece and further pieces are appended on demand (see _fill)
+        positions:
+            'eager': every token carries its lineno and column
+            'lazy':  tokens are LazyTokens resolved through self.lines,
+                     no line/column bookkeeping per token (regex engine only)
+        '''
+        if engine not in LEXER_ENGINES:
+            raise ValueError(f'unknown lexer engine: {engine!r}')
+        if positions not in LEXER_POSITIONS:
+            raise ValueError(f'unknown position mode: {positions!r}')
+        if positions == 'lazy' and engine != 'regex':
+            raise ValueError("positions='lazy' needs engine='regex'")
+        self.engine = engine
+        self.positions = positions
+        # input string, or the window of it that is still being scanned
         self.text = text
-        # index to self.text
+        # line starts of the whole input, only kept in lazy mode
+        self.lines = None
+        if positions == 'lazy':
+            self.lines = LineIndex(text)
+            if chunks is not None:
+                chunks = self.lines.indexed(chunks)
+        self._chunks = chunks
+        # index to self.text, and offset of self.text[0] in the whole input
         self.pos = 0
-        self.current_char = self.text[self.pos]
+        self._base = 0
+        # index of the first character of the current line, used by the regex engine
+        self._line_start = 0
+        # set once a '/*' without matching '*/' was found
+        self._comment_unclosed = False
+        if not self.text:
+            self._fill()
+        self.current_char = self.text[self.pos] if self.text else None
         # token line number and column number
         self.lineno = 1
         self.column = 1
         # log errors used in UI
         self.err_list = []
+        # bind the scanner once, so that the hot path costs no extra call
+        if positions == 'lazy':
+            self.get_next_token = self._regex_lazy_next_token
+        elif engine == 'regex':
+            self.get_next_token = self._regex_next_token
+        else:
+            self.get_next_token = self._char_next_token
     
+    @classmethod
+    def from_file(cls, path, engine='char', chunk_size=CHUNK_SIZE, encoding='utf-8', use_mmap=True,
+                  positions='eager'):
+        '''
+        build a lexer that reads `path` through a memory map (or plain reads of
+        `chunk_size` bytes) instead of loading the whole file into one string
+
+        lexer = Lexer.from_file('testfile.txt', engine='regex')
+        for token in lexer.iter_tokens():
+            ...
+        '''
+        return cls(
+            '',
+            engine=engine,
+            chunks=_read_chunks(path, chunk_size, encoding, use_mmap),
+            positions=positions,
+        )
+
     def getErrList(self):
         return self.err_list
 
-    def get_all_tokens(self):
+    def iter_tokens(self):
+        '''
+        yield tokens lazily, up to and including the EOF token,
+        memory stays bounded by the chunk size when built with from_file
+        '''
+        get_next_token = self.get_next_token
+        while True:
+            token = get_next_token()
+            yield token
+            if token.type == TokenType.EOF:
+                return
+
+    def get_all_tokens(self, compact=False):
         '''
         return a tuple <isEOF, token-list>
             isEOF: true if there is no lexer error,
             and we traverse to the end of the procedure
 
-            token-list: a list of tokens corresponding to the procedure
+            token-list: a list of tokens corresponding to the procedure,
+            or a TokenArray if `compact` is set
         '''
-        token_list = []
+        token_list = TokenArray() if compact else []
         token = self.get_next_token()
         token_list.append(token)
         flag = True
@@ -149,6 +437,10 @@ class Lexer:
         # self.err_list.append(lexerErr)
         self.err_list.append(s)
 
+    def comment_error(self):
+        # same diagnostic as notation_removal(), on the row of the '/*' or '*/'
+        self.err_list.append('Error! illegal comment on row {}'.format(self.lineno))
+
     def advance(self):
         '''Advance `pos` pointer and set `current_char`'''
         if self.current_char == '\n':
@@ -156,7 +448,7 @@ class Lexer:
             self.column = 0
 
         self.pos += 1
-        if self.pos > len(self.text) - 1:
+        if self.pos > len(self.text) - 1 and not self._fill():
             self.current_char = None  # end of input
         else:
             self.current_char = self.text[self.pos]
@@ -164,17 +456,92 @@ class Lexer:
 
     def peek(self):
         peek_pos = self.pos + 1
-        if peek_pos > len(self.text) - 1:
+        if peek_pos > len(self.text) - 1 and not self._fill():
             return None
         else:
-            return self.text[peek_pos]
+            return self.text[self.pos + 1]
+
+    def _fill(self):
+        '''
+        function: append the next chunk of the input to self.text
+        the already scanned prefix self.text[:self.pos] is dropped, so `pos` and
+        `_line_start` are shifted accordingly; return False at end of input
+        '''
+        if self._chunks is None:
+            return False
+        chunk = next(self._chunks, '')
+        if not chunk:
+            self._chunks = None
+            return False
+        consumed = min(self.pos, len(self.text))
+        self.text = self.text[consumed:] + chunk
+        self.pos -= consumed
+        self._base += consumed
+        self._line_start -= consumed
+        return True
 
     def skip_whitespace(self):
         while self.current_char is not None and self.current_char.isspace():
             self.advance()
 
     def skip_comment(self):
-        pass
+        '''
+        skip the '//' or '/* */' comment that starts at self.pos
+        '//' ends before the next newline, '/*' after the first '*/' behind it;
+        return False (and log an illegal-comment error) if the '/*' is never
+        closed, the caller then lexes it as DIV and MUL
+        '''
+        if self.peek() == '/':
+            end = self._find('\n', self.pos + 2)
+            if end == -1:
+                end = len(self.text)
+        else:
+            # once a '/*' was left open no '*/' follows, skip the search
+            end = -1 if self._comment_unclosed else self._find('*/', self.pos + 2)
+            if end == -1:
+                self._comment_unclosed = True
+                self.comment_error()
+                return False
+            end += 2
+
+        # move to end - 1 in one step, then advance() to handle newline and end of input
+        last = end - 1
+        newlines = self.text.count('\n', self.pos, last)
+        if newlines:
+            self.lineno += newlines
+            self.column = last - self.text.rfind('\n', self.pos, last)
+        else:
+            self.column += last - self.pos
+        self.pos = last
+        self.current_char = self.text[last]
+        self.advance()
+        return True
+
+    def _find(self, sub, start):
+        '''
+        self.text.find(sub, start), but reads further chunks of the input until
+        `sub` is found or the input ends; the chunks are joined once at the end
+        '''
+        index = self.text.find(sub, start)
+        if index != -1 or self._chunks is None:
+            return index
+        pieces = [self.text]
+        size = len(self.text)
+        # keep len(sub) - 1 characters, `sub` may straddle two chunks
+        tail = self.text[max(start, size - len(sub) + 1):]
+        for chunk in self._chunks:
+            window = tail + chunk
+            found = window.find(sub)
+            pieces.append(chunk)
+            if found != -1:
+                index = size - len(tail) + found
+                break
+            size += len(chunk)
+            tail = window[len(window) - len(sub) + 1:]
+        else:
+            self._chunks = None
+        self.text = ''.join(pieces)
+        return index
 
     def number(self):
         '''
@@ -222,7 +589,8 @@ class Lexer:
         token_type = RESERVED_KEYWORDS.get(value.upper())
         if token_type is None:
             token.type = TokenType.ID
-            token.value = value
+            # one str object per identifier, symbol tables compare names by identity
+            token.value = intern(value)
         else:
             # reserved keyword
             token.type = token_type
@@ -230,7 +598,7 @@ class Lexer:
 
         return token
 
-    def get_next_token(self):
+    def _char_next_token(self):
         '''
         function: break self.text into different tokens, and fetch one token once at a time
         '''
@@ -239,10 +607,13 @@ class Lexer:
                 self.skip_whitespace()
                 continue
             
-            '''
-            pre-process comment in self.text
-                self.comment()
-            '''
+            # comments are skipped in place, no pre-processing pass over self.text
+            if self.current_char == '/' and self.peek() in ('/', '*'):
+                if self.skip_comment():
+                    continue
+            elif self.current_char == '*' and self.peek() == '/':
+                # '*/' outside of a comment, still lexed as MUL and DIV
+                self.comment_error()
 
             if self.current_char.isalpha():
                 return self._id()
@@ -306,3 +677,110 @@ class Lexer:
         # EOF (end-of-file) token indicates that there is no more
         # input left for lexical analysis
         return Token(type=TokenType.EOF, value=None)
+
+    def _seek(self, pos):
+        '''Move the cursor of the regex engine to `pos`, keeping the char-engine state valid'''
+        self.pos = pos
+        if pos < len(self.text):
+            self.current_char = self.text[pos]
+            self.column = pos - self._line_start + 1
+        else:
+            self.current_char = None
+            self.column = pos - self._line_start
+
+    def _regex_refill(self, match):
+        '''
+        a match that reaches the end of the window may continue in the next chunk,
+        no match at all needs more input only if nothing but whitespace is left;
+        return the match at self.pos once enough input is read
+        '''
+        while self._chunks is not None and (
+            match.end() == len(self.text) if match is not None
+            else self.pos == len(self.text) or self.text[self.pos:].isspace()
+        ):
+            if not self._fill():
+                break
+            match = _MASTER_PATTERN.match(self.text, self.pos)
+        return match
+
+    def _regex_next_token(self):
+        '''
+        function: same contract as _char_next_token, but each token (and the whitespace
+        in front of it) is recognized by a single match of _MASTER_PATTERN
+        '''
+        match = _MASTER_PATTERN.match(self.text, self.pos)
+        if self._chunks is not None:
+            match = self._regex_refill(match)
+        text = self.text
+        pos = self.pos
+        if match is not None:
+            group = match.lastindex
+            start, end = match.span(group)
+            value = match.group(group)
+            next_char = text[end] if end < len(text) else None
+            # unicode letters/digits: let the reference engine decide
+            if group == _OP_GROUP or (value.isascii() and (next_char is None or next_char.isascii())):
+                if start != pos:
+                    newlines = text.count('\n', pos, start)
+                    if newlines:
+                        self.lineno += newlines
+                        self._line_start = text.rfind('\n', pos, start) + 1
+                column = start - self._line_start + 1
+                self.pos = end
+                self.current_char = next_char
+
+                if group == _OP_GROUP:
+                    # the lexeme is the enum value, e.g. '<=' == TokenType.LTE.value
+                    return Token(OPERATOR_TOKENS[value], value, self.lineno, column)
+                if group == _ID_GROUP:
+                    token_type = RESERVED_KEYWORDS.get(value.upper())
+                    if token_type is None:
+                        return Token(TokenType.ID, intern(value), self.lineno, column)
+                    return Token(token_type, value.upper(), self.lineno, column)
+                if '.' in value:
+                    return Token(TokenType.REAL_CONST, float(value), self.lineno, column)
+                return Token(TokenType.INTEGER_CONST, int(value), self.lineno, column)
+
+        # EOF, comments, illegal characters and unicode corner cases are rare,
+        # so they simply reuse the character engine for one token
+        self._seek(pos)
+        token = self._char_next_token()
+        self._line_start = self.pos - self.column + (self.current_char is not None)
+        return token
+
+    def _regex_lazy_next_token(self):
+        '''
+        function: _regex_next_token for positions='lazy', a token only records the
+        offset of its lexeme, newlines are never counted while scanning
+        '''
+        match = _MASTER_PATTERN.match(self.text, self.pos)
+        if self._chunks is not None:
+            match = self._regex_refill(match)
+        text = self.text
+        pos = self.pos
+        if match is not None:
+            group = match.lastindex
+            start, end = match.span(group)
+            value = match.group(group)
+            next_char = text[end] if end < len(text) else None
+            if group == _OP_GROUP or (value.isascii() and (next_char is None or next_char.isascii())):
+                self.pos = end
+                self.current_char = next_char
+                offset = self._base + start
+
+                if group == _OP_GROUP:
+                    return LazyToken(OPERATOR_TOKENS[value], value, offset, self.lines)
+                if group == _ID_GROUP:
+                    token_type = RESERVED_KEYWORDS.get(value.upper())
+                    if token_type is None:
+                        return LazyToken(TokenType.ID, intern(value), offset, self.lines)
+                    return LazyToken(token_type, value.upper(), offset, self.lines)
+                if '.' in value:
+                    return LazyToken(TokenType.REAL_CONST, float(value), offset, self.lines)
+                return LazyToken(TokenType.INTEGER_CONST, int(value), offset, self.lines)
+
+        # the character engine needs the current line and column, look them up once
+        self.lineno, column = self.lines.position(self._base + pos)
+        self._line_start = pos - column + 1
+        self._seek(pos)
+        return self._char_next_token()
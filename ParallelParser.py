@@ -0,0 +1,174 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from Lexer import Token, TokenType, TokenArray, TOKEN_KINDS
+from Parser import Parser
+from ParserTree import Program
+
+### 扩展功能: 多进程并行语法分析
+
+# batches handed to each worker, more batches balance better but pickle more often
+BATCHES_PER_WORKER = 4
+
+
+def prescan(token_types):
+    '''
+    return the [start, end) token spans of the top-level declarations and functions,
+    found by brace matching over the token types (EOF last), or None if the top level
+    is not well-formed
+
+        type_spec ID SEMI
+        type_spec ID LPAREN ... RPAREN LBRACE ... RBRACE
+    '''
+    spans = []
+    i = 0
+    while True:
+        token_type = token_types[i]
+        if token_type == TokenType.EOF:
+            return spans
+        if token_type not in (TokenType.INT, TokenType.VOID) or token_types[i + 1] != TokenType.ID:
+            return None
+        j = i + 2
+        if token_types[j] == TokenType.SEMI:
+            spans.append((i, j + 1))
+            i = j + 1
+            continue
+        if token_types[j] != TokenType.LPAREN:
+            return None
+
+        # formal_param_list never nests parentheses
+        j += 1
+        while token_types[j] not in (
+            TokenType.RPAREN, TokenType.LPAREN, TokenType.LBRACE, TokenType.RBRACE, TokenType.EOF
+        ):
+            j += 1
+        if token_types[j] != TokenType.RPAREN or token_types[j + 1] != TokenType.LBRACE:
+            return None
+
+        depth = 0
+        j += 1
+        while True:
+            token_type = token_types[j]
+            if token_type == TokenType.LBRACE:
+                depth += 1
+            elif token_type == TokenType.RBRACE:
+                depth -= 1
+                if depth == 0:
+                    break
+            elif token_type == TokenType.EOF:
+                return None
+            j += 1
+        spans.append((i, j + 1))
+        i = j + 1
+
+
+def make_batches(spans, n_batches):
+    '''group consecutive spans into at most n_batches [start, end) ranges of similar token count'''
+    total = spans[-1][1] - spans[0][0]
+    batches = []
+    start = spans[0][0]
+    for span_start, span_end in spans:
+        if span_end - start >= total / n_batches:
+            batches.append((start, span_end))
+            start = span_end
+    if start != spans[-1][1]:
+        batches.append((start, spans[-1][1]))
+    return batches
+
+
+def parse_batch(tokens, parser_options):
+    '''
+    worker: parse the declarations and functions of one batch,
+    return (nodes, err_list), or None if the parser did not stop exactly at the
+    end of the batch, i.e. its result depends on the tokens that follow
+    '''
+    parser = Parser(tokens, **parser_options)
+    root = parser.program()
+    if parser.current_token.type != TokenType.EOF:
+        return None
+    # the batch has no EOF token of its own, an error on it belongs to the next batch
+    if any(err.token.type == TokenType.EOF for err in parser.err_list):
+        return None
+    return root.children, parser.err_list
+
+
+class ParallelParser:
+    '''
+    Parses the top-level declarations and functions of a token stream in a process pool.
+
+    prescan() finds the top-level spans by brace matching, consecutive spans are
+    grouped into batches, and every batch is parsed by a Parser in a worker. The
+    nodes are stitched into one Program in source order and the errors merged in
+    the same order, so tree and err_list equal those of Parser.parseProcCall().
+
+    A malformed top level makes prescan() give up, and a batch that does not parse
+    to its own end is parsed again sequentially together with the rest of the
+    program; `fallback` tells which happened.
+
+    parser = ParallelParser(lexer.get_all_tokens()[1], workers=4)
+    tree = parser.parseProcCall()
+    '''
+    def __init__(self, tokens, workers=None, executor=None, **parser_options):
+        '''
+        tokens:         a token list or TokenArray, a TokenArray is cheaper to send to the workers
+        workers:        size of the process pool, os.cpu_count() if None
+        executor:       a running executor to use instead of a new pool,
+                        `workers` then only decides the number of batches
+        parser_options: passed to every Parser, i.e. expr_engine, mode
+        '''
+        if isinstance(tokens, TokenArray):
+            self.token_types = [TOKEN_KINDS[kind] for kind in tokens.kinds]
+        else:
+            self.token_types = [token.type for token in tokens]
+        if not self.token_types or self.token_types[-1] != TokenType.EOF:
+            tokens = tokens[:]
+            tokens.append(Token(TokenType.EOF, None))
+            self.token_types.append(TokenType.EOF)
+        self.tokens = tokens
+        self.workers = workers
+        self.executor = executor
+        self.parser_options = parser_options
+        self.err_list = []
+        # None, 'prescan' or the token index the sequential parse started from
+        self.fallback = None
+
+    def getErrList(self):
+        return self.err_list
+
+    def parseProcCall(self):
+        spans = prescan(self.token_types)
+        if not spans:
+            self.fallback = 'prescan'
+            return self.parse_sequential(0)
+
+        if self.executor is not None:
+            return self.parse_batches(self.executor, spans)
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            return self.parse_batches(executor, spans)
+
+    def parse_batches(self, executor, spans):
+        workers = self.workers or os.cpu_count() or 1
+        batches = make_batches(spans, workers * BATCHES_PER_WORKER)
+        results = executor.map(
+            parse_batch,
+            [self.tokens[start:end] for start, end in batches],
+            [self.parser_options] * len(batches),
+        )
+
+        root = Program()
+        for (start, end), result in zip(batches, results):
+            if result is None:
+                self.fallback = start
+                tail = self.parse_sequential(start)
+                root.children.extend(tail.children)
+                break
+            nodes, err_list = result
+            root.children.extend(nodes)
+            self.err_list.extend(err_list)
+        return root
+
+    def parse_sequential(self, start):
+        parser = Parser(self.tokens[start:], **self.parser_options)
+        root = parser.parseProcCall()
+        self.err_list.extend(parser.getErrList())
+        return root
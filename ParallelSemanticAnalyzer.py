@@ -0,0 +1,157 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from ParserTree import Function
+from SemanticAnalyzer import SemanticAnalyzer, ProcedureSymbol
+from ParallelParser import BATCHES_PER_WORKER, make_batches
+
+### 扩展功能: 两阶段并行语义分析
+
+class BodyChecker(SemanticAnalyzer):
+    '''SemanticAnalyzer of the function bodies in a worker, remembers the ProcedureCalls it resolved'''
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.calls = []
+
+    def enter_ProcedureCall(self, node):
+        self.calls.append(node)
+        return super().enter_ProcedureCall(node)
+
+
+def check_batch(declared, functions, analyzer_options):
+    '''
+    worker: check the bodies of `functions`, (child index, Function) pairs in source order.
+    `declared` are the (child index, symbol) global declarations they can see: every
+    ProcedureSymbol, and the VarSymbols declared before the last function.
+    return (functions, (ProcedureCall node, child index of the Function it resolved
+    to or None) pairs, the err_list of every function)
+    '''
+    checker = BodyChecker(**analyzer_options)
+    checker.enter_Program(None)
+    scope = checker.current_scope
+    # a function sees, as SemanticAnalyzer does, every global declared before it;
+    # a function not defined yet resolves to its first definition
+    for index, symbol in reversed(declared):
+        if isinstance(symbol, ProcedureSymbol):
+            scope.insert(symbol)
+    pending = list(reversed(declared))
+
+    errors = []
+    for index, function in functions:
+        while pending and pending[-1][0] < index:
+            scope.insert(pending.pop()[1])
+        before = len(checker.err_list)
+        checker.walk(function)
+        errors.append(checker.err_list[before:])
+
+    # the symbols a call can resolve to: the declared ones and those of the functions walked here
+    owners = {id(symbol): index for index, symbol in declared if isinstance(symbol, ProcedureSymbol)}
+    owners.update((id(function.proc_symbol), index) for index, function in functions)
+    calls = [(call, owners.get(id(call.proc_symbol))) for call in checker.calls]
+    return functions, calls, errors
+
+
+class ParallelSemanticAnalyzer:
+    '''
+    Semantic analysis in two phases, the function bodies checked in a process pool.
+
+    The first phase walks the top level in this process: it declares the global
+    variables, with their duplicate checks, and collects the ProcedureSymbol of every
+    Function. The second phase checks the function bodies in batches of consecutive
+    functions, every batch in a worker that sees the global variables and functions
+    declared before each function. The checked Functions replace those of the tree,
+    calls are pointed at the ProcedureSymbols of this process, of the Function the
+    worker resolved them to, and err_list is merged in source order.
+
+    Unlike SemanticAnalyzer a function can call one that is defined after it, the
+    first definition of the name if it is defined more than once.
+    Otherwise tree annotations and err_list equal those of SemanticAnalyzer, and an
+    exception raised by a check is raised again by visit().
+
+    analyzer = ParallelSemanticAnalyzer(workers=4)
+    analyzer.visit(tree)
+    print(analyzer.getErrList())
+    '''
+    def __init__(self, workers=None, executor=None, **analyzer_options):
+        '''
+        workers:            size of the process pool, os.cpu_count() if None,
+                            0 checks the bodies in this process
+        executor:           a running executor to use instead of a new pool,
+                            `workers` then only decides the number of batches
+        analyzer_options:   passed to every SemanticAnalyzer, i.e. resolve_slots, symbol_table
+        '''
+        self.workers = workers
+        self.executor = executor
+        self.analyzer_options = analyzer_options
+        self.err_list = []
+
+    def getErrList(self):
+        return self.err_list
+
+    def declare(self, tree):
+        '''
+        first phase: return the (child index, symbol) of every global declaration and
+        the err_list of every other top-level child, by child index
+        '''
+        analyzer = SemanticAnalyzer(**self.analyzer_options)
+        analyzer.enter_Program(tree)
+        declared = []
+        errors = {}
+        for index, child in enumerate(tree.children):
+            if isinstance(child, Function):
+                symbol = analyzer.procedure_symbol(child)
+                analyzer.current_scope.insert(symbol)
+                declared.append((index, symbol))
+                continue
+            # a VarDecl, or the NoOp of an empty program or of a parse error
+            before = len(analyzer.err_list)
+            analyzer.walk(child)
+            errors[index] = analyzer.err_list[before:]
+            if type(child).__name__ == 'VarDecl':
+                declared.append((index, analyzer.current_scope.lookup(child.var.value)))
+        return declared, errors
+
+    def visit(self, tree):
+        self.err_list = []
+        declared, errors = self.declare(tree)
+        functions = [(index, child) for index, child in enumerate(tree.children) if isinstance(child, Function)]
+        if not functions:
+            self.merge(tree, [], errors)
+            return
+
+        workers = self.workers
+        if workers is None:
+            workers = os.cpu_count() or 1
+        batches = make_batches([(n, n + 1) for n in range(len(functions))], max(workers, 1) * BATCHES_PER_WORKER)
+        jobs = ([], [], [self.analyzer_options] * len(batches))
+        for start, end in batches:
+            last = functions[end - 1][0]
+            jobs[0].append([
+                (index, symbol) for index, symbol in declared
+                if isinstance(symbol, ProcedureSymbol) or index < last
+            ])
+            jobs[1].append(functions[start:end])
+
+        if workers == 0:
+            self.merge(tree, map(check_batch, *jobs), errors)
+        elif self.executor is not None:
+            self.merge(tree, self.executor.map(check_batch, *jobs), errors)
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                self.merge(tree, executor.map(check_batch, *jobs), errors)
+
+    def merge(self, tree, results, errors):
+        '''put the checked Functions of `results` into `tree`, then merge the errors in source order'''
+        calls = []
+        for checked, batch_calls, batch_errors in results:
+            for (index, function), function_errors in zip(checked, batch_errors):
+                tree.children[index] = function
+                errors[index] = function_errors
+            calls.extend(batch_calls)
+        # a worker resolved calls to its own copies of the symbols,
+        # point them at the ProcedureSymbol of the same Function in the tree
+        for call, index in calls:
+            if index is not None:
+                call.proc_symbol = tree.children[index].proc_symbol
+        for index in sorted(errors):
+            self.err_list.extend(errors[index])
@@ -1,17 +1,125 @@
+from collections import deque
+from functools import partial
+
 from Error_Detection import ParserError, ErrorCode
-from Lexer import TokenType, Lexer
+from Lexer import TokenType, Token, Lexer
 from ParserTree import *
 
+# binding power of every binary operator for Parser.pratt_expr, higher binds tighter;
+# all of them are left-associative, so a new operator is one more entry here
+BINARY_BINDING_POWER = {
+    # relop
+    TokenType.LT:           10,
+    TokenType.LTE:          10,
+    TokenType.LG:           10,
+    TokenType.LGE:          10,
+    TokenType.EQUAL:        10,
+    TokenType.NOT_EQUAL:    10,
+    # relop_term
+    TokenType.PLUS:         20,
+    TokenType.MINUS:        20,
+    # term
+    TokenType.MUL:          30,
+    TokenType.DIV:          30,
+}
+
+EXPR_ENGINES = ('descent', 'pratt')
+
+PARSE_MODES = ('recursive', 'stack')
+
+# rules that can nest, replaced by their stack_* generator in the 'stack' mode
+STACK_RULES = ('program', 'block', 'compound_statement', 'statement', 'expr')
+
+# tokens the grammar needs to see past current_token, i.e. factor: ID LPAREN -> proccall
+LOOKAHEAD = 1
+
+
+class TokenStream:
+    '''
+    k-token lookahead over any token source:
+        a Lexer (or anything with get_next_token), a list, a TokenArray or a generator
+
+    tokens are pulled from the source only when needed, so a Lexer is still run
+    interleaved with the parser, while a pre-lexed list may come from a cache,
+    another thread or another process. a source that ends without an EOF token
+    gets one, and EOF is repeated once the source is exhausted.
+    '''
+    def __init__(self, source, lookahead=LOOKAHEAD):
+        if lookahead < 1:
+            raise ValueError(f'lookahead must be at least 1, got {lookahead}')
+        self.lookahead = lookahead
+        if hasattr(source, 'get_next_token'):
+            self._source = source.get_next_token
+        else:
+            self._source = partial(next, iter(source), None)
+        self._buffer = deque()
+        self._eof = None
+
+    def _pull(self):
+        if self._eof is not None:
+            return self._eof
+        token = self._source()
+        if token is None:
+            token = Token(TokenType.EOF, None)
+        if token.type == TokenType.EOF:
+            self._eof = token
+        return token
+
+    def get_next_token(self):
+        if self._buffer:
+            return self._buffer.popleft()
+        return self._pull()
+
+    def peek(self, n=1):
+        '''the n-th token after the one get_next_token() returned last, 1 <= n <= lookahead'''
+        if not 1 <= n <= self.lookahead:
+            raise IndexError(f'peek({n}) is out of the lookahead of {self.lookahead} tokens')
+        buffer = self._buffer
+        while len(buffer) < n:
+            buffer.append(self._pull())
+        return buffer[n - 1]
+
+
 class Parser:
-    def __init__(self, lexer):
+    def __init__(self, lexer, expr_engine='descent', lookahead=LOOKAHEAD, mode='recursive'):
+        '''
+        lexer:
+            the token source, see TokenStream
+        expr_engine:
+            'descent': expr -> relop_term -> term -> factor, one method per precedence level
+            'pratt':   pratt_expr, precedence climbing over BINARY_BINDING_POWER,
+                       builds the same BinOp trees and reports the same errors
+        lookahead:
+            tokens that can be peeked past current_token
+        mode:
+            'recursive': one Python call per nested rule
+            'stack':     the STACK_RULES run as generators on an explicit stack (run_stack),
+                         so nesting depth is bounded by memory instead of the recursion limit;
+                         expressions always climb precedence like 'pratt'
+        '''
+        if expr_engine not in EXPR_ENGINES:
+            raise ValueError(f'unknown expression engine: {expr_engine!r}')
+        if mode not in PARSE_MODES:
+            raise ValueError(f'unknown parse mode: {mode!r}')
         self.lexer = lexer
+        self.tokens = TokenStream(lexer, lookahead)
+        self.get_next_token = self.tokens.get_next_token
         # set current token to the first token taken from the input
         self.current_token = self.get_next_token()
         # log errors to be used in UI
         self.err_list = []
+        if expr_engine == 'pratt':
+            self.expr = self.pratt_expr
+        if mode == 'stack':
+            for rule in STACK_RULES:
+                setattr(self, rule, partial(self.run_stack, getattr(self, 'stack_' + rule)))
 
     def get_next_token(self):
-        return self.lexer.get_next_token()
+        return self.tokens.get_next_token()
+
+    def peek(self, n=1):
+        '''the n-th token after current_token'''
+        return self.tokens.peek(n)
 
     def getErrList(self):
         return self.err_list
@@ -357,6 +465,34 @@ class Parser:
         return node    
 
 
+    def pratt_expr(self, min_bp=0):
+        '''
+        expr : factor ( binop factor )*    -- binop, precedence: BINARY_BINDING_POWER
+
+        the right operand only takes operators that bind tighter than `min_bp`,
+        e.g. a-b*c<d  ->  BinOp(BinOp(a, -, BinOp(b, *, c)), <, d)
+        '''
+        token = self.current_token
+        # most operands are plain literals, skip the call to factor() for them
+        if token.type == TokenType.INTEGER_CONST:
+            self.eat(TokenType.INTEGER_CONST)
+            node = Num(token)
+        else:
+            node = self.factor()
+
+        while True:
+            token = self.current_token
+            binding_power = BINARY_BINDING_POWER.get(token.type)
+            if binding_power is None or binding_power <= min_bp:
+                return node
+            self.eat(token.type)
+            node = BinOp(
+                left = node,
+                op = token,
+                right = self.pratt_expr(binding_power)
+            )
+
+
     def relop(self):
         '''relop : LT | LTE | LG | LGE | EQUAL | NOT_EQUAL'''
         token = self.current_token
@@ -415,7 +551,7 @@ class Parser:
             node = self.expr()
             self.eat(TokenType.RPAREN)
             return node
-        elif token.type == TokenType.ID and self.lexer.current_char == '(':
+        elif token.type == TokenType.ID and self.peek().type == TokenType.LPAREN:
             node = self.proccall()
         elif token.type == TokenType.ID:
             node = self.variable()
@@ -462,6 +598,205 @@ class Parser:
         return node
         
     
+    ### explicit-stack mode
+    # every stack_* rule is a generator mirroring the recursive rule of the same name:
+    # it yields the generator of a nested rule and is resumed with the node it built
+
+    def run_stack(self, rule, *args):
+        '''drive the generator `rule` and all the rules it nests, return its node'''
+        stack = [rule(*args)]
+        node = None
+        while stack:
+            try:
+                nested = stack[-1].send(node)
+            except StopIteration as stop:
+                stack.pop()
+                node = stop.value
+            else:
+                stack.append(nested)
+                node = None
+        return node
+
+
+    def stack_program(self):
+        '''program : ( type_spec variable SEMI | type_spec variable LPAREN formal_param_list RPAREN block )+'''
+        func_list = []
+
+        while self.current_token.type in (TokenType.INT, TokenType.VOID):
+            type_node = self.type_spec()
+            var_node  = self.variable()
+            if self.current_token.type == TokenType.SEMI:
+                self.eat(TokenType.SEMI)
+                node = VarDecl(var_node, type_node)
+            elif self.current_token.type == TokenType.LPAREN:
+                self.eat(TokenType.LPAREN)
+                program_params = self.formal_param_list()
+                self.eat(TokenType.RPAREN)
+                program_block = yield self.stack_block()
+                node = Function(
+                    type = type_node,
+                    name = var_node.value,
+                    formal_params = program_params,
+                    block = program_block
+                )
+            else:
+                node = NoOp()
+                self.error(
+                    error_code=ErrorCode.UNEXPECTED_TOKEN,
+                    token=self.current_token
+                )
+            func_list.append(node)
+
+        if not func_list:
+            func_list.append(NoOp())
+
+        root = Program()
+        root.children.extend(func_list)
+        return root
+
+
+    def stack_block(self):
+        '''block : LBRACE declarations compound_statement RBRACE'''
+        self.eat(TokenType.LBRACE)
+        declarations = self.declarations()
+        compound_statement = yield self.stack_compound_statement()
+        self.eat(TokenType.RBRACE)
+        return Block(
+            declarations = declarations,
+            compound_statement = compound_statement
+        )
+
+
+    def stack_compound_statement(self):
+        '''compound_statement : ( statement )+'''
+        statement_list = []
+
+        while self.current_token.type in (TokenType.ID, TokenType.RETURN, TokenType.IF, TokenType.WHILE):
+            statement = yield self.stack_statement()
+            statement_list.append(statement)
+
+        if not statement_list:
+            statement_list.append(NoOp())
+
+        root = Compound()
+        root.children.extend(statement_list)
+        return root
+
+
+    def stack_statement(self):
+        '''
+        statement : assignment_statement | return_statement | while_statement | if_statement
+        the four statements are inlined, one generator per statement
+        '''
+        token = self.current_token
+        if token.type == TokenType.ID:
+            # assignment_statement : ID ASSIGN expr SEMI
+            left = self.variable()
+            token = self.current_token
+            self.eat(TokenType.ASSIGN)
+            right = yield self.stack_expr()
+            self.eat(TokenType.SEMI)
+            return Assign(
+                left = left,
+                op = token,
+                right = right
+            )
+        elif token.type == TokenType.RETURN:
+            # return_statement : RETURN ( expr )? SEMI
+            self.eat(TokenType.RETURN)
+            if self.current_token.type != TokenType.SEMI:
+                expr = yield self.stack_expr()
+            else:
+                expr = NoOp()
+            self.eat(TokenType.SEMI)
+            return Return(
+                op = token,
+                expr = expr
+            )
+        elif token.type == TokenType.IF:
+            # if_statement : IF LPAREN expr RPAREN block ( ELSE block )?
+            self.eat(TokenType.IF)
+            self.eat(TokenType.LPAREN)
+            expr = yield self.stack_expr()
+            self.eat(TokenType.RPAREN)
+            if_block = yield self.stack_block()
+            if self.current_token.type == TokenType.ELSE:
+                self.eat(TokenType.ELSE)
+                else_block = yield self.stack_block()
+            else:
+                else_block = NoOp()
+            return If(
+                op = token,
+                expr = expr,
+                if_block = if_block,
+                else_block = else_block
+            )
+        else:
+            # while_statement : WHILE LPAREN expr RPAREN block
+            self.eat(TokenType.WHILE)
+            self.eat(TokenType.LPAREN)
+            expr = yield self.stack_expr()
+            self.eat(TokenType.RPAREN)
+            block = yield self.stack_block()
+            return While(
+                op = token,
+                expr = expr,
+                block = block
+            )
+
+
+    def stack_expr(self, min_bp=0):
+        '''expr : factor ( binop factor )*    -- as pratt_expr'''
+        token = self.current_token
+        if token.type == TokenType.LPAREN \
+            or token.type == TokenType.ID and self.peek().type == TokenType.LPAREN:
+            node = yield self.stack_factor()
+        else:
+            # a literal, a variable or an error, factor() does not nest for them
+            node = self.factor()
+
+        while True:
+            token = self.current_token
+            binding_power = BINARY_BINDING_POWER.get(token.type)
+            if binding_power is None or binding_power <= min_bp:
+                return node
+            self.eat(token.type)
+            right = yield self.stack_expr(binding_power)
+            node = BinOp(
+                left = node,
+                op = token,
+                right = right
+            )
+
+
+    def stack_factor(self):
+        '''factor : LPAREN expr RPAREN | proccall, the factors that nest'''
+        token = self.current_token
+        if token.type == TokenType.LPAREN:
+            self.eat(TokenType.LPAREN)
+            node = yield self.stack_expr()
+            self.eat(TokenType.RPAREN)
+            return node
+
+        # proccall : ID LPAREN ( expr ( COMMA expr )* )? RPAREN
+        self.eat(TokenType.ID)
+        self.eat(TokenType.LPAREN)
+        actual_params = []
+        if self.current_token.type != TokenType.RPAREN:
+            actual_params.append((yield self.stack_expr()))
+        while self.current_token.type == TokenType.COMMA:
+            self.eat(TokenType.COMMA)
+            actual_params.append((yield self.stack_expr()))
+        if not actual_params:
+            actual_params.append(NoOp())
+        self.eat(TokenType.RPAREN)
+        return ProcedureCall(
+            name = token.value,
+            actual_params = actual_params,
+            token = token
+        )
+
+
     def parse(self):
         '''
         program                 : type_spec variable LPAREN formal_param_list RPAREN block
@@ -577,10 +912,36 @@ class Parser:
 
 ### AST Visitor
 class NodeVisitor:
+    '''
+    visit(node) calls self.visit_<node class name>(node), or generic_visit(node).
+
+    The handler is looked up once per (visitor class, node class) pair: every
+    subclass gets its own _dispatch table, filled for the ParserTree classes when
+    the subclass is created and on first visit for any other node class (e.g. the
+    FlatAST views). Handlers are therefore resolved on the class, a visit_* method
+    added after the first visit of that node class is not seen.
+    '''
+    # node class -> function(visitor, node)
+    _dispatch = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._dispatch = {}
+        for node_class in AST.__subclasses__():
+            cls._resolve(node_class)
+
+    @classmethod
+    def _resolve(cls, node_class):
+        handler = getattr(cls, 'visit_' + node_class.__name__, cls.generic_visit)
+        cls._dispatch[node_class] = handler
+        return handler
+
     def visit(self, node):
-        method_name = 'visit_' + type(node).__name__
-        visitor = getattr(self, method_name, self.generic_visit)
-        return visitor(node)
+        try:
+            handler = self._dispatch[type(node)]
+        except KeyError:
+            handler = self._resolve(type(node))
+        return handler(self, node)
 
     def generic_visit(self, node):
         raise Exception('No visit_{} method'.format(type(node).__name__))
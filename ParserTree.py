@@ -1,22 +1,45 @@
 from Lexer import TokenType 
 
+# every node class lists its attributes in __slots__, no per-instance __dict__:
+# the AST is the biggest structure the compiler keeps alive.
+# analysis passes may only annotate the slots declared here:
+#   _num:           node id of ASTVisualizer, on every node
+#   type:           SemanticAnalyzer, on Var, BinOp, Num and ProcedureCall
+#   proc_symbol:    SemanticAnalyzer, on ProcedureCall and Function
+#   slot:           SemanticAnalyzer(resolve_slots=True), on Var: (scope depth, slot index)
+
 class AST:
-    pass
+    __slots__ = ('_num',)
+
+    def iter_fields(self):
+        '''yield (name, value) of every slot that is set, annotations included'''
+        for cls in reversed(type(self).__mro__):
+            for name in cls.__dict__.get('__slots__', ()):
+                try:
+                    yield name, getattr(self, name)
+                except AttributeError:
+                    pass
 
 
 class Var(AST):
+    __slots__ = ('token', 'value', 'type', 'slot')
+
     def __init__(self, token):
         self.token = token
         self.value = token.value
         # self.type would be updated in visit_var
         self.type = None
+        # (scope depth, slot index) of the declaration, see SemanticAnalyzer
+        self.slot = None
 
 
 class NoOp(AST):
-    pass
+    __slots__ = ()
 
 
 class Type(AST):
+    __slots__ = ('token', 'value')
+
     def __init__(self, token):
         self.token = token
         self.value = token.value
@@ -26,12 +49,16 @@ class Param(AST):
     '''
     parameter for functions
     '''
+    __slots__ = ('var', 'type')
+
     def __init__(self, var, type):
         self.var = var
         self.type = type
 
 
 class BinOp(AST):
+    __slots__ = ('left', 'token', 'op', 'right', 'type')
+
     def __init__(self, left, op, right):
         self.left = left
         self.token = self.op = op
@@ -41,6 +68,8 @@ class BinOp(AST):
 
 
 class Num(AST):
+    __slots__ = ('token', 'value', 'type')
+
     def __init__(self, token):
         self.token = token
         self.value = token.value
@@ -49,11 +78,15 @@ class Num(AST):
 
 
 class Program(AST):
+    __slots__ = ('children',)
+
     def __init__(self):
         self.children = []
 
 
 class Function(AST):
+    __slots__ = ('type', 'name', 'formal_params', 'block', 'proc_symbol')
+
     def __init__(self, type, name, formal_params, block):
         '''
         parameter:
@@ -66,25 +99,35 @@ class Function(AST):
         self.name = name
         self.formal_params = formal_params
         self.block = block
+        # a reference to procedure declaration symbol
+        self.proc_symbol = None
 
 
 class Block(AST):
+    __slots__ = ('declarations', 'compound_statement')
+
     def __init__(self, declarations, compound_statement):
         self.declarations = declarations
         self.compound_statement = compound_statement
 
 
 class Declaration(AST):
+    __slots__ = ('children',)
+
     def __init__(self):
         self.children = []
 
 
 class Compound(AST):
+    __slots__ = ('children',)
+
     def __init__(self):
         self.children = []
 
 
 class Assign(AST):
+    __slots__ = ('left', 'token', 'op', 'right')
+
     def __init__(self, left, op, right):
         self.left = left
         self.token = self.op = op
@@ -92,12 +135,16 @@ class Assign(AST):
 
 
 class Return(AST):
+    __slots__ = ('token', 'op', 'expr')
+
     def __init__(self, op, expr):
         self.token = self.op = op
         self.expr = expr
 
 
 class While(AST):
+    __slots__ = ('token', 'op', 'expr', 'block')
+
     def __init__(self, op, expr, block):
         self.token = self.op = op
         self.expr = expr
@@ -105,6 +152,8 @@ class While(AST):
 
 
 class If(AST):
+    __slots__ = ('token', 'op', 'expr', 'if_block', 'else_block')
+
     def __init__(self, op, expr, if_block, else_block):
         self.token = self.op = op
         self.expr = expr
@@ -116,12 +165,16 @@ class VarDecl(AST):
     '''
     declare a var
     '''
+    __slots__ = ('var', 'type')
+
     def __init__(self, var, type):
         self.var = var
         self.type = type
 
 
 class ProcedureDecl(AST):
+    __slots__ = ('proc_name', 'formal_params', 'block_node')
+
     def __init__(self, proc_name, formal_params, block_node):
         self.proc_name = proc_name
         self.formal_params = formal_params  # a list of Param nodes
@@ -129,6 +182,8 @@ class ProcedureDecl(AST):
 
 
 class ProcedureCall(AST):
+    __slots__ = ('name', 'actual_params', 'token', 'proc_symbol', 'value', 'type')
+
     def __init__(self, name, actual_params, token):
         self.name = name
         # a list of Var object or Num object
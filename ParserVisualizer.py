@@ -1,8 +1,13 @@
 import textwrap
 
-from Parser import NodeVisitor
-
-class ASTVisualizer(NodeVisitor):
+from TreeWalker import TreeWalker
+
+class ASTVisualizer(TreeWalker):
+    '''
+    DOT graph of an AST, walked without recursion:
+    enter_X numbers the node and writes its label,
+    after_child_X writes the edge to each child once the child is done
+    '''
     def __init__(self, parser):
         self.parser = parser
         self.ncount = 1
@@ -15,221 +20,103 @@ class ASTVisualizer(NodeVisitor):
         """)]
         self.dot_body = []
         self.dot_footer = ['}']
-    
-    def visit_Var(self, node):
-        s = '  node{} [label="{}"]\n'.format(self.ncount, node.value)
-        self.dot_body.append(s)
-        node._num = self.ncount
-        self.ncount += 1
 
-    def visit_NoOp(self, node):
-        s = '  node{} [label="NoOp"]\n'.format(self.ncount)
+    def add_node(self, node, label):
+        s = '  node{} [label="{}"]\n'.format(self.ncount, label)
         self.dot_body.append(s)
         node._num = self.ncount
         self.ncount += 1
 
-    def visit_Type(self, node):
-        s = '  node{} [label="{}"]\n'.format(self.ncount, node.token.value)
+    def add_edge(self, node, index, child, result):
+        s = '  node{} -> node{}\n'.format(node._num, child._num)
         self.dot_body.append(s)
-        node._num = self.ncount
-        self.ncount += 1
 
-    def visit_Param(self, node):
-        s = '  node{} [label="Param"]\n'.format(self.ncount)
-        self.dot_body.append(s)
-        node._num = self.ncount
-        self.ncount += 1
+    def enter_Var(self, node):
+        self.add_node(node, node.value)
 
-        self.visit(node.var)
-        s = '  node{} -> node{}\n'.format(node._num, node.var._num)
-        self.dot_body.append(s)
+    def enter_NoOp(self, node):
+        self.add_node(node, 'NoOp')
 
-        self.visit(node.type)
-        s = '  node{} -> node{}\n'.format(node._num, node.type._num)
-        self.dot_body.append(s)
+    def enter_Type(self, node):
+        self.add_node(node, node.token.value)
 
-    def visit_BinOp(self, node):
-        s = '  node{} [label="{}"]\n'.format(self.ncount, node.op.value)
-        self.dot_body.append(s)
-        node._num = self.ncount
-        self.ncount += 1
+    def enter_Param(self, node):
+        self.add_node(node, 'Param')
 
-        self.visit(node.left)
-        self.visit(node.right)
+    def enter_BinOp(self, node):
+        self.add_node(node, node.op.value)
 
+    def leave_BinOp(self, node, results):
+        # edges of both operands after both subtrees
         for child_node in (node.left, node.right):
             s = '  node{} -> node{}\n'.format(node._num, child_node._num)
             self.dot_body.append(s)
 
-    def visit_Num(self, node):
-        s = '  node{} [label="{}"]\n'.format(self.ncount, node.token.value)
-        self.dot_body.append(s)
-        node._num = self.ncount
-        self.ncount += 1
+    def enter_Num(self, node):
+        self.add_node(node, node.token.value)
 
-    def visit_Program(self, node):
-        s = '  node{} [label="Program"]\n'.format(self.ncount)
-        self.dot_body.append(s)
-        node._num = self.ncount
-        self.ncount += 1
+    def enter_Program(self, node):
+        self.add_node(node, 'Program')
 
-        for child in node.children:
-            self.visit(child)
-            s = '  node{} -> node{}\n'.format(node._num, child._num)
-            self.dot_body.append(s)
+    def enter_Function(self, node):
+        self.add_node(node, 'Function:{}'.format(node.name))
 
-    def visit_Function(self, node):
-        s = '  node{} [label="Function:{}"]\n'.format(self.ncount, node.name)
-        self.dot_body.append(s)
-        node._num = self.ncount
-        self.ncount += 1
-        
-        self.visit(node.type)
-        s = '  node{} -> node{}\n'.format(node._num, node.type._num)
-        self.dot_body.append(s)
+    def enter_Block(self, node):
+        self.add_node(node, 'Block')
 
-        for param_node in node.formal_params:
-            self.visit(param_node)
-            s = '  node{} -> node{}\n'.format(node._num, param_node._num)
-            self.dot_body.append(s)
+    def enter_Declaration(self, node):
+        self.add_node(node, 'Declr')
 
-        self.visit(node.block)
-        s = '  node{} -> node{}\n'.format(node._num, node.block._num)
-        self.dot_body.append(s)
-    
-    def visit_Block(self, node):
-        s = '  node{} [label="Block"]\n'.format(self.ncount)
-        self.dot_body.append(s)
-        node._num = self.ncount
-        self.ncount += 1
+    def enter_Compound(self, node):
+        self.add_node(node, 'Compound')
 
-        self.visit(node.declarations)
-        s = '  node{} -> node{}\n'.format(
-            node._num,
-            node.declarations._num
-        )
-        self.dot_body.append(s)
+    def enter_Assign(self, node):
+        self.add_node(node, node.op.value)
 
-        self.visit(node.compound_statement)
-        s = '  node{} -> node{}\n'.format(
-            node._num,
-            node.compound_statement._num
-        )
-        self.dot_body.append(s)
+    leave_Assign = leave_BinOp
 
-    def visit_Declaration(self, node):
-        s = '  node{} [label="Declr"]\n'.format(self.ncount)
-        self.dot_body.append(s)
-        node._num = self.ncount
-        self.ncount += 1
+    def enter_Return(self, node):
+        self.add_node(node, node.op.value)
 
-        for child in node.children:
-            self.visit(child)
-            s = '  node{} -> node{}\n'.format(node._num, child._num)
-            self.dot_body.append(s)
+    def enter_While(self, node):
+        self.add_node(node, node.op.value)
 
-    def visit_Compound(self, node):
-        s = '  node{} [label="Compound"]\n'.format(self.ncount)
-        self.dot_body.append(s)
-        node._num = self.ncount
-        self.ncount += 1
+    def enter_If(self, node):
+        self.add_node(node, node.op.value)
 
-        for child in node.children:
-            self.visit(child)
-            s = '  node{} -> node{}\n'.format(node._num, child._num)
-            self.dot_body.append(s)
+    def enter_VarDecl(self, node):
+        self.add_node(node, 'VarDecl')
 
-    def visit_Assign(self, node):
-        s = '  node{} [label="{}"]\n'.format(self.ncount, node.op.value)
-        self.dot_body.append(s)
-        node._num = self.ncount
-        self.ncount += 1
+    def enter_ProcedureCall(self, node):
+        self.add_node(node, 'ProcCall:{}'.format(node.name))
 
-        self.visit(node.left)
-        self.visit(node.right)
+    after_child_Param = add_edge
+    after_child_Program = add_edge
+    after_child_Function = add_edge
+    after_child_Block = add_edge
+    after_child_Declaration = add_edge
+    after_child_Compound = add_edge
+    after_child_Return = add_edge
+    after_child_While = add_edge
+    after_child_If = add_edge
+    after_child_VarDecl = add_edge
+    after_child_ProcedureCall = add_edge
 
-        for child_node in (node.left, node.right):
-            s = '  node{} -> node{}\n'.format(node._num, child_node._num)
-            self.dot_body.append(s)
-
-    def visit_Return(self, node):
-        s = '  node{} [label="{}"]\n'.format(self.ncount, node.op.value)
-        self.dot_body.append(s)
-        node._num = self.ncount
-        self.ncount += 1
-
-        self.visit(node.expr)
-        s = '  node{} -> node{}\n'.format(node._num, node.expr._num)
-        self.dot_body.append(s)
-
-    def visit_While(self, node):
-        s = '  node{} [label="{}"]\n'.format(self.ncount, node.op.value)
-        self.dot_body.append(s)
-        node._num = self.ncount
-        self.ncount += 1
-
-        self.visit(node.expr)
-        s = '  node{} -> node{}\n'.format(node._num, node.expr._num)
-        self.dot_body.append(s)
-
-        self.visit(node.block)
-        s = '  node{} -> node{}\n'.format(node._num, node.block._num)
-        self.dot_body.append(s)
-
-    def visit_If(self, node):
-        s = '  node{} [label="{}"]\n'.format(self.ncount, node.op.value)
-        self.dot_body.append(s)
-        node._num = self.ncount
-        self.ncount += 1
-
-        self.visit(node.expr)
-        s = '  node{} -> node{}\n'.format(node._num, node.expr._num)
-        self.dot_body.append(s)
-
-        self.visit(node.if_block)
-        s = '  node{} -> node{}\n'.format(node._num, node.if_block._num)
-        self.dot_body.append(s)
-
-        self.visit(node.else_block)
-        s = '  node{} -> node{}\n'.format(node._num, node.else_block._num)
-        self.dot_body.append(s)
-
-    def visit_VarDecl(self, node):
-        s = '  node{} [label="VarDecl"]\n'.format(self.ncount)
-        self.dot_body.append(s)
-        node._num = self.ncount
-        self.ncount += 1
-
-        self.visit(node.var)
-        s = '  node{} -> node{}\n'.format(node._num, node.var._num)
-        self.dot_body.append(s)
-
-        self.visit(node.type)
-        s = '  node{} -> node{}\n'.format(node._num, node.type._num)
-        self.dot_body.append(s)
-
-    def visit_ProcedureCall(self, node):
-        s = '  node{} [label="ProcCall:{}"]\n'.format(
-            self.ncount,
-            node.name
-        )
-        self.dot_body.append(s)
-        node._num = self.ncount
-        self.ncount += 1
-
-        for param_node in node.actual_params:
-            self.visit(param_node)
-            s = '  node{} -> node{}\n'.format(node._num, param_node._num)
-            self.dot_body.append(s)
-
-    def gendot(self):
+    def gendot(self, tree=None):
         '''
         parser = Parser(lexer)
         viz = ASTVisualizer(parser)
         content = viz.gendot()
         print(content)
+
+        an already parsed `tree` (e.g. from ProgramCache) is used as is
         '''
         # tree = self.parser.parse()
-        tree = self.parser.parseProcCall()
-        self.visit(tree)
+        if tree is None:
+            tree = self.parser.parseProcCall()
+        self.walk(tree)
+        return self.getdot()
+
+    def getdot(self):
+        '''the DOT text of the tree walked so far'''
         return ''.join(self.dot_header + self.dot_body + self.dot_footer)
@@ -0,0 +1,152 @@
+import time
+
+from Lexer import Lexer
+from Parser import Parser
+from SemanticAnalyzer import SemanticAnalyzer
+from ParserVisualizer import ASTVisualizer
+from IntermediateCodeGenerator import IRGenerator
+from RunTimeAnalyzer import RuntimeAnalyzer
+from TreeWalker import FusedWalker
+
+### 扩展功能: 一次遍历完成多趟分析的流水线
+
+# every pass, in the order they run
+PASSES = ('semantic', 'dot', 'ir', 'runtime')
+# TreeWalker passes, these share one walk of the tree
+FUSABLE = ('semantic', 'dot', 'ir')
+# pass -> passes whose annotations it reads, e.g. RuntimeAnalyzer needs proc_symbol
+REQUIRES = {
+    'runtime': ('semantic',),
+}
+
+
+def make_pass(name):
+    '''a fresh analyzer for pass `name`'''
+    if name == 'semantic':
+        return SemanticAnalyzer()
+    if name == 'dot':
+        return ASTVisualizer(None)
+    if name == 'ir':
+        return IRGenerator(None)
+    if name == 'runtime':
+        return RuntimeAnalyzer()
+    raise ValueError(f'unknown pass {name!r}, expected one of {PASSES}')
+
+
+class PipelineResult:
+    '''
+    everything one Pipeline.run() produces
+        tree:               Program node, annotated by the passes
+        lexer_errors:       Lexer.err_list
+        parser_errors:      Parser.err_list
+        passes:             pass name -> the analyzer that ran it
+        exceptions:         pass name -> exception that stopped the pass
+        timings:            'parse', every pass or 'walk' for the fused ones, 'total'; in seconds
+        semantic_errors:    SemanticAnalyzer.err_list, if 'semantic' ran
+        dot:                the DOT text, if 'dot' ran
+        code:               IRGenerator.code, the IR.Instructions, if 'ir' ran
+    '''
+    def __init__(self, tree, lexer_errors, parser_errors):
+        self.tree = tree
+        self.lexer_errors = lexer_errors
+        self.parser_errors = parser_errors
+        self.passes = {}
+        self.exceptions = {}
+        self.timings = {}
+        self.semantic_errors = None
+        self.dot = None
+        self.code = None
+
+
+class Pipeline:
+    '''
+    Parses a program once and runs a set of passes over the same tree.
+
+    With `fused` the TreeWalker passes (FUSABLE) run in a single FusedWalker walk,
+    in PASSES order, so SemanticAnalyzer's annotations are on a node before the
+    later passes leave it. Passes that need a whole annotated tree (RuntimeAnalyzer
+    interprets the program) run afterwards on their own. Without `fused` every pass
+    walks the tree separately, which gives the same results and is the baseline of
+    `python Benchmark.py pipeline`.
+
+    A pass that raises stops, the exception is kept in result.exceptions and the
+    other passes still run.
+
+    pipeline = Pipeline(('semantic', 'dot', 'ir'))
+    result = pipeline.run(text)
+    print(result.dot)
+    print(result.timings)
+    '''
+    def __init__(self, passes=FUSABLE, fused=True, profile=False, engine='regex', cache=None):
+        '''
+        passes:     names from PASSES, the passes they REQUIRE are added
+        profile:    time every fused pass too, at the cost of a clock read per hook call
+        engine:     Lexer engine
+        cache:      a ProgramCache to parse through
+        '''
+        wanted = set()
+        for name in passes:
+            if name not in PASSES:
+                raise ValueError(f'unknown pass {name!r}, expected one of {PASSES}')
+            wanted.add(name)
+            wanted.update(REQUIRES.get(name, ()))
+        self.passes = [name for name in PASSES if name in wanted]
+        self.fused = fused
+        self.profile = profile
+        self.engine = engine
+        self.cache = cache
+
+    def parse(self, text):
+        if self.cache is not None:
+            parsed = self.cache.parse(text)
+            return PipelineResult(parsed.tree, parsed.lexer_errors, parsed.parser_errors)
+        lexer = Lexer(text, self.engine)
+        _, token_list = lexer.get_all_tokens()
+        parser = Parser(token_list)
+        tree = parser.parseProcCall()
+        return PipelineResult(tree, lexer.err_list, parser.getErrList())
+
+    def run(self, text):
+        start = time.perf_counter()
+        result = self.parse(text)
+        result.timings['parse'] = time.perf_counter() - start
+        self.run_passes(result)
+        result.timings['total'] = time.perf_counter() - start
+        return result
+
+    def run_passes(self, result):
+        '''run the passes over result.tree'''
+        fused = []
+        for name in self.passes:
+            result.passes[name] = make_pass(name)
+            if self.fused and name in FUSABLE:
+                fused.append(name)
+
+        if fused:
+            walker = FusedWalker([result.passes[name] for name in fused], timed=self.profile)
+            start = time.perf_counter()
+            walker.walk(result.tree)
+            result.timings['walk'] = time.perf_counter() - start
+            for index, name in enumerate(fused):
+                if index in walker.failed:
+                    result.exceptions[name] = walker.failed[index]
+                if self.profile:
+                    result.timings[name] = walker.elapsed[index]
+
+        for name in self.passes:
+            if name in fused:
+                continue
+            start = time.perf_counter()
+            try:
+                result.passes[name].visit(result.tree)
+            except Exception as exc:
+                result.exceptions[name] = exc
+            result.timings[name] = time.perf_counter() - start
+
+        if 'semantic' in result.passes:
+            result.semantic_errors = result.passes['semantic'].getErrList()
+        if 'dot' in result.passes:
+            result.dot = result.passes['dot'].getdot()
+        if 'ir' in result.passes:
+            result.code = result.passes['ir'].code
+        return result
@@ -0,0 +1,188 @@
+import gc
+import hashlib
+import os
+import pickle
+import zlib
+
+import Error_Detection
+import Lexer as lexer_module
+import Parser as parser_module
+import ParserTree
+from Lexer import Lexer
+from Parser import Parser
+
+### 扩展功能: 词法/语法分析结果缓存
+
+def _compiler_version():
+    '''
+    digest of the modules that decide the token stream and the AST,
+    so that editing any of them invalidates every cached program
+    '''
+    digest = hashlib.sha256()
+    for module in (lexer_module, parser_module, ParserTree, Error_Detection):
+        with open(module.__file__, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+COMPILER_VERSION = _compiler_version()
+
+# default size bound of a cache directory, in bytes
+MAX_CACHE_BYTES = 256 << 20
+CACHE_SUFFIX = '.ast'
+
+
+class ParseResult:
+    '''
+    everything Lexer + Parser.parseProcCall() produce for one source text
+        tree:           Program node
+        token_list:     the full token stream, EOF included
+        lexer_errors:   Lexer.err_list
+        parser_errors:  Parser.err_list
+        hit:            True if it was loaded from the cache
+    '''
+    def __init__(self, tree, token_list, lexer_errors, parser_errors, hit=False):
+        self.tree = tree
+        self.token_list = token_list
+        self.lexer_errors = lexer_errors
+        self.parser_errors = parser_errors
+        self.hit = hit
+
+
+class ProgramCache:
+    '''
+    On-disk cache of lexed and parsed programs.
+
+    An entry is keyed by sha256(COMPILER_VERSION + source text) and holds the
+    token stream and the AST as a zlib-compressed pickle. Every hit touches the
+    entry's mtime, and when the directory grows over `max_bytes` the entries
+    with the oldest mtime are removed (LRU).
+
+    cache = ProgramCache('.cache')
+    result = cache.parse(text)
+    viz.gendot(result.tree)
+    print(cache.stats())
+    '''
+    def __init__(self, cache_dir, max_bytes=MAX_CACHE_BYTES, engine='regex'):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.engine = engine
+        os.makedirs(cache_dir, exist_ok=True)
+        # counters of this instance, see stats()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.store_errors = 0
+        # bytes in cache_dir, scanned lazily and then kept up to date by store()
+        self._total_bytes = None
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'store_errors': self.store_errors,
+        }
+
+    def key(self, text):
+        return hashlib.sha256((COMPILER_VERSION + text).encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + CACHE_SUFFIX)
+
+    def load(self, text):
+        '''return the cached ParseResult of `text`, or None'''
+        path = self._path(self.key(text))
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        # unpickling only allocates, a collection in between never frees anything
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            tree, token_list, lexer_errors, parser_errors = pickle.loads(zlib.decompress(data))
+        except Exception:
+            # corrupt, truncated or stale entry, whatever unpickling raised:
+            # drop it, the program is parsed again and stored anew
+            self._drop(path, len(data))
+            return None
+        finally:
+            if gc_enabled:
+                gc.enable()
+        os.utime(path)
+        return ParseResult(tree, token_list, lexer_errors, parser_errors, hit=True)
+
+    def _drop(self, path, size):
+        try:
+            os.remove(path)
+        except OSError:
+            return
+        if self._total_bytes is not None:
+            self._total_bytes -= size
+
+    def store(self, text, result):
+        try:
+            data = zlib.compress(pickle.dumps(
+                (result.tree, result.token_list, result.lexer_errors, result.parser_errors),
+                protocol=pickle.HIGHEST_PROTOCOL,
+            ))
+        except RecursionError:
+            # AST too deep for pickle, keep it out of the cache
+            self.store_errors += 1
+            return
+        path = self._path(self.key(text))
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        # atomic, concurrent builds never read half-written entries
+        os.replace(tmp_path, path)
+        if self._total_bytes is None:
+            self.evict()
+        else:
+            self._total_bytes += len(data)
+            if self._total_bytes > self.max_bytes:
+                self.evict()
+
+    def evict(self):
+        '''remove least recently used entries until the directory fits in max_bytes'''
+        entries = []
+        total = 0
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.name.endswith(CACHE_SUFFIX):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+        entries.sort()
+        for mtime, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            self.evictions += 1
+        self._total_bytes = total
+
+    def parse(self, text):
+        '''
+        return the ParseResult of `text`,
+        from the cache if possible, else by running Lexer + Parser and storing it
+        '''
+        result = self.load(text)
+        if result is not None:
+            self.hits += 1
+            return result
+        self.misses += 1
+
+        # lex in bulk, the cached stream is complete even if the parser stops early
+        lexer = Lexer(text, engine=self.engine)
+        token_list = lexer.get_all_tokens()[1]
+        parser = Parser(token_list)
+        tree = parser.parseProcCall()
+
+        result = ParseResult(tree, token_list, lexer.getErrList(), parser.getErrList())
+        self.store(text, result)
+        return result
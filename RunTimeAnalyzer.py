@@ -28,11 +28,14 @@ class FuncStack:
 
 
 class ActivationRecord:
-    def __init__(self, name, type, stacklvl):
+    def __init__(self, name, type, stacklvl, slot_names=()):
         self.name = name
         self.type = type
         self.stacklvl = stacklvl
         self.members = {}
+        # params and locals by slot index, see RuntimeAnalyzer(slots=True)
+        self.slot_names = slot_names
+        self.slots = [None] * len(slot_names)
     def __setitem__(self, key, value):
         self.members[key] = value
     def __getitem__(self, key):
@@ -41,6 +44,8 @@ class ActivationRecord:
         return self.members.get(key)
     def __str__(self):
         lines = [f'{self.stacklvl}: {self.type.value} {self.name}']
+        for name, val in zip(self.slot_names, self.slots):
+            lines.append(f'   {name:<20}: {val}')
         for name, val in self.members.items():
             lines.append(f'   {name:<20}: {val}')
         s = '\n'.join(lines)
@@ -50,7 +55,14 @@ class ActivationRecord:
 
 
 class RuntimeAnalyzer(NodeVisitor):
-    def __init__(self):
+    '''
+    with slots, a Var resolved by SemanticAnalyzer(resolve_slots=True) to a local
+    (scope depth 0) is read and written by index in ActivationRecord.slots; other
+    names stay in ActivationRecord.members. A slot frame logs all its locals in slot
+    order, the unassigned ones as None.
+    '''
+    def __init__(self, slots=False):
+        self.slots = slots
         self.call_stack = FuncStack()
 
     def log(self, msg):
@@ -58,8 +70,11 @@ class RuntimeAnalyzer(NodeVisitor):
             print(msg)
 
     def visit_Var(self, node):
-        var_name = node.value
         ar = self.call_stack.peek()
+        slot = node.slot
+        if self.slots and slot is not None and slot[0] == 0:
+            return ar.slots[slot[1]]
+        var_name = node.value
         var_value = ar.get(var_name)
         return var_value
 
@@ -118,7 +133,8 @@ class RuntimeAnalyzer(NodeVisitor):
             name = proc_name,
             type = ActivationRecordType.FUNCTION,
             # we dont allow function be defined within another function
-            stacklvl = 1
+            stacklvl = 1,
+            slot_names = node.proc_symbol.slot_names if self.slots and node.proc_symbol else (),
         )
         self.call_stack.push(ar)
         self.log(str(self.call_stack))
@@ -152,7 +168,11 @@ class RuntimeAnalyzer(NodeVisitor):
 
         # record the value in the function stack
         ar = self.call_stack.peek()
-        ar[var_name] = var_value
+        slot = node.left.slot
+        if self.slots and slot is not None and slot[0] == 0:
+            ar.slots[slot[1]] = var_value
+        else:
+            ar[var_name] = var_value
 
     def visit_Return(self, node):
         return self.visit(node.expr)
@@ -178,14 +198,18 @@ class RuntimeAnalyzer(NodeVisitor):
         ar = ActivationRecord(
             name = node.name,
             type = ActivationRecordType.FUNCTION,
-            stacklvl = proc_symbol.scope_level + 1
+            stacklvl = proc_symbol.scope_level + 1,
+            slot_names = proc_symbol.slot_names if self.slots else (),
         )
 
         # first visit params
         formal_params = proc_symbol.formal_params
         actual_params = node.actual_params
         for formal_param, actual_param in zip(formal_params, actual_params):
-            ar[formal_param.name] = self.visit(actual_param)
+            if ar.slots:
+                ar.slots[formal_param.slot] = self.visit(actual_param)
+            else:
+                ar[formal_param.name] = self.visit(actual_param)
         
         # then push ar into stack frame
         self.call_stack.push(ar)
@@ -0,0 +1,297 @@
+import itertools
+
+from IR import Opcode, OperandKind, Operand, Instruction, JUMP_OPCODES, temp, format_instruction, numbered, is_return_register
+from ControlFlowGraph import split_functions, ControlFlowGraph
+
+### 扩展功能: 静态单赋值形式
+
+def global_variables(tree):
+    '''the names of the global variables of a Program, to be pinned by SSAForm'''
+    return {child.var.value for child in tree.children if type(child).__name__ == 'VarDecl'}
+
+
+class Phi:
+    '''
+    result = phi(args), at the head of a block
+        name:       the Operand the Phi merges the versions of
+        result:     the Operand defined, a version of name
+        args:       an Operand per predecessor of the block, in the order of
+                    BasicBlock.predecessors; None for a predecessor not reachable from the entry
+    '''
+    __slots__ = ('name', 'result', 'args')
+
+    def __init__(self, name, args):
+        self.name = name
+        self.result = name
+        self.args = args
+
+    def operands(self):
+        return [arg for arg in self.args if arg is not None]
+
+    def __str__(self):
+        return f'{self.result} = phi({", ".join("-" if arg is None else str(arg) for arg in self.args)})'
+
+    def __repr__(self):
+        return f'Phi({self.name!r}, {self.result!r}, {self.args!r})'
+
+
+class SSAForm:
+    '''
+    Static single assignment form of one function's ControlFlowGraph.
+
+    Every temp and variable the function writes is renamed, a definition of `a`
+    becomes `a.1`, `a.2`, ... and the reads after it follow, with Phis where
+    definitions meet (placed on the iterated dominance frontiers of the names read in
+    a block before they are written there). A read that no definition reaches keeps
+    the plain name: the param, the global, the uninitialized local. A name written
+    once and never read before stays as it is, so the int_N temps keep their names.
+
+    Not renamed are the return registers (see is_return_register) and the names in
+    `pinned`: the functions share them, a call can change them. The IR does not tell
+    globals from locals, pass them as pinned (see global_variables), a local shadowing
+    a global is then pinned too.
+
+    Blocks not reachable from the entry are kept as they are. lower() is the way back
+    to three-address-code.
+
+        phis:           block index -> the Phis at its head
+        blocks:         block index -> its renamed Instructions, new copies
+        definitions:    name -> (block index, Instruction or Phi) of its definition
+        uses:           name -> [(block index, Instruction or Phi), ...] reading it
+
+    Operands are told apart by their names, as in the listing.
+
+    ssa = SSAForm(cfg, pinned=global_variables(tree))
+    code = ssa.lower()
+    '''
+    def __init__(self, cfg, pinned=()):
+        self.cfg = cfg
+        self.pinned = set(pinned)
+        # name -> renamed(), Operand.__hash__ is a Python call
+        self._renamed = {}
+        self.phis = [[] for _ in cfg.blocks]
+        self.blocks = [list(block.instructions) for block in cfg.blocks]
+        self.frontiers = self.dominance_frontiers()
+        self.place_phis()
+        self.rename()
+        self.index_operands()
+
+    def renamed(self, operand):
+        '''whether `operand` gets versions'''
+        if operand is None:
+            return False
+        known = self._renamed.get(operand.value)
+        if known is None:
+            known = self._renamed[operand.value] = (
+                operand.kind in (OperandKind.TEMP, OperandKind.VARIABLE)
+                and operand.value not in self.pinned
+                and not is_return_register(operand)
+            )
+        return known
+
+    def dominance_frontiers(self):
+        '''block index -> indices of the blocks on its dominance frontier (Cooper, Harvey and Kennedy)'''
+        cfg = self.cfg
+        idom = cfg.idom
+        frontiers = [set() for _ in cfg.blocks]
+        for index in cfg.order:
+            predecessors = [p for p in cfg.blocks[index].predecessors if idom[p] is not None]
+            if len(predecessors) < 2:
+                continue
+            for runner in predecessors:
+                while runner != idom[index]:
+                    if index in frontiers[runner]:
+                        break
+                    frontiers[runner].add(index)
+                    runner = idom[runner]
+        return frontiers
+
+    def place_phis(self):
+        # semi-pruned: only names read in some block before being written there
+        cfg = self.cfg
+        renamed = self.renamed
+        live_in = set()
+        def_blocks = {}         # name -> (Operand, indices of the blocks writing it)
+        for index in cfg.order:
+            written = set()
+            for instr in self.blocks[index]:
+                for operand in instr.operands():
+                    if operand.value not in written and renamed(operand):
+                        live_in.add(operand.value)
+                result = instr.defines()
+                if renamed(result):
+                    written.add(result.value)
+                    blocks = def_blocks.get(result.value)
+                    if blocks is None:
+                        blocks = def_blocks[result.value] = (result, [])
+                    if not blocks[1] or blocks[1][-1] != index:
+                        blocks[1].append(index)
+
+        for name, (operand, blocks) in def_blocks.items():
+            if name not in live_in:
+                continue
+            has_phi = set()
+            work = list(blocks)
+            queued = set(blocks)
+            while work:
+                index = work.pop()
+                for frontier in self.frontiers[index]:
+                    if frontier in has_phi:
+                        continue
+                    has_phi.add(frontier)
+                    self.phis[frontier].append(Phi(operand, [None] * len(cfg.blocks[frontier].predecessors)))
+                    if frontier not in queued:
+                        queued.add(frontier)
+                        work.append(frontier)
+
+    def rename(self):
+        cfg = self.cfg
+        renamed = self.renamed
+        stacks = {}             # name -> its versions in scope
+        versions = {}           # name -> [its versions]
+        read_plain = set()      # names read where no definition reaches
+
+        def current(operand):
+            if not renamed(operand):
+                return operand
+            stack = stacks.get(operand.value)
+            if stack:
+                return stack[-1]
+            read_plain.add(operand.value)
+            return operand
+
+        def define(operand, pushed):
+            name = operand.value
+            made = versions.get(name)
+            if made is None:
+                made = versions[name] = []
+                stacks[name] = []
+            version = Operand(operand.kind, f'{name}.{len(made) + 1}')
+            made.append(version)
+            stacks[name].append(version)
+            pushed.append(name)
+            return version
+
+        # the dominator tree, walked without recursion: (block index, names pushed or None before the block)
+        work = [(0, None)]
+        while work:
+            index, pushed = work.pop()
+            if pushed is not None:
+                for name in pushed:
+                    stacks[name].pop()
+                continue
+            pushed = []
+            work.append((index, pushed))
+
+            for phi in self.phis[index]:
+                phi.result = define(phi.name, pushed)
+            instructions = self.blocks[index]
+            for position, instr in enumerate(instructions):
+                left, right, result = instr.left, instr.right, instr.result
+                if instr.opcode is not Opcode.CALL:
+                    if left is not None:
+                        left = current(left)
+                    if right is not None:
+                        right = current(right)
+                if renamed(instr.defines()):
+                    result = define(result, pushed)
+                instructions[position] = Instruction(instr.opcode, left, right, result, instr.index)
+
+            for successor in cfg.blocks[index].successors:
+                # the position of this block among the predecessors of the successor
+                slot = cfg.blocks[successor].predecessors.index(index)
+                for phi in self.phis[successor]:
+                    phi.args[slot] = current(phi.name)
+            for child in reversed(cfg.dominator_children[index]):
+                work.append((child, None))
+
+        # written once and never read plain: the name needs no version
+        for name, made in versions.items():
+            if len(made) == 1 and name not in read_plain:
+                made[0].value = name
+
+    def index_operands(self):
+        definitions = self.definitions = {}
+        uses = self.uses = {}
+        for index in self.cfg.order:
+            for phi in self.phis[index]:
+                definitions[phi.result.value] = (index, phi)
+                for operand in phi.operands():
+                    if operand.kind is not OperandKind.CONSTANT:
+                        uses.setdefault(operand.value, []).append((index, phi))
+            for instr in self.blocks[index]:
+                result = instr.defines()
+                if result is not None:
+                    definitions[result.value] = (index, instr)
+                for operand in instr.operands():
+                    if operand.kind is not OperandKind.CONSTANT:
+                        uses.setdefault(operand.value, []).append((index, instr))
+
+    def listing(self, first_lineno=100):
+        '''the text of the SSA form, numbered like format_code(), the Phis after the label of their block'''
+        lines = []
+        instructions = [instr for block in self.blocks for instr in block]
+        lines_of = {id(instr): lineno for lineno, instr in numbered(instructions, first_lineno)}
+        for index, block in enumerate(self.blocks):
+            phis = [f'      {phi}' for phi in self.phis[index]]
+            for instr in block:
+                if not (instr is block[0] and instr.opcode in (Opcode.FUNCTION, Opcode.LABEL)):
+                    lines.extend(phis)
+                    phis = []
+                lines.append(format_instruction(instr, lines_of[id(instr)]))
+            lines.extend(phis)
+        return lines
+
+    def lower(self, phi_temps=None):
+        '''
+        the function as three-address-code again, new Instructions indexed from 0.
+        a Phi `x = phi(a, b)` becomes `x = phi_N` after the label of its block and
+        `phi_N = a` / `phi_N = b` at the end of the predecessors, before their jump;
+        through its own phi_N temp no copy can overwrite what another copy reads
+
+        phi_temps: iterator of the numbers of the phi_N temps, shared by the functions of a program
+        '''
+        if phi_temps is None:
+            phi_temps = itertools.count()
+        cfg = self.cfg
+        heads = [[] for _ in cfg.blocks]
+        tails = [[] for _ in cfg.blocks]
+        for index, phis in enumerate(self.phis):
+            for phi in phis:
+                register = temp(f'phi_{next(phi_temps)}')
+                heads[index].append(Instruction(Opcode.ASSIGN, right=register, result=phi.result))
+                for predecessor, arg in zip(cfg.blocks[index].predecessors, phi.args):
+                    if arg is not None:
+                        tails[predecessor].append(Instruction(Opcode.ASSIGN, right=arg, result=register))
+
+        code = []
+        for index, instructions in enumerate(self.blocks):
+            instructions = list(instructions)
+            if heads[index]:
+                start = 1 if instructions[0].opcode in (Opcode.FUNCTION, Opcode.LABEL) else 0
+                instructions[start:start] = heads[index]
+            if tails[index]:
+                end = len(instructions) - (instructions[-1].opcode in JUMP_OPCODES)
+                instructions[end:end] = tails[index]
+            for instr in instructions:
+                code.append(Instruction(instr.opcode, instr.left, instr.right, instr.result, len(code)))
+        return code
+
+
+def to_ssa(code, pinned=()):
+    '''the SSAForm of every function of IRGenerator.code, name -> SSAForm; see build_cfgs()'''
+    forms = {}
+    for instructions in split_functions(code):
+        forms[instructions[0].result.value] = SSAForm(ControlFlowGraph(instructions), pinned)
+    return forms
+
+
+def from_ssa(forms):
+    '''three-address-code of the SSAForms of to_ssa(), one function after the other, indexed from 0'''
+    phi_temps = itertools.count()
+    code = []
+    for form in forms.values():
+        for instr in form.lower(phi_temps):
+            instr.index = len(code)
+            code.append(instr)
+    return code
@@ -1,6 +1,6 @@
 from enum import Enum
 from Lexer import TokenType
-from Parser import NodeVisitor
+from TreeWalker import TreeWalker
 from Error_Detection import ErrorCode, SemanticError
 
 _LOG = False
@@ -10,6 +10,8 @@ class Symbol:
         self.name = name
         self.type = type
         self.scope_level = 0
+        # index in the frame of its scope, VarSymbol only
+        self.slot = None
 
 
 class VarSymbol(Symbol):
@@ -49,6 +51,10 @@ class ProcedureSymbol(Symbol):
         self.formal_params = [] if formal_params is None else formal_params
         # a reference to procedure's body (AST sub-tree)
         self.block_ast = None
+        # slots of the params and locals and their names in slot order,
+        # set by SemanticAnalyzer(resolve_slots=True)
+        self.frame_size = 0
+        self.slot_names = []
 
     def __str__(self):
         return '<{class_name}(name={name}, parameters={params})>'.format(
@@ -66,6 +72,8 @@ class ScopedSymbolTable:
         self.scope_name = scope_name
         self.scope_level = scope_level
         self.enclosing_scope = enclosing_scope
+        # VarSymbol names in slot order, a frame of this scope is a list of len(slot_names)
+        self.slot_names = []
 
     def _init_builtins(self):
         self.log("===== _init_builtins start =====")
@@ -101,6 +109,9 @@ class ScopedSymbolTable:
     def insert(self, symbol):
         self.log(f'Insert: {symbol.name}') # {symbol.type}
         symbol.scope_level = self.scope_level
+        if isinstance(symbol, VarSymbol):
+            symbol.slot = len(self.slot_names)
+            self.slot_names.append(symbol.name)
         self._symbols[symbol.name] = symbol
 
     def lookup(self, name, current_scope_only = False):
@@ -120,12 +131,103 @@ class ScopedSymbolTable:
 
         # self.log(f'Undefined variable : {name}.')
 
+    def close(self):
+        '''called when the scope is left, a chained scope simply stops being referenced'''
+        pass
+
+
+class DisplaySymbolTable(ScopedSymbolTable):
+    '''
+    A scope of the display symbol table: all open scopes share one flat `display`,
+    name -> stack of the visible bindings, innermost last. insert() pushes a binding
+    and close() pops the bindings of the scope, so lookup() is one dict access
+    whatever the nesting depth. Only the innermost open scope may be used.
+    Identifiers are interned by the Lexer, so the dict compares names by identity.
+    '''
+    def __init__(self, scope_name, scope_level, enclosing_scope = None):
+        self.scope_name = scope_name
+        self.scope_level = scope_level
+        self.enclosing_scope = enclosing_scope
+        self.display = {} if enclosing_scope is None else enclosing_scope.display
+        # names bound in this scope, in order, unbound again by close()
+        self._names = []
+        self.slot_names = []
 
-class SemanticAnalyzer(NodeVisitor):
-    def __init__(self):
+    @property
+    def _symbols(self):
+        # the bindings of this scope, for __str__
+        return {name: self.display[name][-1] for name in self._names}
+
+    def insert(self, symbol):
+        self.log(f'Insert: {symbol.name}')
+        symbol.scope_level = self.scope_level
+        if isinstance(symbol, VarSymbol):
+            symbol.slot = len(self.slot_names)
+            self.slot_names.append(symbol.name)
+        bindings = self.display.get(symbol.name)
+        if bindings is None:
+            self.display[symbol.name] = [symbol]
+        else:
+            bindings.append(symbol)
+        self._names.append(symbol.name)
+
+    def lookup(self, name, current_scope_only = False):
+        bindings = self.display.get(name)
+        if bindings:
+            symbol = bindings[-1]
+            # levels grow along the chain, so the level tells the scope of the binding
+            if not current_scope_only or symbol.scope_level == self.scope_level:
+                self.log(f'Lookup: {name}. (Scope level: {symbol.scope_level})')
+                return symbol
+        return None
+
+    def close(self):
+        display = self.display
+        for name in self._names:
+            display[name].pop()
+
+
+# symbol_table engine of SemanticAnalyzer -> scope class
+SYMBOL_TABLES = {
+    'chain': ScopedSymbolTable,
+    'display': DisplaySymbolTable,
+}
+
+
+class SemanticAnalyzer(TreeWalker):
+    '''
+    scope and type checks, walked without recursion (see TreeWalker):
+    enter_X opens scopes and declares symbols, leave_X type-checks a node
+    once its children are typed
+
+    with resolve_slots every resolved Var gets node.slot = (scope depth, slot index):
+    the declaration is `depth` scopes out (0 local, 1 global inside a function) at
+    `index` in that scope's frame, and every Function's proc_symbol records its
+    frame_size, so RuntimeAnalyzer(slots=True) indexes lists instead of names
+
+    symbol_table picks the scope class from SYMBOL_TABLES: 'chain' looks names up
+    scope by scope, 'display' in one flat table (DisplaySymbolTable)
+
+    with a call_graph (CallGraph of the same tree) the ProcedureSymbols of all its
+    functions are declared on entering the Program, so a function can call one that
+    is defined after it; without one a call to a function not defined yet is an
+    ID_NOT_FOUND error
+    '''
+    def __init__(self, resolve_slots=False, symbol_table='chain', call_graph=None):
+        if symbol_table not in SYMBOL_TABLES:
+            raise ValueError(f'unknown symbol table {symbol_table!r}, expected one of {tuple(SYMBOL_TABLES)}')
+        self.scope_class = SYMBOL_TABLES[symbol_table]
+        self.resolve_slots = resolve_slots
+        self.call_graph = call_graph
+        # Function -> its ProcedureSymbol declared up front from the call_graph
+        self._declared = {}
         self.current_scope = None
         # log errors to be used in UI
         self.err_list = []
+        # ProcedureSymbol of the Functions being walked
+        self._functions = []
+        # ProcedureSymbol of the ProcedureCalls being walked
+        self._calls = []
     
     def getErrList(self):
         return self.err_list
@@ -134,6 +236,10 @@ class SemanticAnalyzer(NodeVisitor):
         if _LOG:
             print(msg)
 
+    def lookup(self, name):
+        '''the symbol a reference to `name` resolves to, from the current scope outwards'''
+        return self.current_scope.lookup(name)
+
     def error(self, error_code, token):
         '''
         raise SemanticError(
@@ -149,35 +255,26 @@ class SemanticAnalyzer(NodeVisitor):
         )
         self.err_list.append(semanticErr)
 
-    def visit_Var(self, node):
+    def enter_Var(self, node):
         # self.log('enter visit_var')
         var_name = node.value
         # print("visit_Var", var_name)
-        var_symbol = self.current_scope.lookup(var_name)
+        var_symbol = self.lookup(var_name)
         if var_symbol is None:
             self.error(error_code = ErrorCode.ID_NOT_FOUND, token = node.token)
         else:
             node.type = var_symbol.type
+            if self.resolve_slots and var_symbol.slot is not None:
+                node.slot = (self.current_scope.scope_level - var_symbol.scope_level, var_symbol.slot)
         # self.log('leave visit_var')
 
-    def visit_NoOp(self, node):
-        pass
-
-    def visit_Type(self, node):
-        pass
-
-    def visit_Param(self, node):
-        self.visit(node.var)
-        self.visit(node.type)
-
-    def visit_BinOp(self, node):
+    def enter_BinOp(self, node):
         # we have to judge whether node.left and node.right is of same type
         self.log('enter visit_binop')
-        self.visit(node.left)
-        self.visit(node.right)
 
+    def leave_BinOp(self, node, results):
         # here we dont need to perform type-check
-        # bcz we have already done it in self.visit(node.*)
+        # bcz we have already done it in the children
         if node.left.type != node.right.type:
             self.error(
                 error_code=ErrorCode.TYPE_UNMATCHED,
@@ -186,7 +283,7 @@ class SemanticAnalyzer(NodeVisitor):
         node.type = node.left.type
         self.log('leave visit_binop')
 
-    def visit_Num(self, node):
+    def enter_Num(self, node):
         # token: <type: TokenType.INTEGER_CONST, value: ~>
         # self.log('enter visit_num')
         if node.token.type == TokenType.INTEGER_CONST:
@@ -197,10 +294,10 @@ class SemanticAnalyzer(NodeVisitor):
             node.type = None
         # self.log('leave visit_num')
     
-    def visit_Program(self, node):
+    def enter_Program(self, node):
         # we assume the outest space is 'global' scope
         self.log('ENTER scope: global')
-        global_scope = ScopedSymbolTable(
+        global_scope = self.scope_class(
             scope_name = 'global',
             scope_level = 1,
             enclosing_scope = self.current_scope,  # None
@@ -208,29 +305,47 @@ class SemanticAnalyzer(NodeVisitor):
         global_scope._init_builtins()
         self.current_scope = global_scope
 
-        # visit subtree
-        for child in node.children:
-            self.visit(child)
+        if self.call_graph is not None:
+            for function in self.call_graph.definitions:
+                proc_symbol = self._declared[function] = self.procedure_symbol(function)
+                global_scope.insert(proc_symbol)
 
+    def leave_Program(self, node, results):
         # After we visit everything
-        self.log(global_scope)
+        self.log(self.current_scope)
         self.log('LEAVE scope: global')
 
         # reset self.current_scope
+        self.current_scope.close()
         self.current_scope = self.current_scope.enclosing_scope
 
-    def visit_Function(self, node):
+    def procedure_symbol(self, node):
+        '''the signature of a Function: its ProcedureSymbol with a VarSymbol per formal param'''
+        proc_symbol = ProcedureSymbol(
+            node = node,
+        )
+        for param_node in node.formal_params:
+            # we don't need to lookup var in the func declaration
+            # self.current_scope.lookup(param_node.type.value)
+            param_type = param_node.type.value
+            if param_type != 'VOID':
+                param_name = param_node.var.value
+                proc_symbol.formal_params.append(VarSymbol(param_name, param_type))
+        return proc_symbol
+
+    def enter_Function(self, node):
         proc_name = node.name
         self.log(f'ENTER scope: {proc_name}')
 
         # add to the symbol table (current_scope->_symbols[symbol.name] = symbol
-        proc_symbol = ProcedureSymbol(
-            node = node,
-        )
+        proc_symbol = self._declared.get(node)
+        if proc_symbol is None:
+            proc_symbol = self.procedure_symbol(node)
         self.current_scope.insert(proc_symbol)
+        self._functions.append(proc_symbol)
         
         # enter a local scope
-        procedure_scope = ScopedSymbolTable(
+        procedure_scope = self.scope_class(
             scope_name = proc_name,
             scope_level = self.current_scope.scope_level + 1,
             # AKA last scope
@@ -239,48 +354,38 @@ class SemanticAnalyzer(NodeVisitor):
         self.current_scope = procedure_scope
 
         # Insert parameters into the procedure scope
-        for param_node in node.formal_params:
-            # we don't need to lookup var in the func declaration
-            # self.current_scope.lookup(param_node.type.value)
-            param_type = param_node.type.value
-            if param_type != 'VOID':
-                param_name = param_node.var.value
-                var_symbol = VarSymbol(param_name, param_type)
-                proc_symbol.formal_params.append(var_symbol)
-                # also remind to insert param_varsymbol into current_scope (the local one)
-                self.current_scope.insert(var_symbol)
+        param_nodes = [param_node for param_node in node.formal_params if param_node.type.value != 'VOID']
+        for param_node, var_symbol in zip(param_nodes, proc_symbol.formal_params):
+            # also remind to insert param_varsymbol into current_scope (the local one)
+            self.current_scope.insert(var_symbol)
+            if self.resolve_slots:
+                param_node.var.slot = (0, var_symbol.slot)
         
-        # visit block
-        self.visit(node.block)
+        # only the block is walked
+        return [node.block]
 
+    def leave_Function(self, node, results):
         # After we visit everything
-        self.log(procedure_scope)
-        self.log(f'LEAVE scope: {proc_name}')
-
-        # reset self.current_scope
-        self.current_scope = self.current_scope.enclosing_scope
+        self.log(self.current_scope)
+        self.log(f'LEAVE scope: {node.name}')
 
         # accessed by the interpreter when executing procedure call
+        proc_symbol = self._functions.pop()
         proc_symbol.block_ast = node.block
+        if self.resolve_slots:
+            proc_symbol.slot_names = self.current_scope.slot_names
+            proc_symbol.frame_size = len(proc_symbol.slot_names)
+        node.proc_symbol = proc_symbol
 
-    def visit_Block(self, node):
-        self.visit(node.declarations)
-        self.visit(node.compound_statement)
-
-    def visit_Declaration(self, node):
-        for child in node.children:
-            self.visit(child)
-
-    def visit_Compound(self, node):
-        for child in node.children:
-            self.visit(child)
+        # reset self.current_scope
+        self.current_scope.close()
+        self.current_scope = self.current_scope.enclosing_scope
 
-    def visit_Assign(self, node):
+    def enter_Assign(self, node):
         # we have to judge whether node.left and node.right is of same type
         self.log('enter visit_assign')
-        self.visit(node.left)
-        self.visit(node.right)
 
+    def leave_Assign(self, node, results):
         # perform type-check, else raise error
         if node.left.type != node.right.type:
             self.error(
@@ -289,20 +394,13 @@ class SemanticAnalyzer(NodeVisitor):
             )
         self.log('leave visit_assign')
 
-    def visit_Return(self, node):
-        self.visit(node.expr)
-
-    def visit_While(self, node):
-        self.visit(node.expr)
-        self.visit(node.block)
-
-    def visit_If(self, node):
-        self.visit(node.expr)
-        self.visit(node.if_block)
+    def enter_If(self, node):
+        children = [node.expr, node.if_block]
         if type(node.else_block).__name__ != 'NoOp':
-            self.visit(node.else_block)
+            children.append(node.else_block)
+        return children
 
-    def visit_VarDecl(self, node):
+    def enter_VarDecl(self, node):
         # Create the symbol and insert it into the symbol table.
         self.log('enter visit_vardecl')
         type_name = node.type.value
@@ -318,9 +416,13 @@ class SemanticAnalyzer(NodeVisitor):
 
         # Else Insert it into the symbol table
         self.current_scope.insert(var_symbol)
+        if self.resolve_slots:
+            node.var.slot = (0, var_symbol.slot)
         self.log('leave visit_vardecl')
+        # var and type are not walked
+        return ()
 
-    def visit_ProcedureCall(self, node):
+    def enter_ProcedureCall(self, node):
         '''
         handle 3 possible errors:
         1. The num of formal-param and actual-param is different
@@ -328,7 +430,13 @@ class SemanticAnalyzer(NodeVisitor):
         3. The num is correct, But its type (Var or Num Object) is unmatched with Actual Params
         '''
         self.log(f'enter visit_proccall {node.name}')
-        proc_symbol = self.current_scope.lookup(node.name)
+        proc_symbol = self.lookup(node.name)
+        if proc_symbol is None:
+            self.error(error_code = ErrorCode.ID_NOT_FOUND, token = node.token)
+            node.type = None
+            # the actual params are still looked up, but not checked against anything
+            self._calls.append(None)
+            return
         node.type = proc_symbol.type.value
 
         # address 1st error
@@ -338,21 +446,24 @@ class SemanticAnalyzer(NodeVisitor):
                 error_code=ErrorCode.PARAM_NUM_NOT_CONSISTENT,
                 token=node.token
             )
+        self._calls.append(proc_symbol)
+
+    def after_child_ProcedureCall(self, node, idx, param_node, result):
+        # address 2nd and 3rd error, right after each actual param is walked
+        # if actual params is of Var Object, we need to perform type-check and scope-lookup;
+        # elif actual params is of Num Object, we only need to perform type-check
+        # Here, we have already perform scope-lookup in the walk of the param
+        # So what we only need to do is type-check
+        proc_symbol = self._calls[-1]
+        if proc_symbol is None:
+            return
+        if param_node.type != proc_symbol.formal_params[idx].type:
+            self.error(
+                error_code=ErrorCode.PROCALL_TYPE_UNMATCHED,
+                token=param_node.token,
+            )
 
-        # address 2nd and 3rd error
-        for idx, param_node in enumerate(node.actual_params):
-            self.visit(param_node)
-            # if actual params is of Var Object, we need to perform type-check and scope-lookup;
-            # elif actual params is of Num Object, we only need to perform type-check
-            # Here, we have already perform scope-lookup in self.visit(*)
-            # So what we only need to do is type-check
-
-            if param_node.type != proc_symbol.formal_params[idx].type:
-                self.error(
-                    error_code=ErrorCode.PROCALL_TYPE_UNMATCHED,
-                    token=param_node.token,
-                )
-        
+    def leave_ProcedureCall(self, node, results):
         # accessed by the interpreter when executing procedure call
-        node.proc_symbol = proc_symbol
+        node.proc_symbol = self._calls.pop()
         self.log(f'leave visit_proccall {node.name}')
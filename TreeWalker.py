@@ -0,0 +1,284 @@
+import time
+
+### 扩展功能: 非递归的语法树遍历
+
+# node class name -> fields holding its children, in source order;
+# keyed by name so that the FlatAST views are walked like the ParserTree classes
+CHILD_FIELDS = {
+    'Program':          ('children',),
+    'Function':         ('type', 'formal_params', 'block'),
+    'Param':            ('var', 'type'),
+    'Block':            ('declarations', 'compound_statement'),
+    'Declaration':      ('children',),
+    'Compound':         ('children',),
+    'Assign':           ('left', 'right'),
+    'BinOp':            ('left', 'right'),
+    'Return':           ('expr',),
+    'While':            ('expr', 'block'),
+    'If':               ('expr', 'if_block', 'else_block'),
+    'VarDecl':          ('var', 'type'),
+    'ProcedureCall':    ('actual_params',),
+}
+
+# node class names without children
+LEAF_NODES = frozenset(('Var', 'Num', 'Type', 'NoOp'))
+
+
+def child_nodes(node):
+    '''the children of `node` in source order, see CHILD_FIELDS'''
+    children = []
+    for field in CHILD_FIELDS.get(type(node).__name__, ()):
+        value = getattr(node, field)
+        if isinstance(value, list):
+            children.extend(value)
+        else:
+            children.append(value)
+    return children
+
+
+# marks the end of a children iterator
+_DONE = object()
+
+
+class TreeWalker:
+    '''
+    Walks an AST with an explicit stack and calls, for a node of class X:
+
+        enter_X(node)                           before its children, may return the
+                                                children to walk instead of child_nodes(node)
+        after_child_X(node, index, child, result)
+                                                after each child, `result` is what the
+                                                child's leave hook returned
+        leave_X(node, results)                  after all children, `results` are the
+                                                children's results in order; its return
+                                                value is the node's result
+
+    Every hook is optional, a node without enter_X walks child_nodes(node). Hooks are
+    looked up once per (walker class, node class) pair, like NodeVisitor handlers. A
+    node class without hooks that is neither in CHILD_FIELDS nor in LEAF_NODES raises
+    the 'No visit_X method' Exception of NodeVisitor.generic_visit.
+
+    walk() never recurses, so the tree depth is only bounded by memory;
+    walk_recursive() calls the same hooks through Python recursion.
+    visit() is walk(), so a TreeWalker replaces a NodeVisitor for its callers.
+    '''
+    # node class -> (enter, after_child, leave), functions or None
+    _hooks = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._hooks = {}
+
+    @classmethod
+    def _resolve(cls, node_class):
+        name = node_class.__name__
+        hooks = (
+            getattr(cls, 'enter_' + name, None),
+            getattr(cls, 'after_child_' + name, None),
+            getattr(cls, 'leave_' + name, None),
+        )
+        if hooks == (None, None, None) and name not in CHILD_FIELDS and name not in LEAF_NODES:
+            raise Exception('No visit_{} method'.format(name))
+        cls._hooks[node_class] = hooks
+        return hooks
+
+    def walk(self, root):
+        '''walk the tree under `root` and return the result of its leave hook'''
+        table = self._hooks
+        # frames: [node, hooks, iterator over the children, results of the children]
+        stack = []
+        node = root
+        while True:
+            hooks = table.get(type(node)) or self._resolve(type(node))
+            children = None
+            if hooks[0] is not None:
+                children = hooks[0](self, node)
+            if children is None:
+                children = child_nodes(node)
+            stack.append((node, hooks, iter(children), []))
+
+            while True:
+                node, hooks, children, results = stack[-1]
+                child = next(children, _DONE)
+                if child is not _DONE:
+                    node = child
+                    break
+                stack.pop()
+                result = None
+                if hooks[2] is not None:
+                    result = hooks[2](self, node, results)
+                if not stack:
+                    return result
+                parent, parent_hooks, _, parent_results = stack[-1]
+                if parent_hooks[1] is not None:
+                    parent_hooks[1](self, parent, len(parent_results), node, result)
+                parent_results.append(result)
+
+    def walk_recursive(self, node):
+        '''walk() through Python recursion, for comparison'''
+        hooks = self._hooks.get(type(node)) or self._resolve(type(node))
+        children = None
+        if hooks[0] is not None:
+            children = hooks[0](self, node)
+        if children is None:
+            children = child_nodes(node)
+        results = []
+        for index, child in enumerate(children):
+            result = self.walk_recursive(child)
+            if hooks[1] is not None:
+                hooks[1](self, node, index, child, result)
+            results.append(result)
+        if hooks[2] is not None:
+            return hooks[2](self, node, results)
+        return None
+
+    def visit(self, node):
+        return self.walk(node)
+
+
+def _raising_hook(exc):
+    def hook(walker, node):
+        raise exc
+    return hook
+
+
+class FusedWalker:
+    '''
+    Runs several TreeWalkers in a single walk of the tree: every node is entered,
+    and left, once, and the hooks of the walkers are called in the order of `walkers`.
+
+    An enter hook may only drop children of child_nodes(node), never reorder or add
+    them. Each child is walked for the walkers that selected it (the per-walker mask),
+    a child no walker selected is skipped, and every walker still sees exactly the
+    hook calls, child indices and results of walking the tree alone.
+
+    A walker whose hook raises is dropped for the rest of the walk, its exception
+    is kept in `failed`, the other walkers go on.
+
+    fused = FusedWalker([SemanticAnalyzer(), ASTVisualizer(None)])
+    fused.walk(tree)
+    '''
+    def __init__(self, walkers, timed=False):
+        '''timed: add the time spent in the hooks of each walker to `elapsed`'''
+        self.walkers = list(walkers)
+        # walker index -> exception raised by one of its hooks
+        self.failed = {}
+        self.elapsed = [0.0] * len(self.walkers) if timed else None
+        # node class -> the (walker index, walker, hook) of every enter, after_child and
+        # leave hook, and the indices of the walkers that need the children's results
+        self._plans = {}
+
+    def _resolve(self, node_class):
+        enters, afters, leaves = [], [], []
+        for index, walker in enumerate(self.walkers):
+            try:
+                hooks = type(walker)._hooks.get(node_class) or type(walker)._resolve(node_class)
+            except Exception as exc:
+                # the walker alone raises on entering such a node
+                hooks = (_raising_hook(exc), None, None)
+            for hook_list, hook in zip((enters, afters, leaves), hooks):
+                if hook is not None:
+                    if self.elapsed is not None:
+                        hook = self._timed(index, hook)
+                    hook_list.append((index, walker, hook))
+        collect = tuple(sorted({index for index, _, _ in afters + leaves}))
+        plan = self._plans[node_class] = (enters, afters, leaves, collect)
+        return plan
+
+    def _timed(self, index, hook):
+        elapsed = self.elapsed
+        clock = time.perf_counter
+
+        def timed_hook(*args):
+            start = clock()
+            try:
+                return hook(*args)
+            finally:
+                elapsed[index] += clock() - start
+        return timed_hook
+
+    def walk(self, root):
+        '''walk the tree under `root`, return the root's result of every walker'''
+        table = self._plans
+        failed = self.failed
+        n_walkers = len(self.walkers)
+        everyone = tuple(range(n_walkers))
+        no_results = (None,) * n_walkers
+        # frames: [node, after_child hooks, leave hooks, walkers collecting results, mask,
+        #          iterator over the children, iterator over their masks or None if they
+        #          share the node's mask, children results per collecting walker]
+        # a mask is a tuple of walker indices, None for every walker
+        stack = []
+        node = root
+        mask = None
+        while True:
+            enters, afters, leaves, collect = table.get(type(node)) or self._resolve(type(node))
+            # walker index -> the children its enter hook selected
+            selected = None
+            for index, walker, enter in enters:
+                if mask is not None and index not in mask or index in failed:
+                    continue
+                try:
+                    children = enter(walker, node)
+                except Exception as exc:
+                    failed[index] = exc
+                    continue
+                if children is not None:
+                    if selected is None:
+                        selected = {}
+                    selected[index] = children
+            children = child_nodes(node)
+            child_masks = None
+            if selected is not None:
+                walked = []
+                child_masks = []
+                for child in children:
+                    child_mask = tuple(
+                        index for index in (everyone if mask is None else mask)
+                        if index not in selected or child in selected[index]
+                    )
+                    if child_mask:
+                        walked.append(child)
+                        child_masks.append(None if len(child_mask) == n_walkers else child_mask)
+                children = walked
+                child_masks = iter(child_masks)
+            results = None
+            if collect:
+                results = [None] * n_walkers
+                for index in collect:
+                    results[index] = []
+            stack.append((node, afters, leaves, collect, mask, iter(children), child_masks, results))
+
+            while True:
+                node, afters, leaves, collect, mask, children, child_masks, results = stack[-1]
+                child = next(children, _DONE)
+                if child is not _DONE:
+                    node = child
+                    if child_masks is not None:
+                        mask = next(child_masks)
+                    break
+                stack.pop()
+                node_results = no_results
+                if leaves:
+                    node_results = [None] * n_walkers
+                    for index, walker, leave in leaves:
+                        if mask is not None and index not in mask or index in failed:
+                            continue
+                        try:
+                            node_results[index] = leave(walker, node, results[index])
+                        except Exception as exc:
+                            failed[index] = exc
+                if not stack:
+                    return list(node_results)
+                parent, parent_afters, _, parent_collect, _, _, _, parent_results = stack[-1]
+                for index, walker, after_child in parent_afters:
+                    if mask is not None and index not in mask or index in failed:
+                        continue
+                    try:
+                        after_child(walker, parent, len(parent_results[index]), node,
+                                    node_results[index])
+                    except Exception as exc:
+                        failed[index] = exc
+                for index in parent_collect:
+                    if mask is None or index in mask:
+                        parent_results[index].append(node_results[index])
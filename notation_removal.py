@@ -6,6 +6,8 @@
 
 #update the lock area    -update the error-found    -correct the problem of wrong position in real file
 
+#Lexer.skip_comment() now skips comments while scanning, in one pass and without a copy of the source
+
 def notation_removal(src_code):
     #remove the space and \t head and tail
     src_code=src_code.strip(" \t")
@@ -2,8 +2,10 @@ from Lexer import TokenType, Lexer
 from notation_removal import notation_removal
 from Parser import Parser
 from IntermediateCodeGenerator import IRGenerator
+from IR import format_code
 from SemanticAnalyzer import SemanticAnalyzer
 from RunTimeAnalyzer import RuntimeAnalyzer
+from Pipeline import Pipeline
 
 from ParserVisualizer import ASTVisualizer
 if __name__ == '__main__':
@@ -44,8 +46,15 @@ if __name__ == '__main__':
 	
 	# irg = IRGenerator(parser)
 	# irg.genCodeSeq()
-	# for instr in irg.code:
-	# 	print(instr)
+	# for line in irg.listing():
+	# 	print(line)
+
+	# parse once, then semantic + dot + ir in one walk of the tree
+	# result = Pipeline(('semantic', 'dot', 'ir')).run(text)
+	# print(result.dot)
+	# for line in format_code(result.code):
+	# 	print(line)
+	# print(result.timings)
 
 	'''
 	tree = parser.parseProcCall()
@@ -74,6 +74,100 @@ class LexerTestCase(unittest.TestCase):
             # print(token)
             self.assertEqual(token.type, assertToken.type)
 
+    def test_regex_engine(self):
+        from Lexer import Lexer
+        testcase = [
+            open('testfile copy.txt').read(),
+            '''
+            void main(void)
+            {
+                int a; a=b>=c!d;
+                %  1.5 x2==3.
+            }
+            ''',
+            'int x; # é2',
+        ]
+        for text in testcase:
+            tokens = {}
+            for engine in ('char', 'regex'):
+                lexer = Lexer(text, engine=engine)
+                RetValue, token_list = lexer.get_all_tokens()
+                tokens[engine] = (
+                    RetValue,
+                    [str(token) for token in token_list],
+                    [str(err) for err in lexer.getErrList()],
+                )
+            self.assertEqual(tokens['char'], tokens['regex'])
+
+    def test_from_file(self):
+        from Lexer import Lexer
+        fname = 'testfile copy.txt'
+        lexer = Lexer(open(fname, 'r').read())
+        assertTokenList = [str(token) for token in lexer.get_all_tokens()[1]]
+        for engine in ('char', 'regex'):
+            for chunk_size, use_mmap in ((1, True), (7, False), (4096, True)):
+                lexer = Lexer.from_file(fname, engine=engine, chunk_size=chunk_size, use_mmap=use_mmap)
+                token_list = [str(token) for token in lexer.iter_tokens()]
+                self.assertEqual(token_list, assertTokenList)
+
+    def test_token_array(self):
+        import pickle
+        text = 'int a; a = 1; b = 1.0 % 1;'
+        RetValue, token_list = self.buildLexer(text).get_all_tokens()
+        compactRetValue, token_array = self.buildLexer(text).get_all_tokens(compact=True)
+        self.assertEqual(RetValue, compactRetValue)
+        self.assertEqual(len(token_array), len(token_list))
+        # 1 and 1.0 are interned separately
+        self.assertEqual(repr(token_array[9]), repr(token_list[9]))
+        for array in (token_array, pickle.loads(pickle.dumps(token_array)), token_array[:]):
+            self.assertEqual([str(token) for token in array], [str(token) for token in token_list])
+
+    def test_comment(self):
+        from Lexer import Lexer, TokenType
+        testcase = [
+            (
+                '''
+                void main(void) // entry
+                {
+                /*	int a
+                	int b;
+                	return ;
+                }
+                ''',
+                ['Error! illegal comment on row 4']
+            ),
+            (
+                '''
+                void main(void)
+                {
+                /*	int a
+                	int b;*/
+                	int c;*/
+                	return ;
+                }
+                ''',
+                ['Error! illegal comment on row 6']
+            )
+        ]
+        for text, err in testcase:
+            for engine in ('char', 'regex'):
+                lexer = Lexer(text, engine=engine)
+                token_list = lexer.get_all_tokens()[1]
+                self.assertEqual(lexer.getErrList(), err)
+                self.assertEqual(token_list[5].type, TokenType.LBRACE)
+                self.assertEqual(token_list[6].type, TokenType.DIV if '*/' not in text else TokenType.INT)
+
+    def test_lazy_positions(self):
+        from Lexer import Lexer, LineIndex
+        text = open('testfile copy.txt').read() + '\n  % /* open\n'
+        lexer = Lexer(text, engine='regex')
+        assertTokenList = [str(token) for token in lexer.get_all_tokens()[1]]
+        lazyLexer = Lexer(text, engine='regex', positions='lazy')
+        token_list = [str(token) for token in lazyLexer.get_all_tokens()[1]]
+        self.assertEqual(token_list, assertTokenList)
+        self.assertEqual([str(err) for err in lazyLexer.getErrList()], [str(err) for err in lexer.getErrList()])
+        self.assertEqual(LineIndex('int a;\nint b;').position(8), (2, 2))
+
     def disabled_test_notation_removal(self):
         testcase = [
             (
@@ -202,6 +296,698 @@ class ParserTestCase(unittest.TestCase):
             for err, assertErr in zip(interpreter.getErrList(), errlist):
                 self.assertEqual(err.__str__(), assertErr)
 
+    def test_pratt_engine(self):
+        from Lexer import Lexer
+        from Parser import Parser
+        from ParserVisualizer import ASTVisualizer
+        testcase = [
+            open('testfile copy.txt').read(),
+            '''
+            int main(int a)
+            {
+                a = 1-2-3*a/(4+f(a,5)) < a == 2+-3;
+                a = a <= (b != c) * ;
+                return a+;
+            }
+            ''',
+        ]
+        for text in testcase:
+            result = {}
+            for engine in ('descent', 'pratt'):
+                parser = Parser(Lexer(text), expr_engine=engine)
+                result[engine] = (
+                    ASTVisualizer(None).gendot(parser.parseProcCall()),
+                    [str(err) for err in parser.getErrList()],
+                )
+            self.assertEqual(result['descent'], result['pratt'])
+        with self.assertRaises(ValueError):
+            Parser(Lexer(''), expr_engine='lalr')
+
+    def test_token_sources(self):
+        from Lexer import Lexer
+        from Parser import Parser
+        from ParserVisualizer import ASTVisualizer
+        text = open('testfile copy.txt').read() + '\nint x'
+        parser = Parser(Lexer(text))
+        assertDot = ASTVisualizer(parser).gendot()
+        assertErrList = [str(err) for err in parser.getErrList()]
+        token_list = Lexer(text).get_all_tokens()[1]
+        token_array = Lexer(text).get_all_tokens(compact=True)[1]
+        # the list without its EOF token gets one from the parser
+        for source in (token_list, token_list[:-1], token_array, iter(token_list)):
+            parser = Parser(source)
+            self.assertEqual(ASTVisualizer(None).gendot(parser.parseProcCall()), assertDot)
+            self.assertEqual([str(err) for err in parser.getErrList()], assertErrList)
+
+        # a call no longer depends on the whitespace in front of '('
+        dots = []
+        for call in ('f(a, 1)', 'f (a, 1)', 'f\n\t(a, 1)'):
+            parser = Parser(Lexer(f'int main(void)\n{{\n\treturn {call};\n}}\n'))
+            dots.append(ASTVisualizer(None).gendot(parser.parseProcCall()))
+            self.assertEqual(parser.getErrList(), [])
+        self.assertEqual(dots[0], dots[1])
+        self.assertEqual(dots[0], dots[2])
+        with self.assertRaises(IndexError):
+            Parser(token_list).peek(2)
+
+    def test_stack_mode(self):
+        from Lexer import Lexer
+        from Parser import Parser
+        from ParserVisualizer import ASTVisualizer
+        testcase = [
+            open('testfile copy.txt').read(),
+            '''
+            int main(int a)
+            {
+                while (a) { if (a < (1 + f(a, (2)))) { a = 1; } else { return; } }
+                if (a) { a = ; } else
+                return a+;
+            }
+            int
+            ''',
+        ]
+        for text in testcase:
+            result = {}
+            for mode in ('recursive', 'stack'):
+                parser = Parser(Lexer(text), mode=mode)
+                result[mode] = (
+                    ASTVisualizer(None).gendot(parser.parseProcCall()),
+                    [str(err) for err in parser.getErrList()],
+                )
+            self.assertEqual(result['recursive'], result['stack'])
+
+        depth = 5000
+        text = 'int main(int a)\n{\n' + 'if (a) {\n' * depth + 'a = ' + '(' * depth + 'a' + ')' * depth + ';\n' + '}\n' * depth + '}\n'
+        with self.assertRaises(RecursionError):
+            Parser(Lexer(text)).parseProcCall()
+        parser = Parser(Lexer(text), mode='stack')
+        node = parser.parseProcCall().children[0].block
+        self.assertEqual(parser.getErrList(), [])
+        for _ in range(depth):
+            node = node.compound_statement.children[0].if_block
+        self.assertEqual(node.compound_statement.children[0].right.value, 'a')
+
+    def test_parallel(self):
+        from Lexer import Lexer
+        from Parser import Parser
+        from ParallelParser import ParallelParser
+        from ParserVisualizer import ASTVisualizer
+        base = open('testfile copy.txt').read()
+        testcase = [
+            (base * 3, None),
+            # errors that stay inside a function are parsed in parallel
+            (base + 'int f(int a)\n{\n\ta = ;\n\treturn a;\n}\n' + base, None),
+            # a function that does not parse to its closing brace
+            (base + 'int f(int a)\n{\n\ta = 1;\n\t{ a = 2; }\n}\n' + base, 'tail'),
+            (base + 'int x', 'prescan'),
+        ]
+        for text, fallback in testcase:
+            parser = Parser(Lexer(text))
+            assertDot = ASTVisualizer(parser).gendot()
+            assertErrList = [str(err) for err in parser.getErrList()]
+            for compact in (False, True):
+                token_list = Lexer(text).get_all_tokens(compact=compact)[1]
+                parallelParser = ParallelParser(token_list, workers=2)
+                self.assertEqual(ASTVisualizer(None).gendot(parallelParser.parseProcCall()), assertDot)
+                self.assertEqual([str(err) for err in parallelParser.getErrList()], assertErrList)
+                if fallback == 'tail':
+                    self.assertIsInstance(parallelParser.fallback, int)
+                else:
+                    self.assertEqual(parallelParser.fallback, fallback)
+
+    def test_slots(self):
+        import pickle
+        from Lexer import Lexer
+        from Parser import Parser
+        from ParserTree import AST
+        from ParserVisualizer import ASTVisualizer
+        from SemanticAnalyzer import SemanticAnalyzer
+        tree = Parser(Lexer(open('testfile copy.txt').read())).parseProcCall()
+        dot = ASTVisualizer(None).gendot(tree)
+        SemanticAnalyzer().visit(tree)
+        nodes = [tree]
+        for node in nodes:
+            self.assertFalse(hasattr(node, '__dict__'))
+            self.assertIsInstance(node._num, int)
+            for name, value in node.iter_fields():
+                nodes.extend(child for child in (value if isinstance(value, list) else [value]) if isinstance(child, AST))
+        self.assertEqual(ASTVisualizer(None).gendot(pickle.loads(pickle.dumps(tree))), dot)
+
+    def test_flat_ast(self):
+        import pickle
+        from FlatAST import FlatAST
+        from Lexer import Lexer
+        from Parser import Parser
+        from ParserVisualizer import ASTVisualizer
+        from SemanticAnalyzer import SemanticAnalyzer
+        text = open('testfile copy.txt').read().replace('c=2;', 'c=2; d=1;')
+
+        def analyze(tree):
+            analyzer = SemanticAnalyzer()
+            analyzer.visit(tree)
+            return ASTVisualizer(None).gendot(tree), [str(err) for err in analyzer.getErrList()]
+
+        assertResult = analyze(Parser(Lexer(text)).parseProcCall())
+        flat = FlatAST.from_tree(Parser(Lexer(text)).parseProcCall())
+        flat = pickle.loads(pickle.dumps(flat))
+        self.assertEqual(analyze(flat.root()), assertResult)
+        # annotations written through the views survive the conversion back
+        tree = flat.to_tree()
+        call = tree.children[-1].block.compound_statement.children[-2].right
+        self.assertEqual(call.type, 'INT')
+        self.assertEqual(call.proc_symbol.name, 'program')
+        self.assertEqual(ASTVisualizer(None).gendot(tree), assertResult[0])
+
+    def test_visitor_dispatch(self):
+        from Lexer import Token, TokenType
+        from Parser import NodeVisitor
+        from ParserTree import Num, NoOp
+
+        class NumVisitor(NodeVisitor):
+            def visit_Num(self, node):
+                return node.value
+
+        class Unknown:
+            pass
+
+        class Other(NoOp):
+            pass
+
+        visitor = NumVisitor()
+        self.assertEqual(visitor.visit(Num(Token(TokenType.INTEGER_CONST, 7))), 7)
+        for node in (NoOp(), Unknown(), Unknown(), Other()):
+            with self.assertRaisesRegex(Exception, f'No visit_{type(node).__name__} method'):
+                visitor.visit(node)
+        # tables are per class, a subclass handler does not leak into its base
+        class NoOpVisitor(NumVisitor):
+            def visit_NoOp(self, node):
+                return 'NoOp'
+        self.assertEqual(NoOpVisitor().visit(NoOp()), 'NoOp')
+        self.assertEqual(NoOpVisitor().visit(Num(Token(TokenType.INTEGER_CONST, 7))), 7)
+        with self.assertRaises(Exception):
+            NumVisitor().visit(NoOp())
+
+    def test_tree_walker(self):
+        from Lexer import Lexer
+        from Parser import Parser
+        from ParserVisualizer import ASTVisualizer
+        from SemanticAnalyzer import SemanticAnalyzer
+        text = open('testfile copy.txt').read().replace('c=2;', 'c=2; d=1; a=demo(b+1);')
+        result = {}
+        for driver in ('walk', 'walk_recursive'):
+            tree = Parser(Lexer(text)).parseProcCall()
+            analyzer = SemanticAnalyzer()
+            getattr(analyzer, driver)(tree)
+            result[driver] = ([str(err) for err in analyzer.getErrList()], ASTVisualizer(None).gendot(tree))
+        self.assertEqual(result['walk'], result['walk_recursive'])
+        self.assertEqual(result['walk'][0], [
+            "SemanticError: Identifier not found -> Token(TokenType.ID, 'd', position=36:7)",
+            "SemanticError: Type Unmatched -> Token(TokenType.ASSIGN, '=', position=36:8)",
+        ])
+
+        # deeper than the recursion limit
+        depth = 5000
+        text = 'int main(int a)\n{\n' + 'while (a) {\n' * depth + 'a = ' + '(' * depth + 'b' + ')' * depth + ';\n' + '}\n' * depth + '}\n'
+        tree = Parser(Lexer(text), mode='stack').parseProcCall()
+        analyzer = SemanticAnalyzer()
+        analyzer.visit(tree)
+        self.assertEqual(len(analyzer.getErrList()), 2)
+        self.assertEqual(ASTVisualizer(None).gendot(tree).count(' -> '), 6 * depth + 12)
+
+        # a node class without hooks, children or leaf entry is an error, as with NodeVisitor
+        from ParserTree import NoOp, ProcedureDecl
+        from TreeWalker import TreeWalker, FusedWalker
+
+        class Unknown:
+            pass
+
+        class UnknownWalker(TreeWalker):
+            def leave_Unknown(self, node, results):
+                return 'Unknown'
+
+        self.assertIsNone(SemanticAnalyzer().visit(NoOp()))
+        for node in (Unknown(), ProcedureDecl(None, None, None)):
+            for walker in (SemanticAnalyzer(), ASTVisualizer(None)):
+                for driver in ('walk', 'walk_recursive'):
+                    with self.assertRaisesRegex(Exception, f'No visit_{type(node).__name__} method'):
+                        getattr(walker, driver)(node)
+        fused = FusedWalker([SemanticAnalyzer(), UnknownWalker()])
+        self.assertEqual(fused.walk(Unknown()), [None, 'Unknown'])
+        self.assertEqual(list(fused.failed), [0])
+
+    def test_frame_slots(self):
+        from FlatAST import FlatAST
+        from Lexer import Lexer
+        from Parser import Parser
+        from RunTimeAnalyzer import RuntimeAnalyzer
+        from SemanticAnalyzer import SemanticAnalyzer
+        text = '''
+            int g;
+            int f(int a, int b) { int c; c = a * b + g; return c - a; }
+            void main(void) { int x; int y; x = 3; y = f(x, 4) + x; x = y; }
+        '''
+        tree = Parser(Lexer(text)).parseProcCall()
+        SemanticAnalyzer(resolve_slots=True).visit(tree)
+        f, main = tree.children[1], tree.children[2]
+        assign = f.block.compound_statement.children[0]
+        self.assertEqual(assign.left.slot, (0, 2))
+        self.assertEqual((assign.right.left.left.slot, assign.right.left.right.slot, assign.right.right.slot),
+                         ((0, 0), (0, 1), (1, 0)))
+        self.assertEqual((f.proc_symbol.frame_size, f.proc_symbol.slot_names), (3, ['a', 'b', 'c']))
+        self.assertEqual(main.proc_symbol.frame_size, 2)
+
+        flat = FlatAST.from_tree(Parser(Lexer(text)).parseProcCall())
+        SemanticAnalyzer(resolve_slots=True).visit(flat.root())
+        self.assertEqual(flat.to_tree().children[1].block.compound_statement.children[0].right.right.slot, (1, 0))
+
+        # frames by slot compute what frames by name do, the globals are not run
+        class Recorder(RuntimeAnalyzer):
+            def visit_Assign(self, node):
+                super().visit_Assign(node)
+                self.assigned.append((node.left.value, self.visit(node.left)))
+
+        assigned = {}
+        for slots in (False, True):
+            tree = Parser(Lexer(text.replace('+ g', '+ 1'))).parseProcCall()
+            SemanticAnalyzer(resolve_slots=slots).visit(tree)
+            runtime = Recorder(slots=slots)
+            runtime.assigned = []
+            runtime.visit(tree)
+            assigned[slots] = runtime.assigned
+        self.assertEqual(assigned[False], assigned[True])
+        self.assertEqual(assigned[True], [('x', 3), ('c', 13), ('y', 13), ('x', 13)])
+
+    def test_display_symbol_table(self):
+        import sys
+        from Lexer import Lexer
+        from Parser import Parser
+        from SemanticAnalyzer import SemanticAnalyzer, DisplaySymbolTable, VarSymbol
+        outer = DisplaySymbolTable('global', 1)
+        outer.insert(VarSymbol('a', 'INT'))
+        inner = DisplaySymbolTable('f', 2, outer)
+        self.assertIs(inner.lookup('a'), outer.lookup('a'))
+        self.assertIsNone(inner.lookup('a', current_scope_only=True))
+        inner.insert(VarSymbol('a', 'FLOAT'))
+        self.assertEqual(inner.lookup('a', current_scope_only=True).type, 'FLOAT')
+        inner.close()
+        self.assertEqual(outer.lookup('a').type, 'INT')
+        self.assertIsNone(outer.lookup('b'))
+
+        text = open('testfile copy.txt').read().replace('c=2;', 'c=2; d=a; a=demo(d+1);')
+        token = Lexer(text).get_all_tokens()[1][1]
+        self.assertIs(token.value, sys.intern('a'))
+        errors = {}
+        for table in ('chain', 'display'):
+            analyzer = SemanticAnalyzer(symbol_table=table)
+            analyzer.visit(Parser(Lexer(text)).parseProcCall())
+            errors[table] = [str(err) for err in analyzer.getErrList()]
+        self.assertEqual(errors['chain'], errors['display'])
+        self.assertEqual(len(errors['display']), 5)
+        self.assertTrue(errors['display'][0].startswith('SemanticError: Identifier not found'))
+        with self.assertRaises(ValueError):
+            SemanticAnalyzer(symbol_table='hash')
+
+    def test_incremental_analysis(self):
+        from Lexer import Lexer
+        from Parser import Parser
+        from SemanticAnalyzer import SemanticAnalyzer
+        from IncrementalAnalyzer import IncrementalAnalyzer
+
+        def analyze(text):
+            analyzer = SemanticAnalyzer()
+            analyzer.visit(Parser(Lexer(text)).parseProcCall())
+            return [str(err) for err in analyzer.getErrList()]
+
+        text = '\n'.join([
+            'int g;',
+            'int f(int a) { return a; }',
+            'int h(int a) { int b; b = f(a); return zz; }',
+            'int k(int a) { return a; }',
+        ])
+        incremental = IncrementalAnalyzer()
+        incremental.analyze(text)
+        self.assertEqual(incremental.analyzed, 3)
+
+        # a new line moves h and k, their error is reported at its new position
+        text = text.replace('int g;', 'int g;\nint c;')
+        tree = incremental.analyze(text)
+        self.assertEqual((incremental.skipped, incremental.analyzed), (3, 0))
+        self.assertEqual([str(err) for err in incremental.getErrList()], analyze(text))
+        self.assertIs(tree.children[3].proc_symbol.block_ast, tree.children[3].block)
+
+        # a changed signature of f invalidates its caller h, not k
+        text = text.replace('int f(int a)', 'int f(int a, int b)')
+        incremental.analyze(text)
+        self.assertEqual((incremental.skipped, incremental.analyzed), (1, 2))
+        self.assertEqual([str(err) for err in incremental.getErrList()], analyze(text))
+
+        # the NoOp of an empty program, and one after a parse error, are analyzed in full
+        for text in ('', 'int f(int a) { return a; }\nint + ;'):
+            incremental = IncrementalAnalyzer()
+            for run in range(2):
+                incremental.analyze(text)
+                self.assertEqual(incremental.skipped, 0)
+                self.assertEqual([str(err) for err in incremental.getErrList()], analyze(text))
+            self.assertEqual(incremental.fingerprints(text, Parser(Lexer(text)).parseProcCall()), {})
+
+    def test_parallel_semantic(self):
+        from Lexer import Lexer
+        from Parser import Parser
+        from SemanticAnalyzer import SemanticAnalyzer
+        from ParallelSemanticAnalyzer import ParallelSemanticAnalyzer
+        text = open('testfile copy.txt').read().replace('c=2;', 'c=2; d=a; a=demo(d+1);')
+        analyzer = SemanticAnalyzer()
+        analyzer.visit(Parser(Lexer(text)).parseProcCall())
+        assertErrList = [str(err) for err in analyzer.getErrList()]
+        for workers in (0, 2):
+            parallel = ParallelSemanticAnalyzer(workers=workers)
+            parallel.visit(Parser(Lexer(text)).parseProcCall())
+            self.assertEqual([str(err) for err in parallel.getErrList()], assertErrList)
+
+        # signatures are collected first, a call may come before the definition
+        tree = Parser(Lexer('void main(void) { int a; a = f(1); }\nint f(int b) { return b; }')).parseProcCall()
+        parallel = ParallelSemanticAnalyzer(workers=0)
+        parallel.visit(tree)
+        self.assertEqual(parallel.getErrList(), [])
+        call = tree.children[0].block.compound_statement.children[0].right
+        self.assertIs(call.proc_symbol, tree.children[1].proc_symbol)
+        self.assertIs(call.proc_symbol.block_ast, tree.children[1].block)
+
+        # a function defined twice: a call resolves to the definition before it, whatever the batches
+        fillers = ' '.join(f'void p{n}(void) {{ }}' for n in range(6))
+        text = f'int x; int f(int a) {{ return a; }} void g(void) {{ x = f(1); }} {fillers} void f(int a) {{ x = a; }}'
+        tree = Parser(Lexer(text)).parseProcCall()
+        analyzer = SemanticAnalyzer()
+        analyzer.visit(tree)
+        call = tree.children[2].block.compound_statement.children[0].right
+        self.assertIs(call.proc_symbol, tree.children[1].proc_symbol)
+        for workers in (0, 1, 2, 8):
+            tree = Parser(Lexer(text)).parseProcCall()
+            parallel = ParallelSemanticAnalyzer(workers=workers)
+            parallel.visit(tree)
+            self.assertEqual([str(err) for err in parallel.getErrList()], [str(err) for err in analyzer.getErrList()])
+            call = tree.children[2].block.compound_statement.children[0].right
+            self.assertIs(call.proc_symbol, tree.children[1].proc_symbol)
+
+        # the NoOp of an empty program and of a top-level parse error
+        for text in ('', 'int a; int + ;'):
+            analyzer = SemanticAnalyzer()
+            analyzer.visit(Parser(Lexer(text)).parseProcCall())
+            parallel = ParallelSemanticAnalyzer(workers=0)
+            parallel.visit(Parser(Lexer(text)).parseProcCall())
+            self.assertEqual([str(err) for err in parallel.getErrList()], [str(err) for err in analyzer.getErrList()])
+
+    def test_call_graph(self):
+        import IntermediateCodeGenerator
+        from Lexer import Lexer
+        from Parser import Parser
+        from SemanticAnalyzer import SemanticAnalyzer
+        from CallGraph import CallGraph
+        text = '\n'.join([
+            'void main(void) { int a; a = even(3); a = e(a); }',
+            'int even(int n) { n = odd(n - 1); return n; }',
+            'int odd(int n) { n = even(n - 1); return n; }',
+            'int fact(int n) { n = n * fact(n - 1); return n; }',
+            'int unused(int n) { n = fact(n); return n; }',
+        ])
+        tree = Parser(Lexer(text)).parseProcCall()
+        graph = CallGraph(tree)
+        self.assertEqual(graph.callees['main'], ['even', 'e'])
+        self.assertEqual(graph.callers['even'], ['main', 'odd'])
+        self.assertEqual(graph.undefined, ['e'])
+        self.assertEqual(graph.recursive, {'even', 'odd', 'fact'})
+        self.assertEqual(graph.unreachable(), ['fact', 'unused'])
+        bottom_up = graph.bottom_up()
+        self.assertLess(bottom_up.index('fact'), bottom_up.index('unused'))
+        self.assertLess(bottom_up.index('odd'), bottom_up.index('main'))
+
+        # forward references resolve, only the undefined callee is an error
+        for call_graph, errors in ((None, ['even', 'e', 'odd']), (graph, ['e'])):
+            analyzer = SemanticAnalyzer(call_graph=call_graph)
+            analyzer.visit(Parser(Lexer(text)).parseProcCall())
+            self.assertEqual([err.token.value for err in analyzer.getErrList() if err.token.value != '='], errors)
+
+        generator = IntermediateCodeGenerator.IRGenerator(None, call_graph=graph)
+        generator.genCodeSeq(tree.children[1])
+        self.assertIn('call odd', generator.listing())
+        self.assertIs(generator.function_tbl.lookup('odd').return_num, 1)
+
+    def test_ir_instructions(self):
+        import IntermediateCodeGenerator
+        from Lexer import Lexer
+        from Parser import Parser
+        from IR import Opcode, OperandKind, variable, constant
+        text = 'int f(int a) { int b; b = a + 1; while (b) { b = b - 1; } return b; }'
+        generator = IntermediateCodeGenerator.IRGenerator(Parser(Lexer(text)))
+        generator.genCodeSeq()
+        code = generator.code
+        self.assertEqual([instr.index for instr in code], list(range(len(code))))
+        self.assertEqual([instr.opcode for instr in code[:3]], [Opcode.FUNCTION, Opcode.ADD, Opcode.ASSIGN])
+        self.assertEqual((code[1].left, code[1].right), (variable('a'), constant(1)))
+        self.assertIs(code[1].result.kind, OperandKind.TEMP)
+        self.assertEqual((code[4].opcode, code[4].result.kind), (Opcode.JZ, OperandKind.LABEL))
+        # listing the code again numbers it the same, as does a second generator
+        second = IntermediateCodeGenerator.IRGenerator(Parser(Lexer(text)))
+        second.genCodeSeq()
+        self.assertEqual(second.listing(), generator.listing())
+        listing = generator.listing()
+        self.assertEqual(generator.listing(), listing)
+        self.assertEqual(listing[1:4], [
+            'f:',
+            '100 : (     +,     a,      1,int_0)',
+            '101 : (     =,  NoOp,  int_0,     b)',
+        ])
+
+    def test_cfg(self):
+        from IntermediateCodeGenerator import generate_ir
+        from ControlFlowGraph import build_cfgs
+        text = '''
+        int f(int a) { int b; b = 0; while (a > 0) { if (a > 5) { b = b + 2; } else { b = b + 1; } a = a - 1; } return b; }
+        void main(void) { int c; c = f(3); }
+        '''
+        generator = generate_ir(text)
+        self.assertIsNone(generator.exception)
+        cfgs = build_cfgs(generator.code)
+        self.assertEqual(list(cfgs), ['f', 'main'])
+        cfg = cfgs['f']
+        # entry, loop test, if test, jump to else, then, else, loop latch, exit
+        self.assertEqual([block.successors for block in cfg.blocks], [[1], [7, 2], [4, 3], [5], [6], [6], [1], []])
+        self.assertEqual(cfg.blocks[6].predecessors, [4, 5])
+        self.assertEqual(cfg.idom, [0, 0, 1, 2, 2, 3, 2, 1])
+        self.assertTrue(cfg.dominates(1, 6))
+        self.assertFalse(cfg.dominates(4, 6))
+        self.assertEqual(cfg.dominators_of(5), [5, 3, 2, 1, 0])
+        self.assertEqual([(loop.header, loop.back_edges, sorted(loop.body)) for loop in cfg.loops], [(1, [6], [1, 2, 3, 4, 5, 6])])
+        self.assertEqual(len(cfgs['main'].blocks), 1)
+        self.assertEqual(cfgs['main'].loops, [])
+        # numbered like the listing, back edge dashed
+        dot = cfg.gendot()
+        self.assertTrue(dot.startswith('digraph cfg {'))
+        self.assertIn('  node6 -> node1 [style=dashed]\n', dot)
+        self.assertIn('  node1 -> node7\n', dot)
+        self.assertIn('node7 [label="nxt_1:\\l114 : (     =,  NoOp,      b, f_tmp)\\l"]', dot)
+        self.assertIn('115 : (', cfgs['main'].gendot())
+
+    def test_ssa(self):
+        from IntermediateCodeGenerator import generate_ir
+        from Lexer import Lexer
+        from Parser import Parser
+        from SSA import to_ssa, from_ssa, global_variables
+        from IR import format_code
+        text = '''
+        int g;
+        int f(int a) { int b; b = 0; while (a > 0) { if (a > 5) { b = b + 2; } else { b = b + 1; g = b; } a = a - 1; } return b; }
+        '''
+        generator = generate_ir(text)
+        pinned = global_variables(Parser(Lexer(text)).parseProcCall())
+        self.assertEqual(pinned, {'g'})
+        ssa = to_ssa(generator.code, pinned)['f']
+        # the loop header merges b and a, the join after the if merges b
+        self.assertEqual([str(phi) for phi in ssa.phis[1]], ['b.2 = phi(b.1, b.5)', 'a.1 = phi(a, a.2)'])
+        self.assertEqual([str(phi) for phi in ssa.phis[6]], ['b.5 = phi(b.4, b.3)'])
+        # a single definition keeps its name, the global and the return register are not renamed
+        listing = ssa.listing()
+        self.assertIn('106 : (     +,   b.2,      2,int_2)', listing)
+        self.assertIn('111 : (     =,  NoOp,    b.3,     g)', listing)
+        self.assertIn('115 : (     =,  NoOp,    b.2, f_tmp)', listing)
+        self.assertEqual(ssa.definitions['b.3'][0], 5)
+        self.assertEqual(sorted(index for index, _ in ssa.uses['b.2']), [4, 5, 7])
+        # out of SSA: every phi through its own temp
+        code = format_code(from_ssa({'f': ssa}))
+        self.assertEqual(code[1:5], [
+            'f:',
+            '100 : (     =,  NoOp,      0,   b.1)',
+            '101 : (     =,  NoOp,    b.1, phi_0)',
+            '102 : (     =,  NoOp,      a, phi_1)',
+        ])
+        self.assertIn('118 : (     =,  NoOp,  phi_2,   b.5)', code)
+        # the copies of a predecessor come before its jump
+        latch = code.index('123 : (     j,     -,      -,jmp_0)')
+        self.assertEqual(code[latch - 2:latch], [
+            '121 : (     =,  NoOp,    b.5, phi_0)',
+            '122 : (     =,  NoOp,    a.2, phi_1)',
+        ])
+
+    def test_constant_folding(self):
+        from IntermediateCodeGenerator import generate_ir
+        from Lexer import Lexer
+        from Parser import Parser
+        from ConstantPropagation import ConstantFolder
+        from IRInterpreter import IRInterpreter, frame_layouts
+        from SSA import global_variables
+        from IR import format_code
+        text = '''
+        int g;
+        int f(int a) { int k; int s; k = 4 * 8; s = k + 2; while (a < 100) { if (k > 16) { a = a + s / (k - 30); } else { a = a - 1; } g = a * (3 + 4); } return a + k; }
+        void main(void) { int b; b = f(-5); g = g + b; }
+        '''
+        tree = Parser(Lexer(text)).parseProcCall()
+        code = generate_ir(text).code
+        folder = ConstantFolder(global_variables(tree))
+        optimized = folder.optimize(code)
+        self.assertEqual(format_code(optimized)[1:], [
+            'f:',
+            'jmp_0:',
+            '100 : (     <,     a,    100,int_2)',
+            '101 : (    jz, int_2,      -,nxt_1)',
+            'jmp_2:',
+            '102 : (     +,     a,     17,int_6)',
+            '103 : (     =,  NoOp,  int_6,     a)',
+            'nxt_4:',
+            '104 : (     *,     a,      7,int_9)',
+            '105 : (     =,  NoOp,  int_9,     g)',
+            '106 : (     j,     -,      -,jmp_0)',
+            'nxt_1:',
+            '107 : (     +,     a,     32,int_10)',
+            '108 : (     =,  NoOp,  int_10, f_tmp)',
+            'main:',
+            'Param -5',
+            'call f',
+            '109 : (     =,  NoOp,  f_tmp, f_tmp_0)',
+            '110 : (     =,  NoOp,  f_tmp_0,     b)',
+            '111 : (     +,     g,      b,int_12)',
+            '112 : (     =,  NoOp,  int_12,     g)',
+        ])
+        self.assertEqual((folder.folded, folder.jumps, folder.eliminated), (7, 1, 15))
+        # same globals, fewer instructions run
+        layouts = frame_layouts(tree)
+        runs = []
+        for instructions in (code, optimized):
+            interpreter = IRInterpreter(instructions, layouts)
+            interpreter.run('main')
+            runs.append((interpreter.globals, interpreter.steps))
+        self.assertEqual(runs[0][0], runs[1][0])
+        self.assertEqual(runs[1][0]['g'], 114 * 7 + 146)
+        self.assertLess(runs[1][1], runs[0][1])
+
+
+class CacheTestCase(unittest.TestCase):
+    def test_hit_and_miss(self):
+        import tempfile
+        from Lexer import Lexer
+        from Parser import Parser
+        from ParserVisualizer import ASTVisualizer
+        from ProgramCache import ProgramCache
+        text = open('testfile copy.txt').read() + '\nint x'
+        assertDot = ASTVisualizer(Parser(Lexer(text))).gendot()
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = ProgramCache(cache_dir)
+            for hit in (False, True):
+                result = cache.parse(text)
+                self.assertEqual(result.hit, hit)
+                self.assertEqual(ASTVisualizer(None).gendot(result.tree), assertDot)
+                self.assertEqual(
+                    [str(err) for err in result.parser_errors],
+                    ['ParserError: Unexpected token -> Token(TokenType.EOF, None, position=None:None)']
+                )
+            self.assertEqual(cache.stats()['hits'], 1)
+            self.assertEqual(cache.stats()['misses'], 1)
+
+            # a bound smaller than one entry evicts everything but nothing breaks
+            cache = ProgramCache(cache_dir, max_bytes=1)
+            cache.parse(text + ';')
+            self.assertEqual(cache.stats()['evictions'], 2)
+            self.assertFalse(cache.parse(text).hit)
+
+    def test_corrupt_entry(self):
+        import os
+        import pickle
+        import tempfile
+        import zlib
+        from ProgramCache import ProgramCache
+        text = open('testfile copy.txt').read()
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = ProgramCache(cache_dir)
+            assertTokenList = [str(token) for token in cache.parse(text).token_list]
+            path = cache._path(cache.key(text))
+            # garbage, a truncated entry, and pickles whose loading raises something else
+            for data in (
+                b'\x00garbage\xff' * 8,
+                open(path, 'rb').read()[:40],
+                zlib.compress(b'\x80\x04cno_such_module\nname\n.'),
+                zlib.compress(pickle.dumps((1, 2, 3))),
+                zlib.compress(b'cbuiltins\nint\n(](tR.'),
+            ):
+                with open(path, 'wb') as f:
+                    f.write(data)
+                self.assertIsNone(cache.load(text))
+                self.assertFalse(os.path.exists(path))
+                result = cache.parse(text)
+                self.assertFalse(result.hit)
+                self.assertEqual([str(token) for token in result.token_list], assertTokenList)
+                self.assertTrue(cache.parse(text).hit)
+
+
+class PipelineTestCase(unittest.TestCase):
+    def run_pipeline(self, text, passes, **options):
+        from IR import format_code
+        from Pipeline import Pipeline
+        result = Pipeline(passes, **options).run(text)
+        code = format_code(result.code or ())
+        exceptions = {name: type(exc) for name, exc in result.exceptions.items()}
+        return [str(err) for err in result.semantic_errors], result.dot, code, exceptions
+
+    def test_fused_matches_separate(self):
+        text = open('testfile copy.txt').read().replace('c=2;', 'c=2; if (a) { b = a + 1; } while (b) { b = b - 1; }')
+        fused = self.run_pipeline(text, ('semantic', 'dot', 'ir'))
+        self.assertEqual(fused, self.run_pipeline(text, ('semantic', 'dot', 'ir'), fused=False))
+        self.assertEqual(fused, self.run_pipeline(text, ('semantic', 'dot', 'ir'), profile=True))
+        self.assertEqual(fused[3], {})
+        self.assertIn('(    jz,     b,      -,nxt_8)', [line.split(' : ')[-1] for line in fused[2]])
+
+        # an undefined callee is a semantic error and stops IRGenerator, not ASTVisualizer
+        text = text.replace('c=2;', 'c=2; a=e(1);')
+        fused = self.run_pipeline(text, ('semantic', 'dot', 'ir'))
+        self.assertEqual(fused, self.run_pipeline(text, ('semantic', 'dot', 'ir'), fused=False))
+        self.assertEqual(fused[3], {'ir': UnboundLocalError})
+        self.assertTrue(any(err.startswith('SemanticError: Identifier not found') and "'e'" in err for err in fused[0]))
+        self.assertIn('ProcCall:e', fused[1])
+
+    def test_requires(self):
+        from Pipeline import Pipeline
+        self.assertEqual(Pipeline(('runtime', 'dot')).passes, ['semantic', 'dot', 'runtime'])
+        with self.assertRaises(ValueError):
+            Pipeline(('typecheck',))
+
+    def test_ir_batch(self):
+        from IntermediateCodeGenerator import generate_ir, generate_batch
+        base = open('testfile copy.txt').read()
+        sources = [
+            base,
+            base.replace('c=2;', 'c=2; while (a) { a = demo(a) - 1; }'),
+            # stops at the undefined callee
+            base.replace('c=2;', 'c=2; a=e(1);'),
+            open('testfile.txt').read(),
+        ] * 8
+
+        def outputs(generators):
+            return [(generator.listing(), type(generator.exception)) for generator in generators]
+        serial = outputs(generate_ir(source) for source in sources)
+        self.assertEqual(serial[0], serial[4])
+        self.assertIs(serial[2][1], UnboundLocalError)
+        self.assertEqual(outputs(generate_batch(sources, workers=8)), serial)
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file